@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { LayoutDashboard, List, Settings, Plus, Sparkles, RefreshCw, CheckSquare } from 'lucide-react';
 import { Dashboard } from './components/Dashboard';
 import { Ledger } from './components/Ledger';
@@ -7,11 +7,31 @@ import { TODO } from './components/TODO';
 import { TodoItem } from './types';
 import { Transaction, BudgetSettings, AppView, isValidYear } from './types';
 import { analyzeSpending } from './services/geminiService';
-import { fetchAllData, addData, deleteData, saveBudget, readBudget, fetchTodos, saveTodos } from './api';
+import { fetchAllData, addData, deleteData, saveBudget, readBudget, fetchTodos, saveTodos, syncTodos } from './api';
+
+// 计算 next 相对 base 的 TODO 增量：新增或修改的条目，以及被删除的 id
+const diffTodos = (base: TodoItem[], next: TodoItem[]) => {
+  const known = new Map(base.map(t => [t.id, JSON.stringify(t)]));
+  const changes = next.filter(t => known.get(t.id) !== JSON.stringify(t));
+  const current = new Set(next.map(t => t.id));
+  const removed = base.filter(t => !current.has(t.id)).map(t => t.id);
+  return { changes, removed };
+};
+
+// 将增量应用到另一份列表上：已有条目原地替换，新条目排在最前（与本地新增时的位置一致）
+const applyTodoDelta = (list: TodoItem[], changes: TodoItem[], removed: string[]) => {
+  const updated = new Map(changes.map(t => [t.id, t]));
+  const gone = new Set(removed);
+  const existing = new Set(list.map(t => t.id));
+  const added = changes.filter(t => !existing.has(t.id));
+  return [...added, ...list.filter(t => !gone.has(t.id)).map(t => updated.get(t.id) ?? t)];
+};
 
 const App: React.FC = () => {
   const [view, setView] = useState<AppView>(AppView.DASHBOARD);
   const [transactions, setTransactions] = useState<Transaction[]>([]);
+  // 账本数据每次刷新后递增，Dashboard 据此重新读取月度汇总
+  const [dataRevision, setDataRevision] = useState(0);
   const [budget, setBudgetState] = useState<BudgetSettings>({ 
     year: new Date().getFullYear(), 
     month: new Date().getMonth() + 1, 
@@ -31,6 +51,9 @@ const App: React.FC = () => {
   // TODO List
   const [todos, setTodos] = useState<TodoItem[]>([]);
   const [isTodoHydrated, setTodoHydrated] = useState(false);
+  // 最近一次与后端一致的 TODO 列表及其版本号，用于增量同步
+  const syncedTodosRef = useRef<TodoItem[]>([]);
+  const todoVersionRef = useRef<number | null>(null);
 
   // 从后端加载 TODO 数据
   useEffect(() => {
@@ -39,6 +62,8 @@ const App: React.FC = () => {
         const response = await fetchTodos();
         if (response?.status === "ok" && response.data) {
           setTodos(response.data as TodoItem[]);
+          syncedTodosRef.current = response.data as TodoItem[];
+          todoVersionRef.current = typeof response.version === "number" ? response.version : null;
         }
       } catch (error) {
         console.error("Failed to load todos from API:", error);
@@ -62,7 +87,45 @@ const App: React.FC = () => {
     
     const timeoutId = setTimeout(async () => {
       try {
-        await saveTodos(todos);
+        const { changes, removed } = diffTodos(syncedTodosRef.current, todos);
+        if (changes.length === 0 && removed.length === 0) return;
+
+        if (todoVersionRef.current === null) {
+          // 没有版本号（旧后端或加载失败）时只能全量覆盖
+          const response = await saveTodos(todos);
+          if (response?.status === "ok") {
+            syncedTodosRef.current = todos;
+            todoVersionRef.current = typeof response.version === "number" ? response.version : null;
+          }
+          return;
+        }
+
+        // 版本冲突（409）时重新读取后端列表，把本地增量变基到最新版本上重试
+        let version = todoVersionRef.current;
+        let server: TodoItem[] | null = null;
+        let response = await syncTodos(version, changes, removed);
+        for (let attempt = 0; response?.status !== "ok" && typeof response?.version === "number" && attempt < 3; attempt++) {
+          const latest = await fetchTodos();
+          if (latest?.status !== "ok" || typeof latest.version !== "number") break;
+          server = latest.data as TodoItem[];
+          version = latest.version;
+          response = await syncTodos(version, changes, removed);
+        }
+        if (response?.status !== "ok") return;
+
+        todoVersionRef.current = typeof response.version === "number" ? response.version : null;
+        if (server === null) {
+          syncedTodosRef.current = todos;
+          return;
+        }
+        const merged = applyTodoDelta(server, changes, removed);
+        syncedTodosRef.current = merged;
+        // 保留等待期间的本地修改，并入其他客户端的修改
+        setTodos(prev => {
+          if (prev === todos) return merged;
+          const pending = diffTodos(todos, prev);
+          return applyTodoDelta(merged, pending.changes, pending.removed);
+        });
       } catch (error) {
         console.error("Failed to save todos:", error);
       }
@@ -101,6 +164,7 @@ const App: React.FC = () => {
       const res = await fetchAllData();
       if (res.status === "ok") {
         setTransactions(res.data as Transaction[]);
+        setDataRevision(prev => prev + 1);
       }
     } catch (error) {
       console.error("Failed to fetch data:", error);
@@ -354,7 +418,7 @@ const App: React.FC = () => {
 
           {/* Views */}
           {view === AppView.DASHBOARD && (
-            <Dashboard transactions={transactions} budget={budget} />
+            <Dashboard budget={budget} revision={dataRevision} />
           )}
 
           {view === AppView.LEDGER && (
@@ -17,6 +17,24 @@ export const fetchAllData = async () => {
   return res.json();
 };
 
+/** 分页读取记录，cursor 为上一页返回的 next_cursor */
+export const fetchDataPage = async (limit: number, cursor: number = 0) => {
+  const res = await fetch(`${BASE_URL}/data?limit=${limit}&cursor=${cursor}`);
+  return res.json();
+};
+
+/** 按日期区间读取记录（含两端，to 可为 YYYY-MM 表示整月） */
+export const fetchDataRange = async (from: string, to: string) => {
+  const res = await fetch(`${BASE_URL}/data?from=${from}&to=${to}`);
+  return res.json();
+};
+
+/** 读取某月（YYYY-MM）的收支汇总 */
+export const fetchStats = async (month: string) => {
+  const res = await fetch(`${BASE_URL}/stats?month=${month}`);
+  return res.json();
+};
+
 /** 新增记录 */
 export const addData = async (data: ApiTransaction) => {
   const res = await fetch(`${BASE_URL}/receive`, {
@@ -27,6 +45,26 @@ export const addData = async (data: ApiTransaction) => {
   return res.json();
 };
 
+/** 批量新增记录 */
+export const addDataBatch = async (items: ApiTransaction[]) => {
+  const res = await fetch(`${BASE_URL}/receive/batch`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(items),
+  });
+  return res.json();
+};
+
+/** 导入 CSV（header: date,event,amount,type,remark,category） */
+export const importDataCsv = async (csvText: string) => {
+  const res = await fetch(`${BASE_URL}/receive/batch`, {
+    method: "POST",
+    headers: { "Content-Type": "text/csv" },
+    body: csvText,
+  });
+  return res.json();
+};
+
 /** 删除记录 */
 export const deleteData = async (id: string) => {
   const res = await fetch(`${BASE_URL}/data?id=${id}`, {
@@ -67,6 +105,20 @@ export const saveTodos = async (todos: import('./types').TodoItem[]) => {
   return res.json();
 };
 
+/** 增量同步 TODO：只发送基于 baseVersion 的修改与删除，版本过期时返回 409 */
+export const syncTodos = async (
+  baseVersion: number,
+  changes: import('./types').TodoItem[],
+  removed: string[],
+) => {
+  const res = await fetch(`${BASE_URL}/todo`, {
+    method: "PUT",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ baseVersion, changes, removed }),
+  });
+  return res.json();
+};
+
 /** 添加单个 TODO */
 export const addTodo = async (todo: import('./types').TodoItem) => {
   const res = await fetch(`${BASE_URL}/todo`, {
@@ -1,59 +1,60 @@
-import React, { useMemo } from 'react';
+import React, { useEffect, useMemo, useState } from 'react';
 import { 
   LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, 
   PieChart, Pie, Cell, Legend 
 } from 'recharts';
-import { Transaction, BudgetSettings } from '../types';
+import { BudgetSettings } from '../types';
 import { AlertTriangle, TrendingUp, TrendingDown, Wallet } from 'lucide-react';
+import { fetchStats } from '../api';
 
 interface DashboardProps {
-  transactions: Transaction[];
   budget: BudgetSettings;
+  // 账本数据每次刷新后递增，用于重新读取汇总
+  revision: number;
+}
+
+// /api/stats 返回的月度汇总
+interface MonthStats {
+  totalIncome: number;
+  totalExpense: number;
+  dailyExpense: { day: number; amount: number }[];
+  categoryExpense: { name: string; value: number }[];
 }
 
 const COLORS = ['#3b82f6', '#10b981', '#f59e0b', '#ef4444', '#8b5cf6', '#ec4899', '#6366f1'];
 
-export const Dashboard: React.FC<DashboardProps> = ({ transactions, budget }) => {
+export const Dashboard: React.FC<DashboardProps> = ({ budget, revision }) => {
   const currentDate = new Date();
   const currentMonthStr = currentDate.toISOString().slice(0, 7); // YYYY-MM
 
-  const stats = useMemo(() => {
-    const currentMonthTx = transactions.filter(t => t.date?.startsWith(currentMonthStr));
-    const totalIncome = currentMonthTx
-      .filter(t => t.type === 'income')
-      .reduce((sum, t) => sum + t.amount, 0);
-    const totalExpense = currentMonthTx
-      .filter(t => t.type === 'expense')
-      .reduce((sum, t) => sum + t.amount, 0);
-    
-    return { totalIncome, totalExpense, currentMonthTx };
-  }, [transactions, currentMonthStr]);
+  // 当月汇总由后端按月聚合，不需要下载整个账本
+  const [stats, setStats] = useState<MonthStats>({
+    totalIncome: 0, totalExpense: 0, dailyExpense: [], categoryExpense: []
+  });
+
+  useEffect(() => {
+    let cancelled = false;
+    const loadStats = async () => {
+      try {
+        const response = await fetchStats(currentMonthStr);
+        if (!cancelled && response?.status === "ok" && response.data) {
+          setStats(response.data as MonthStats);
+        }
+      } catch (error) {
+        console.error("Failed to load monthly stats:", error);
+      }
+    };
+    loadStats();
+    return () => { cancelled = true; };
+  }, [currentMonthStr, revision]);
 
   const chartData = useMemo(() => {
     // Daily Consumption Line Chart
-    const daysInMonth = new Date(currentDate.getFullYear(), currentDate.getMonth() + 1, 0).getDate();
-    const dailyData = Array.from({ length: daysInMonth }, (_, i) => {
-      const day = i + 1;
-      const dateStr = `${currentMonthStr}-${String(day).padStart(2, '0')}`;
-      const dailyExpense = stats.currentMonthTx
-        .filter(t => t.date === dateStr && t.type === 'expense')
-        .reduce((sum, t) => sum + t.amount, 0);
-      return { day: `Day ${day}`, amount: Number(dailyExpense.toFixed(2)) };
-    });
-
+    const dailyData = stats.dailyExpense.map(({ day, amount }) => ({ day: `Day ${day}`, amount }));
     // Category Pie Chart
-    const categoryMap = new Map<string, number>();
-    stats.currentMonthTx
-      .filter(t => t.type === 'expense')
-      .forEach(t => {
-        const current = categoryMap.get(t.category) || 0;
-        categoryMap.set(t.category, current + t.amount);
-      });
-    
-    const categoryData = Array.from(categoryMap.entries()).map(([name, value]) => ({ name, value: Number(value.toFixed(2)) }));
-
+    const categoryData = stats.categoryExpense;
     return { dailyData, categoryData };
-  }, [stats, currentMonthStr, currentDate]);
+  }, [stats]);
 
   const budgetAlert = budget.enabled && stats.totalExpense > budget.monthlyLimit;
   const budgetPercent = budget.enabled ? Math.min(100, (stats.totalExpense / budget.monthlyLimit) * 100) : 0;
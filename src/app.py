@@ -1,18 +1,55 @@
-from flask import Flask, jsonify, request
+import atexit
+import csv
+import hashlib
+import io
+import json
+import re
+from flask import Flask, Response, after_this_request, g, jsonify, request, stream_with_context
 from flask_cors import CORS
-from apps.account.storage import Storage
+from werkzeug.local import LocalProxy
+from apps.utils.config import LEDGER_POOL_SIZE, LEDGER_IDLE_SECONDS
+from apps.utils.pool import StorePool
+from apps.utils import metrics, profiling
 from apps.utils.data import dataItem, dataBudget, dataTodo
-from apps.account.budget import Budget
-from apps.Todo.storage import Storage as TodoStorage
 from apps.utils.utils import current_month
 app = Flask(__name__)
 CORS(app)
+if metrics.ENABLED:
+    metrics.instrument(app)
 
 
-storage = Storage("data.csv")
-budget = Budget("budget.json")
-todo_storage = TodoStorage("todo_data.csv")
+# 存储后端由 config.STORAGE_BACKEND（环境变量 FISCRA_STORAGE_BACKEND）选择。
+# 请求通过查询参数 ledger 或请求头 X-Fiscra-Ledger 指定账本，缺省为默认账本；
+# 各账本的存储实例由 StorePool 按需打开、按 LRU 淘汰
+LEDGER_HEADER = "X-Fiscra-Ledger"
+pool = StorePool(LEDGER_POOL_SIZE, LEDGER_IDLE_SECONDS)
+# 退出时关闭各账本（开启 FISCRA_WARM_SNAPSHOT 时保存预热快照）
+atexit.register(pool.close_all)
+
+
+def current_stores():
+    """本次请求所属账本的 (账本, 预算, TODO) 存储，首次访问时从池中取得"""
+    stores = g.get("stores")
+    if stores is None:
+        ledger = request.args.get("ledger") or request.headers.get(LEDGER_HEADER, "")
+        stores = pool.acquire(ledger)
+        g.ledger = ledger
+        g.stores = stores
+    return stores
+
+
+@app.teardown_request
+def release_stores(exc):
+    if g.pop("stores", None) is not None:
+        pool.release(g.pop("ledger"))
+
+
+storage = LocalProxy(lambda: current_stores()[0])
+budget = LocalProxy(lambda: current_stores()[1])
+todo_storage = LocalProxy(lambda: current_stores()[2])
 mode = "run"
+# 流式响应每次输出的最小字节数
+STREAM_CHUNK_SIZE = 64 * 1024
 def switch_mode(mode = "run"):
     if mode == "test":
         app.config["PROPAGATE_EXCEPTIONS"] = True
@@ -23,13 +60,15 @@ def switch_mode(mode = "run"):
     else:
         return -1
 
+# 按请求的性能分析：test 模式下允许通过请求头 X-Fiscra-Profile 触发
+profiling.instrument(app, allow_header=lambda: switch_mode(mode) == 0)
+
 @app.route("/api/receive", methods=["POST"])
 def receive():
     try:
         data = request.get_json()
         item = dataItem(**data)
-        storage.append_row([
-            int(storage.fetch_id() + 1),
+        storage.insert_row([
             item.date,
             item.event,
             item.amount,
@@ -47,20 +86,177 @@ def receive():
             return jsonify({"status": "error", "message": str(e)}), 400
 
 
+@app.route("/api/receive/batch", methods=["POST"])
+def receive_batch():
+    """
+    批量新增记录
+
+    请求体为 JSON 数组（或 {"items": [...]}），或 Content-Type 为 text/csv、
+    header 为 date,event,amount,type,remark,category 的 CSV 文本。
+    全部校验通过后分配连续 id，一次写入。
+    """
+    try:
+        if request.mimetype == "text/csv":
+            items = list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+        else:
+            items = request.get_json()
+            if isinstance(items, dict):
+                items = items.get("items")
+        if not isinstance(items, list):
+            return jsonify({"status": "error", "message": "Expected array of items"}), 400
+
+        values = []
+        for index, data in enumerate(items):
+            try:
+                item = dataItem(**data)
+            except Exception as e:
+                return jsonify({"status": "error", "message": f"item {index}: {e}"}), 400
+            values.append([item.date, item.event, item.amount, item.type, item.remark, item.category])
+
+        ids = storage.insert_rows(values)
+        return jsonify({
+            "status": "ok",
+            "count": len(ids),
+            "first_id": ids[0] if ids else None,
+            "last_id": ids[-1] if ids else None,
+        })
+    except Exception as e:
+        if switch_mode(mode) == 0:
+            print("ERROR in /api/receive/batch:", e)
+            raise
+        else:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+
+def check_etag(tag):
+    """
+    条件 GET：If-None-Match 命中时返回 304 响应（不读取存储）；
+    否则返回 None，并为本次请求的 200 响应附加 ETag。
+    非默认账本的 ETag 带账本 id 前缀，不同账本的版本号不会互相命中
+    """
+    if g.get("ledger"):
+        tag = f"{g.ledger}-{tag}"
+    if tag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(tag)
+        response.vary.add(LEDGER_HEADER)
+        return response
+
+    @after_this_request
+    def add_etag(response):
+        if response.status_code == 200:
+            response.set_etag(tag)
+            response.vary.add(LEDGER_HEADER)
+        return response
+    return None
+
+
+def query_tag(*names):
+    """
+    影响响应内容的请求参数的摘要，附加在 ETag 中
+
+    按参数名排序后编码，参数顺序不同的相同查询得到相同的摘要；未出现的参数不参与。
+    """
+    pairs = [f"{name}={value}" for name in sorted(names) for value in request.args.getlist(name)]
+    return hashlib.sha1("&".join(pairs).encode("utf-8")).hexdigest()[:16]
+
+
+def wants_stream():
+    """请求参数 stream=1 / true 时使用流式响应"""
+    return request.args.get("stream", "").lower() in ("1", "true")
+
+
+def stream_json(records, **extra):
+    """
+    以流的方式输出 {"status": "ok", ..., "data": [...]}
+
+    逐条序列化并按 STREAM_CHUNK_SIZE 分块发送，内存占用与记录数无关；
+    extra 中的字段输出在 data 之前。请求结束（teardown）早于输出完成，
+    输出期间另行持有所属账本，避免其存储被池淘汰。
+    """
+    ledger = g.get("ledger")
+
+    def generate():
+        if ledger is not None:
+            pool.acquire(ledger)
+        try:
+            head = json.dumps({"status": "ok", **extra})
+            yield head[:-1] + ', "data": ['
+            buffer = []
+            size = 0
+            separator = ""
+            for record in records:
+                chunk = separator + json.dumps(record)
+                separator = ","
+                buffer.append(chunk)
+                size += len(chunk)
+                if size >= STREAM_CHUNK_SIZE:
+                    yield "".join(buffer)
+                    buffer = []
+                    size = 0
+            buffer.append("]}")
+            yield "".join(buffer)
+        finally:
+            if ledger is not None:
+                pool.release(ledger)
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+def ledger_record(header, row):
+    """将账本 CSV 行转换为前端使用的字典"""
+    return {
+        **dict(zip(header, row)),
+        "id": int(row[0]),
+        "amount": float(row[3]) if row[3] else 0.0,
+    }
+
+
 @app.route("/api/data", methods=["GET"])
 def get_data():
+    """
+    获取账本记录
+
+    可选参数 limit / cursor：按 id 升序分页读取，cursor 为上一页最后一行的 id（首页为 0），
+    响应中的 next_cursor 为 null 表示没有更多数据。
+    可选参数 stream=1：流式输出全部记录。
+    可选参数 from / to：按日期区间（含两端，to 按前缀匹配）读取，结果按日期升序。
+    """
     try:
+        # ETag 区分查询方式与参数，不同的区间、分页或输出方式不会互相命中
+        if "from" in request.args or "to" in request.args:
+            variant = f"range-{query_tag('from', 'to')}"
+        elif "limit" in request.args or "cursor" in request.args:
+            limit = int(request.args.get("limit", 100))
+            cursor = int(request.args.get("cursor", 0))
+            if not 0 < limit <= 1000:
+                return jsonify({"status": "error", "message": "limit must be between 1 and 1000"}), 400
+            variant = f"page-{limit}-{cursor}"
+        else:
+            variant = "stream" if wants_stream() else "all"
+        not_modified = check_etag(f"data-{storage.version()}-{variant}")
+        if not_modified is not None:
+            return not_modified
+
+        if "from" in request.args or "to" in request.args:
+            rows = storage.read_range(request.args.get("from"), request.args.get("to"))
+            header, data_rows = rows[0], rows[1:]
+            result = [ledger_record(header, row) for row in data_rows]
+            return jsonify({"status": "ok", "data": result})
+
+        if "limit" in request.args or "cursor" in request.args:
+            rows, next_cursor = storage.read_page(cursor, limit)
+            header, data_rows = rows[0], rows[1:]
+            result = [ledger_record(header, row) for row in data_rows]
+            return jsonify({"status": "ok", "data": result, "next_cursor": next_cursor})
+
+        if wants_stream():
+            header = storage.read_header()
+            return stream_json(ledger_record(header, row) for row in storage.iter_rows())
+
         rows = storage.read_all()
         header, data_rows = rows[0], rows[1:]
 
-        result = [
-            {
-                **dict(zip(header, row)),
-                "id": int(row[0]),
-                "amount": float(row[3]) if row[3] else 0.0,
-            }
-            for row in data_rows
-        ]
+        result = [ledger_record(header, row) for row in data_rows]
 
         return jsonify({"status": "ok", "data": result})
     except Exception as e:
@@ -86,6 +282,74 @@ def delete_data():
             print("ERROR in /api/data DELETE:", e)
             raise
         return jsonify({"status": "error", "message": str(e)}), 400
+
+
+@app.route("/api/stats", methods=["GET"])
+def get_stats():
+    """按月汇总：month=YYYY-MM，缺省为当月"""
+    try:
+        month = request.args.get("month")
+        if month is None:
+            year, mon = current_month()
+            month = f"{year:04d}-{mon:02d}"
+        if not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", month):
+            return jsonify({"status": "error", "message": "month must be YYYY-MM"}), 400
+        # 按解析后的月份打标签：缺省 month 时跨月后不会命中上个月的 ETag
+        not_modified = check_etag(f"stats-{storage.version()}-{month}")
+        if not_modified is not None:
+            return not_modified
+
+        return jsonify({"status": "ok", "data": storage.month_stats(month)})
+    except Exception as e:
+        if switch_mode(mode) == 0:
+            print("ERROR in /api/stats:", e)
+            raise
+        else:
+            return jsonify({"status": "error", "message": str(e)}), 400
+@app.route("/api/analytics", methods=["GET"])
+def get_analytics():
+    """
+    列式账本上的汇总查询
+
+    参数：from / to（YYYY、YYYY-MM 或 YYYY-MM-DD，to 包含整个时段）、type、category 过滤，
+    group_by 取 category / type / month / date。
+    收入与支出分别求和（income / expense），不相互抵消。
+    """
+    try:
+        tag = query_tag("from", "to", "type", "category", "group_by")
+        not_modified = check_etag(f"analytics-{storage.version()}-{tag}")
+        if not_modified is not None:
+            return not_modified
+
+        filters = {
+            "start": request.args.get("from"),
+            "end": request.args.get("to"),
+            "type": request.args.get("type"),
+            "category": request.args.get("category"),
+        }
+        frame = storage.frame()
+        totals = frame.totals(**filters)
+        result = {
+            "income": round(totals["income"], 2),
+            "expense": round(totals["expense"], 2),
+            "count": frame.count(**filters),
+        }
+        group_by = request.args.get("group_by")
+        if group_by:
+            groups = frame.group_totals(group_by, **filters)
+            result["groups"] = [
+                {"name": name, "income": round(sums["income"], 2), "expense": round(sums["expense"], 2)}
+                for name, sums in groups.items()
+            ]
+        return jsonify({"status": "ok", "data": result})
+    except Exception as e:
+        if switch_mode(mode) == 0:
+            print("ERROR in /api/analytics:", e)
+            raise
+        else:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+
 @app.route("/api/budget", methods=["PUT"])
 def set_budget():
     try:
@@ -103,6 +367,10 @@ def set_budget():
 def read_budget():
     try:
         year, month = current_month()
+        not_modified = check_etag(f"budget-{budget.version()}-{year}-{month}")
+        if not_modified is not None:
+            return not_modified
+
         monthly_limit = budget.read_budget(year, month)
         result = {
             "year": year,
@@ -119,28 +387,56 @@ def read_budget():
             return jsonify({"status": "error", "message": str(e)}), 400
         
 
+def todo_record(row):
+    """将 TODO CSV 行转换为前端使用的字典"""
+    return {
+        "id": row[1],  # uuid 作为前端 id
+        "title": row[2],
+        "description": row[3] if row[3] else "",
+        "completed": row[4].lower() == "true",
+        "priority": row[5],
+        "dueDate": row[6] if row[6] else "",
+        "category": row[7],
+        "createdAt": row[8],
+    }
+
+
+def todo_values(item):
+    """将前端 TODO 字典转换为存储行（不含 id 列）"""
+    return [
+        item.get("id", ""),
+        item.get("title", ""),
+        item.get("description", ""),
+        str(item.get("completed", False)),
+        item.get("priority", "medium"),
+        item.get("dueDate", ""),
+        item.get("category", "Personal"),
+        item.get("createdAt", ""),
+    ]
+
+
 @app.route("/api/todo", methods=["GET"])
 def get_todo():
-    """获取所有 TODO 项"""
+    """获取所有 TODO 项及数据版本号（stream=1 时流式输出）"""
     try:
-        rows = todo_storage.read_all()
+        not_modified = check_etag(f"todo-{todo_storage.version()}-{'stream' if wants_stream() else 'all'}")
+        if not_modified is not None:
+            return not_modified
+
+        if wants_stream():
+            # 先读版本号：版本只会比数据旧，增量同步时最多被误判为冲突
+            version = todo_storage.version()
+            return stream_json(
+                (todo_record(row) for row in todo_storage.iter_rows() if len(row) >= 9),
+                version=version,
+            )
+
+        version, rows = todo_storage.read_versioned()
         header, data_rows = rows[0], rows[1:]
 
-        result = [
-            {
-                "id": row[1],  # uuid 作为前端 id
-                "title": row[2],
-                "description": row[3] if row[3] else "",
-                "completed": row[4].lower() == "true",
-                "priority": row[5],
-                "dueDate": row[6] if row[6] else "",
-                "category": row[7],
-                "createdAt": row[8],
-            }
-            for row in data_rows if len(row) >= 9
-        ]
+        result = [todo_record(row) for row in data_rows if len(row) >= 9]
 
-        return jsonify({"status": "ok", "data": result})
+        return jsonify({"status": "ok", "version": version, "data": result})
     except Exception as e:
         if switch_mode(mode) == 0:
             print("ERROR in /api/todo GET:", e)
@@ -165,8 +461,7 @@ def add_todo():
             createdAt=data.get("createdAt", ""),
         )
         
-        todo_storage.append_row([
-            int(todo_storage.fetch_id() + 1),
+        todo_storage.insert_row([
             todo_item.uuid,
             todo_item.title,
             todo_item.description,
@@ -188,9 +483,29 @@ def add_todo():
 
 @app.route("/api/todo", methods=["PUT"])
 def save_all_todos():
-    """保存所有 TODO（覆盖写入）"""
+    """
+    保存 TODO
+
+    请求体为数组时覆盖写入全部 TODO；
+    为 {"baseVersion": n, "changes": [...], "removed": [uuid, ...]} 时增量同步，
+    baseVersion 与服务端版本不一致返回 409 及当前版本号。
+    """
     try:
         data = request.get_json()
+        if isinstance(data, dict):
+            changes = data.get("changes", [])
+            removed = data.get("removed", [])
+            if not isinstance(changes, list) or not isinstance(removed, list) or "baseVersion" not in data:
+                return jsonify({"status": "error", "message": "Expected baseVersion, changes and removed"}), 400
+            ok, version = todo_storage.apply_changes(
+                int(data["baseVersion"]),
+                [todo_values(item) for item in changes],
+                [str(uuid) for uuid in removed],
+            )
+            if not ok:
+                return jsonify({"status": "error", "message": "version conflict", "version": version}), 409
+            return jsonify({"status": "ok", "version": version, "count": len(changes) + len(removed)})
+
         if not isinstance(data, list):
             return jsonify({"status": "error", "message": "Expected array of todos"}), 400
         
@@ -199,21 +514,11 @@ def save_all_todos():
         rows = [header]
         
         for idx, item in enumerate(data, start=1):
-            rows.append([
-                idx,
-                item.get("id", ""),
-                item.get("title", ""),
-                item.get("description", ""),
-                str(item.get("completed", False)),
-                item.get("priority", "medium"),
-                item.get("dueDate", ""),
-                item.get("category", "Personal"),
-                item.get("createdAt", ""),
-            ])
+            rows.append([idx, *todo_values(item)])
         
         todo_storage.write_all(rows)
         
-        return jsonify({"status": "ok", "count": len(data)})
+        return jsonify({"status": "ok", "count": len(data), "version": todo_storage.version()})
     except Exception as e:
         if switch_mode(mode) == 0:
             print("ERROR in /api/todo PUT:", e)
@@ -231,10 +536,7 @@ def delete_todo():
             return jsonify({"status": "error", "message": "missing id"}), 400
 
         # 根据 uuid 删除
-        rows = todo_storage.read_all()
-        header, data_rows = rows[0], rows[1:]
-        new_rows = [header] + [row for row in data_rows if len(row) > 1 and row[1] != id_value]
-        todo_storage.write_all(new_rows)
+        todo_storage.delete_by_uuid(id_value)
 
         return jsonify({"status": "ok", "deleted": id_value})
     except Exception as e:
@@ -256,36 +558,19 @@ def update_todo():
         if not updates:
             return jsonify({"status": "error", "message": "missing update data"}), 400
         
-        rows = todo_storage.read_all()
-        header, data_rows = rows[0], rows[1:]
-        
-        # 字段索引映射
-        field_map = {
-            "title": 2,
-            "description": 3,
-            "completed": 4,
-            "priority": 5,
-            "dueDate": 6,
-            "category": 7,
-        }
-        
-        updated = False
-        for row in data_rows:
-            if len(row) > 1 and row[1] == id_value:
-                for field, idx in field_map.items():
-                    if field in updates:
-                        value = updates[field]
-                        if field == "completed":
-                            value = str(value)
-                        row[idx] = value
-                updated = True
-                break
-        
-        if not updated:
+        # 允许更新的字段
+        editable = ("title", "description", "completed", "priority", "dueDate", "category")
+        fields = {}
+        for field in editable:
+            if field in updates:
+                value = updates[field]
+                if field == "completed":
+                    value = str(value)
+                fields[field] = value
+
+        if not todo_storage.update_by_uuid(id_value, fields):
             return jsonify({"status": "error", "message": "todo not found"}), 404
         
-        todo_storage.write_all([header] + data_rows)
-        
         return jsonify({"status": "ok", "updated": id_value})
     except Exception as e:
         if switch_mode(mode) == 0:
@@ -294,6 +579,47 @@ def update_todo():
         return jsonify({"status": "error", "message": str(e)}), 400
 
 
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus 文本格式的指标（FISCRA_METRICS=1 时收集）"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/profiles", methods=["GET"])
+def get_profiles():
+    """已保存的性能分析结果（新的在前）"""
+    return jsonify({"status": "ok", "data": profiling.list_profiles()})
+
+
+@app.route("/api/profiles/<name>", methods=["GET"])
+def get_profile(name):
+    """
+    某次请求的性能分析报告
+    参数 sort（默认 cumulative）、limit（默认 50）；format=raw 时返回 pstats 文件
+    """
+    try:
+        if request.args.get("format") == "raw":
+            path = profiling.profile_path(name)
+            if path is None:
+                return jsonify({"status": "error", "message": "profile not found"}), 404
+            with open(path, "rb") as f:
+                content = f.read()
+            return Response(content, mimetype="application/octet-stream",
+                            headers={"Content-Disposition": f"attachment; filename={name}.prof"})
+        text = profiling.report(
+            name,
+            sort=request.args.get("sort", "cumulative"),
+            limit=int(request.args.get("limit", 50)),
+        )
+        if text is None:
+            return jsonify({"status": "error", "message": "profile not found"}), 404
+        return Response(text, mimetype="text/plain")
+    except Exception as e:
+        if switch_mode(mode) == 0:
+            print("ERROR in /api/profiles GET:", e)
+            raise
+        return jsonify({"status": "error", "message": str(e)}), 400
+
     
 if __name__ == "__main__":
     app.run(host="localhost", port=5000)
@@ -0,0 +1,191 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from apps.utils.config import SQLITE_PATH
+except ImportError:
+    from ..utils.config import SQLITE_PATH
+
+try:
+    from apps.utils.backend import TodoStore
+except ImportError:
+    from ..utils.backend import TodoStore
+
+try:
+    from apps.utils.sqlite import Database, as_text, split_ids
+except ImportError:
+    from ..utils.sqlite import Database, as_text, split_ids
+
+HEADER = ["id", "uuid", "title", "description", "completed", "priority", "dueDate", "category", "createdAt"]
+
+SELECT_ROWS = "SELECT id, uuid, title, description, completed, priority, dueDate, category, createdAt FROM todo"
+# uuid 重复时后写入的行覆盖先写入的行，与 CSV 追加日志的语义一致
+INSERT_ROW = (
+    "INSERT OR REPLACE INTO todo (id, uuid, title, description, completed, priority, dueDate, category, createdAt) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+UPDATE_ROW = (
+    "UPDATE todo SET title = ?, description = ?, completed = ?, priority = ?, dueDate = ?, "
+    "category = ?, createdAt = ? WHERE id = ?"
+)
+
+
+def _params(row: List[Any]) -> List[Any]:
+    """待写入的行转换为语句参数：缺少 uuid 的行存为 NULL，不参与唯一约束"""
+    row = as_text(row)
+    row[1] = row[1] or None
+    return row
+
+
+class SQLiteStorage(TodoStore):
+    """
+    TODO 的 SQLite 存储（todo 表）
+
+    uuid 建有唯一索引，更新与删除都是按 uuid 的单行操作；
+    版本号与数据在同一事务中修改，apply_changes 的版本检查不会与写入交错。
+    """
+
+    def __init__(self, db: Optional[Database] = None):
+        self.db = db if db is not None else Database(SQLITE_PATH)
+
+    @staticmethod
+    def _select_uuid(conn, uuid: str) -> Optional[List[str]]:
+        row = conn.execute(SELECT_ROWS + " WHERE uuid = ?", (uuid,)).fetchone()
+        return as_text(row) if row is not None else None
+
+    @staticmethod
+    def _update_locked(conn, row: List[Any]):
+        """按 id 写回一行（需在写事务内调用）"""
+        values = as_text(row)
+        conn.execute(UPDATE_ROW, (*values[2:], int(values[0])))
+
+    @staticmethod
+    def _insert_locked(conn, rows: List[List[Any]]):
+        """写入含 id 列的行（需在写事务内调用）"""
+        keep, reassign = split_ids(rows, len(HEADER))
+        conn.executemany(INSERT_ROW, [_params(row) for row in keep])
+        conn.executemany(INSERT_ROW, [[None, *_params(row)[1:]] for row in reassign])
+
+    def version(self) -> int:
+        return Database.version(self.db.conn, "todo")
+
+    def read_all(self) -> List[List[str]]:
+        rows = self.db.conn.execute(SELECT_ROWS + " ORDER BY id").fetchall()
+        return [list(HEADER)] + [as_text(row) for row in rows]
+
+    def read_versioned(self) -> Tuple[int, List[List[str]]]:
+        """在同一个读事务内读取版本号与所有行（包括header）"""
+        with self.db.snapshot() as conn:
+            version = Database.version(conn, "todo")
+            rows = conn.execute(SELECT_ROWS + " ORDER BY id").fetchall()
+        return version, [list(HEADER)] + [as_text(row) for row in rows]
+
+    def iter_rows(self) -> Iterator[List[str]]:
+        for row in self.db.iter_query(SELECT_ROWS + " ORDER BY id"):
+            yield as_text(row)
+
+    def get_by_uuid(self, uuid: str) -> Optional[List[str]]:
+        return self._select_uuid(self.db.conn, uuid)
+
+    def append_row(self, row: List[Any]):
+        with self.db.transaction() as conn:
+            self._insert_locked(conn, [row])
+            Database.bump(conn, "todo")
+
+    def insert_row(self, values: List[Any]) -> int:
+        with self.db.transaction() as conn:
+            new_id = Database.last_id(conn, "todo") + 1
+            self._insert_locked(conn, [[new_id, *values]])
+            Database.bump(conn, "todo")
+            return new_id
+
+    def update_by_uuid(self, uuid: str, fields: Dict[str, Any]) -> bool:
+        """
+        更新 uuid 对应行的若干字段
+
+        Args:
+            uuid: 目标 uuid
+            fields: {列名: 新值}
+
+        Returns:
+            是否找到该 uuid
+        """
+        with self.db.transaction() as conn:
+            row = self._select_uuid(conn, uuid)
+            if row is None:
+                return False
+            new_row = list(row)
+            for name, value in fields.items():
+                new_row[HEADER.index(name)] = value
+            if as_text(new_row) != row:
+                self._update_locked(conn, new_row)
+                Database.bump(conn, "todo")
+            return True
+
+    def delete_by_uuid(self, uuid: str) -> bool:
+        with self.db.transaction() as conn:
+            if not conn.execute("DELETE FROM todo WHERE uuid = ?", (uuid,)).rowcount:
+                return False
+            Database.bump(conn, "todo")
+            return True
+
+    def apply_changes(self, base_version: int, changes: List[List[Any]],
+                      removed: List[str]) -> Tuple[bool, int]:
+        """
+        增量同步：基于 base_version 应用新增 / 修改与删除
+
+        Args:
+            base_version: 客户端所基于的版本号
+            changes: 新增或修改的行（不含 id 列，以 uuid 开头）
+            removed: 删除的 uuid
+
+        Returns:
+            (是否应用成功, 当前版本号)；base_version 过期时不做任何修改
+        """
+        with self.db.transaction() as conn:
+            current = Database.version(conn, "todo")
+            if base_version != current:
+                return False, current
+            last_id = Database.last_id(conn, "todo")
+            changed = False
+            for values in changes:
+                existing = self._select_uuid(conn, str(values[0]))
+                if existing is not None:
+                    row = [existing[0], *values]
+                    if as_text(row) != existing:
+                        self._update_locked(conn, row)
+                        changed = True
+                else:
+                    last_id += 1
+                    self._insert_locked(conn, [[last_id, *values]])
+                    changed = True
+            for uuid in removed:
+                if conn.execute("DELETE FROM todo WHERE uuid = ?", (uuid,)).rowcount:
+                    changed = True
+            if not changed:
+                return True, current
+            return True, Database.bump(conn, "todo")
+
+    def write_all(self, rows: List[List[Any]]):
+        """覆盖写入（header 固定为 HEADER，rows[0] 被忽略）"""
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM todo")
+            Database.reset_sequence(conn, "todo")
+            self._insert_locked(conn, rows[1:])
+            Database.bump(conn, "todo")
+
+    def delete_by_id(self, id_value: str):
+        """删除匹配 id 的行"""
+        try:
+            id_int = int(id_value)
+        except ValueError:
+            return
+        with self.db.transaction() as conn:
+            if conn.execute("DELETE FROM todo WHERE id = ?", (id_int,)).rowcount:
+                Database.bump(conn, "todo")
+
+    def fetch_id(self) -> int:
+        """获取已分配过的最大 ID 值"""
+        return Database.last_id(self.db.conn, "todo")
+
+    def close(self):
+        self.db.close()
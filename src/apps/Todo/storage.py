@@ -1,6 +1,7 @@
 import csv
 import os
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from pathlib import Path
 try:
     from apps.utils.config import STORAGE_DIR
@@ -11,7 +12,38 @@ try:
     from apps.utils.lock import FileLock
 except:
     from ..utils.lock import FileLock
-class Storage:
+
+try:
+    from apps.utils.utils import max_int_id
+except ImportError:
+    from ..utils.utils import max_int_id
+
+try:
+    from apps.utils.version import VersionCounter
+except ImportError:
+    from ..utils.version import VersionCounter
+
+try:
+    from apps.utils import metrics
+except ImportError:
+    from ..utils import metrics
+
+try:
+    from apps.utils.backend import TodoStore
+except ImportError:
+    from ..utils.backend import TodoStore
+class Storage(TodoStore):
+    """
+    TODO 的 CSV 存储
+
+    文件是一份追加日志：同一 uuid 的后一行覆盖前一行（更新），
+    id 列为 "-<id>" 的行是墓碑（删除）。读取时按 uuid 合并，
+    死行比例超过 COMPACT_RATIO 时在写入的同一临界区内压缩。
+    """
+    # 死行（被覆盖 / 删除的行 + 墓碑行）占比超过该值时压缩
+    COMPACT_RATIO = 0.3
+    # 死行数量下限，避免小文件频繁重写
+    COMPACT_MIN_DEAD = 64
     
     def ensure_csv(self):
         """确保 CSV 文件存在，如果不存在则创建"""
@@ -27,71 +59,299 @@ class Storage:
         return wrapper
     def __init__(self, file_name="todo_data.csv"):
         self.path = STORAGE_DIR / file_name
+        self.path.parent.mkdir(parents=True, exist_ok=True)
         lockfile_path = str(self.path) + '.lock'
         self._file_lock = FileLock(lockfile_path, timeout=5.0)
+        self._mem_lock = threading.RLock()
+        # 数据版本号（todo_data.csv.ver），每次变更加一，用于增量同步
+        self._version = VersionCounter(str(self.path) + '.ver')
+        # uuid -> 最新行 的索引，以文件的 (mtime, size, inode) 作为版本标识
+        self._header: List[str] = []
+        self._records: Optional[Dict[str, List[str]]] = None
+        self._signature: Optional[Tuple[int, int, int, int]] = None
+        self._physical = 0  # 文件中的数据行数（含被覆盖的行与墓碑）
+        self._max_id = 0    # 文件中出现过的最大 id（含被覆盖的行与墓碑）
+        # id 序列：随索引从整个文件恢复，分配与追加在同一临界区内完成
+        self._last_id: Optional[int] = None
+        self._id_signature: Optional[Tuple[int, int, int, int]] = None
         self.ensure_csv()
+
+    def _file_signature(self) -> Tuple[int, int, int, int]:
+        """当前文件版本 (mtime, size, inode, 版本号)：任一进程修改文件都会改变该值"""
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino, self._version.get())
+
+    @staticmethod
+    def _as_text(row: List[Any]) -> List[str]:
+        """将待写入的行转换为 csv.reader 读回时的形式"""
+        return ["" if value is None else str(value) for value in row]
+
+    @staticmethod
+    def is_tombstone(row: List[str]) -> bool:
+        """墓碑行：id 列以 "-" 开头，表示删除该 uuid"""
+        return bool(row) and row[0].startswith("-")
+
+    def _key(self, row: List[str]) -> str:
+        # 缺少 uuid 的旧数据按行号区分，避免互相覆盖
+        if len(row) > 1 and row[1]:
+            return row[1]
+        return f"#{self._physical}"
+
+    def _apply(self, row: List[str]):
+        """将一行（新增 / 更新 / 墓碑）应用到索引"""
+        if not row:
+            return
+        self._physical += 1
+        self._max_id = max(self._max_id, max_int_id([row]))
+        key = self._key(row)
+        if self.is_tombstone(row):
+            self._records.pop(key, None)
+        else:
+            # 已存在的 uuid 原位替换，保持首次出现的顺序
+            self._records[key] = row
+
+    def _rebuild(self, header: List[str], rows: Iterable[List[str]]):
+        self._header = header
+        self._records = {}
+        self._physical = 0
+        self._max_id = 0
+        for row in rows:
+            self._apply(row)
+
+    def _load(self) -> Dict[str, List[str]]:
+        """读取 uuid 索引（需在锁内调用），文件未变化时直接命中缓存"""
+        with self._mem_lock:
+            signature = self._file_signature()
+            if self._records is None or self._signature != signature:
+                metrics.cache_lookup("todo", False)
+                with open(self.path, "r", encoding="utf-8") as f:
+                    reader = csv.reader(f)
+                    self._rebuild(next(reader, []), reader)
+                self._signature = signature
+                metrics.rows_parsed("todo", self._physical)
+            else:
+                metrics.cache_lookup("todo", True)
+            return self._records
+
+    def _current_id(self) -> int:
+        """
+        当前最大 id（需在锁内调用），文件被其他进程修改后重新恢复
+
+        更新以保留原 id 的新版本行追加，文件末尾的 id 不一定最大，因此取
+        uuid 索引解析整个文件时记录的最大 id。
+        """
+        with self._mem_lock:
+            signature = self._file_signature()
+            if self._last_id is not None and self._id_signature == signature:
+                return self._last_id
+            self._load()
+            last_id = self._max_id
+            if self._last_id is not None and self._id_signature is not None \
+                    and self._id_signature[2] == signature[2]:
+                # 同一文件上的追加不会让 id 回退
+                last_id = max(last_id, self._last_id)
+            self._last_id = last_id
+            self._id_signature = self._signature
+            return last_id
+
+    def _append_locked(self, rows: List[List[Any]]):
+        """追加若干行并同步索引与 id 序列（需在锁内调用）"""
+        signature = self._file_signature()
+        cached = self._records is not None and self._signature == signature
+        sequenced = self._last_id is not None and self._id_signature == signature
+        text_rows = [self._as_text(row) for row in rows]
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerows(text_rows)
+        self._version.bump()
+        signature = self._file_signature()
+        if cached:
+            for row in text_rows:
+                self._apply(row)
+            self._signature = signature
+        else:
+            self._records = None
+        if sequenced:
+            self._last_id = max(self._last_id, max_int_id(text_rows))
+            self._id_signature = signature
+        if cached and self._needs_compaction():
+            self._rewrite_locked([self._header] + list(self._records.values()))
+
+    def _needs_compaction(self) -> bool:
+        dead = self._physical - len(self._records)
+        return dead >= self.COMPACT_MIN_DEAD and dead > self._physical * self.COMPACT_RATIO
+
     @check_csv
     def read_all(self) -> List[List[str]]:
-        """读取所有行（包括header）"""
-        with self._file_lock.acquire():
-            with open(self.path, "r", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                return list(reader)
+        """读取所有行（包括header），同一 uuid 只保留最新版本"""
+        with self._file_lock.acquire(shared=True):
+            records = self._load()
+            return [list(self._header)] + [list(row) for row in records.values()]
+    @check_csv
+    def version(self) -> int:
+        """当前数据版本号"""
+        with self._file_lock.acquire(shared=True):
+            return self._version.get()
+
+    @check_csv
+    def read_versioned(self) -> Tuple[int, List[List[str]]]:
+        """在同一把锁内读取版本号与所有行（包括header）"""
+        with self._file_lock.acquire(shared=True):
+            records = self._load()
+            rows = [list(self._header)] + [list(row) for row in records.values()]
+            return self._version.get(), rows
+
+    @check_csv
+    def iter_rows(self) -> Iterator[List[str]]:
+        """
+        逐行产出数据行（不含 header）
+
+        只在取快照时持锁；快照仅包含对已缓存行的引用，
+        序列化由调用方逐行完成。
+        """
+        with self._file_lock.acquire(shared=True):
+            rows = list(self._load().values())
+        for row in rows:
+            yield list(row)
+
+    @check_csv
+    def get_by_uuid(self, uuid: str) -> Optional[List[str]]:
+        """按 uuid 读取一行"""
+        with self._file_lock.acquire(shared=True):
+            row = self._load().get(uuid)
+            return list(row) if row is not None else None
+
+    def _rewrite_locked(self, rows: List[List[Any]]):
+        """通过临时文件 + os.replace 原子地重写整个文件（需在锁内调用）"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        text_rows = [self._as_text(row) for row in rows]
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerows(text_rows)
+        os.replace(tmp_path, self.path)
+        self._version.bump()
+        with self._mem_lock:
+            self._rebuild(text_rows[0], text_rows[1:])
+            self._signature = self._file_signature()
+        if self._last_id is not None:
+            # 重写不会让 id 序列回退
+            self._last_id = max(self._last_id, max_int_id(text_rows[1:]))
+            self._id_signature = self._signature
+
     @check_csv
     def append_row(self, row: List[Any]):
         """追加一行"""
-        with open(self.path, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(row)
+        with self._file_lock.acquire():
+            self._append_locked([row])
+
+    @check_csv
+    def insert_row(self, values: List[Any]) -> int:
+        """分配新 id 并追加一行（不含 id 列），返回分配的 id"""
+        with self._file_lock.acquire():
+            new_id = self._current_id() + 1
+            self._append_locked([[new_id, *values]])
+            return new_id
+
+    @check_csv
+    def update_by_uuid(self, uuid: str, fields: Dict[str, Any]) -> bool:
+        """
+        更新 uuid 对应行的若干字段：只追加一条新版本，不重写文件
+
+        Args:
+            uuid: 目标 uuid
+            fields: {列名: 新值}
+
+        Returns:
+            是否找到该 uuid
+        """
+        with self._file_lock.acquire():
+            row = self._load().get(uuid)
+            if row is None:
+                return False
+            new_row = list(row)
+            for name, value in fields.items():
+                new_row[self._header.index(name)] = value
+            if self._as_text(new_row) != row:
+                self._append_locked([new_row])
+            return True
+
+    @check_csv
+    def delete_by_uuid(self, uuid: str) -> bool:
+        """删除 uuid 对应的行：只追加一条墓碑，不重写文件"""
+        with self._file_lock.acquire():
+            row = self._load().get(uuid)
+            if row is None:
+                return False
+            tombstone = ["-" + row[0], uuid] + [""] * (len(self._header) - 2)
+            self._append_locked([tombstone])
+            return True
     
+    @check_csv
+    def apply_changes(self, base_version: int, changes: List[List[Any]],
+                      removed: List[str]) -> Tuple[bool, int]:
+        """
+        增量同步：基于 base_version 应用新增 / 修改与删除
+
+        Args:
+            base_version: 客户端所基于的版本号
+            changes: 新增或修改的行（不含 id 列，以 uuid 开头）
+            removed: 删除的 uuid
+
+        Returns:
+            (是否应用成功, 当前版本号)；base_version 过期时不做任何修改
+        """
+        with self._file_lock.acquire():
+            current = self._version.get()
+            if base_version != current:
+                return False, current
+            records = self._load()
+            last_id = self._current_id()
+            rows = []
+            for values in changes:
+                existing = records.get(values[0])
+                if existing is not None:
+                    row = [existing[0], *values]
+                    if self._as_text(row) == existing:
+                        continue
+                else:
+                    last_id += 1
+                    row = [last_id, *values]
+                rows.append(row)
+            for uuid in removed:
+                existing = records.get(uuid)
+                if existing is not None:
+                    rows.append(["-" + existing[0], uuid] + [""] * (len(self._header) - 2))
+            if not rows:
+                return True, current
+            self._append_locked(rows)
+            return True, self._version.get()
+
     @check_csv
     def write_all(self, rows: List[List[Any]]):
         """覆盖写入"""
         with self._file_lock.acquire():
-            with open(self.path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerows(rows)
+            self._rewrite_locked(rows)
+            self._last_id = max_int_id(self._as_text(row) for row in rows[1:])
+            self._id_signature = self._signature
 
     @check_csv
     def delete_by_id(self, id_value: str):
         """删除匹配 id 的行"""
         with self._file_lock.acquire():
             # 在锁内直接读取，避免嵌套锁
-            with open(self.path, "r", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-            
-            header, data = rows[0], rows[1:]
-            new_rows = [header] + [row for row in data if row[0] != id_value]
+            records = self._load()
+            new_rows = [self._header] + [row for row in records.values() if row[0] != id_value]
             
             # 在同一锁内写回
-            with open(self.path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerows(new_rows)
+            self._rewrite_locked(new_rows)
 
     @check_csv
     def fetch_id(self):
         """获取当前最大的 ID 值"""
-        with self._file_lock.acquire():
-            # 在锁内直接读取，确保并发安全
-            with open(self.path, "r", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-            if len(rows) <= 1:
-                return 0
-
-            max_id = 0
-            for row in rows[1:]:
-                if not row:
-                    continue
-                raw = row[0]
-                try:
-                    val = int(raw)
-                    if val > max_id:
-                        max_id = val
-                except Exception:
-                    # 忽略无法解析为整数的 id（如空字符串或 UUID）
-                    continue
-
-            return max_id
+        with self._file_lock.acquire(shared=True):
+            # 在锁内读取，确保并发安全
+            return self._current_id()
 
+    def close(self):
+        """关闭锁文件描述符；之后再次使用会重新打开"""
+        self._file_lock.close()
@@ -1,17 +1,51 @@
 import json
 import os
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 try:
     from apps.utils.config import STORAGE_DIR
 except ImportError:
     from ..utils.config import STORAGE_DIR
 
-class Budget:
+try:
+    from apps.utils.lock import FileLock
+except ImportError:
+    from ..utils.lock import FileLock
+
+try:
+    from apps.utils.version import VersionCounter
+except ImportError:
+    from ..utils.version import VersionCounter
+
+try:
+    from apps.utils import metrics
+except ImportError:
+    from ..utils import metrics
+
+try:
+    from apps.utils.backend import BudgetStore
+except ImportError:
+    from ..utils.backend import BudgetStore
+
+class Budget(BudgetStore):
+    """
+    预算存储（budget.json）
+
+    读取时按文件版本 (mtime, size, inode) 缓存解析结果，并维护
+    (year, month) -> monthlyLimit 的索引；写入通过临时文件 + os.replace 原子替换。
+    """
     def __init__(self, pathname: str = "budget.json"):
         self.path = STORAGE_DIR / pathname
         self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file_lock = FileLock(str(self.path) + '.lock', timeout=5.0)
+        # 数据版本号（budget.json.ver），每次写入加一，用于 ETag
+        self._version = VersionCounter(str(self.path) + '.ver')
+        self._mem_lock = threading.RLock()
+        self._data: Optional[dict] = None
+        self._limits: Dict[Tuple[int, int], Optional[float]] = {}
+        self._signature: Optional[Tuple[int, int, int, int]] = None
 
     def check_json(fun):
         """确保 Json 文件存在的装饰器"""
@@ -22,67 +56,119 @@ class Budget:
     def ensure_json(self):
         """确保 JSON 文件存在，如果不存在则创建"""
         if not os.path.exists(self.path):
-            with open(self.path, "w", encoding="utf-8") as f:
-                json.dump({"budget": {}}, f, ensure_ascii=False, indent=2)
+            with self._file_lock.acquire():
+                if not os.path.exists(self.path):
+                    self._write_locked({"budget": {}})
+
+    def _file_signature(self) -> Tuple[int, int, int, int]:
+        """当前文件版本 (mtime, size, inode, 版本号)：任一进程修改文件都会改变该值"""
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino, self._version.get())
+
+    def _index(self, data: dict):
+        """由 JSON 内容构建 (year, month) -> monthlyLimit 索引"""
+        limits: Dict[Tuple[int, int], Optional[float]] = {}
+        for year_str, year_list in data.get("budget", {}).items():
+            for item in year_list:
+                # 同一月份重复时以第一条为准，与按顺序查找的行为一致
+                limits.setdefault((int(year_str), item["month"]), item.get("monthlyLimit"))
+        self._data = data
+        self._limits = limits
+
+    def _load(self) -> dict:
+        """读取 JSON（需在锁内调用），文件未变化时直接返回缓存"""
+        with self._mem_lock:
+            signature = self._file_signature()
+            if self._data is None or self._signature != signature:
+                metrics.cache_lookup("budget", False)
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._index(json.load(f))
+                self._signature = signature
+                metrics.rows_parsed("budget", len(self._limits))
+            else:
+                metrics.cache_lookup("budget", True)
+            return self._data
+
+    def _write_locked(self, data: dict):
+        """通过临时文件 + os.replace 原子写入（需在锁内调用）"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self._version.bump()
+        with self._mem_lock:
+            self._index(data)
+            self._signature = self._file_signature()
+
+    def version(self) -> int:
+        """当前数据版本号，不需要解析 JSON"""
+        with self._file_lock.acquire(shared=True):
+            return self._version.get()
 
     @check_json
     def write_budget(self, year: int, month: int, amount: float):
         """写入预算金额（按年份组织）"""
-        with open(self.path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        # 读取 budget 根节点
-        budget_root = data.get("budget", {})
-        # 如果该年不存在，则创建一个空列表
-        year_str = str(year)
-        if year_str not in budget_root:
-            budget_root[year_str] = []
-        # 取该年的预算列表
-        year_list = budget_root[year_str]
-        # 查找该月是否已存在
-        for item in year_list:
-            if item["month"] == month:
-                item["monthlyLimit"] = amount
-                break
-        else:
-            # 不存在 → 新增
-            year_list.append({"month": month, "monthlyLimit": amount})
-        # 回写
-        data["budget"] = budget_root
-        with open(self.path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with self._file_lock.acquire():
+            # 在副本上修改，写入成功后再替换缓存
+            data = json.loads(json.dumps(self._load()))
+            # 读取 budget 根节点
+            budget_root = data.get("budget", {})
+            # 如果该年不存在，则创建一个空列表
+            year_str = str(year)
+            if year_str not in budget_root:
+                budget_root[year_str] = []
+            # 取该年的预算列表
+            year_list = budget_root[year_str]
+            # 查找该月是否已存在
+            for item in year_list:
+                if item["month"] == month:
+                    item["monthlyLimit"] = amount
+                    break
+            else:
+                # 不存在 → 新增
+                year_list.append({"month": month, "monthlyLimit": amount})
+            # 回写
+            data["budget"] = budget_root
+            self._write_locked(data)
 
     @check_json
     def read_budget(self, year: int, month: int) -> Optional[float]:
         """按年份与月份读取预算"""
-        with open(self.path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        budget_root = data.get("budget", {})
-        year_str = str(year)
-        if year_str not in budget_root:
-            return None
-        for item in budget_root[year_str]:
-            if item["month"] == month:
-                return item.get("monthlyLimit")
-
-        return None
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            return self._limits.get((year, month))
     
     @check_json
     def read_last_budget(self):
         """读取最近一次设置的预算"""
-        with open(self.path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        budget_root = data.get("budget", {})
-        if not budget_root:
-            return None
-        # 获取最新的年份
-        latest_year = max(budget_root.keys(), key=lambda y: int(y))
-        year_list = budget_root[latest_year]
-        if not year_list:
-            return None
-        # 获取最新的月份预算
-        latest_month_item = max(year_list, key=lambda item: item["month"])
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            if not self._limits:
+                return None
+            # 获取最新的年份与月份
+            year, month = max(self._limits)
+            monthly_limit = self._limits[(year, month)]
         return {
-            "year": int(latest_year),
-            "month": latest_month_item["month"],
-            "monthlyLimit": latest_month_item.get("monthlyLimit", 0)
-        }
\ No newline at end of file
+            "year": year,
+            "month": month,
+            "monthlyLimit": monthly_limit if monthly_limit is not None else 0
+        }
+
+    @check_json
+    def read_all(self) -> Dict[Tuple[int, int], Optional[float]]:
+        """读取所有月份的预算"""
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            return dict(self._limits)
+
+    def write_all(self, limits: Dict[Tuple[int, int], Optional[float]]):
+        """覆盖写入所有月份的预算"""
+        budget_root: Dict[str, list] = {}
+        for (year, month), amount in sorted(limits.items()):
+            budget_root.setdefault(str(year), []).append({"month": month, "monthlyLimit": amount})
+        with self._file_lock.acquire():
+            self._write_locked({"budget": budget_root})
+
+    def close(self):
+        """关闭锁文件描述符；之后再次使用会重新打开"""
+        self._file_lock.close()
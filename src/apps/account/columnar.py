@@ -0,0 +1,226 @@
+import re
+from typing import Dict, List, Optional, Sequence
+
+# numpy 在首次构建 LedgerFrame 时导入（约 100 ms），不做列式查询的进程启动时不必承担
+np = None
+
+try:
+    from apps.account.stats import DATE_COL, AMOUNT_COL, TYPE_COL, CATEGORY_COL
+except ImportError:
+    from .stats import DATE_COL, AMOUNT_COL, TYPE_COL, CATEGORY_COL
+
+# 无法解析的日期使用该值，不会落入任何日期区间
+INVALID_DATE = -2 ** 31
+
+# 日期区间端点：年、年月或完整日期
+PERIOD_PATTERN = re.compile(r"\d{4}(-\d{2}(-\d{2})?)?")
+
+# 分开求和的收支类型
+SIDES = ("income", "expense")
+
+
+def _require_numpy():
+    """导入 numpy（首次调用时），未安装时抛出 ImportError"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("numpy is required for LedgerFrame") from None
+        np = numpy
+
+
+def _to_days(value: Optional[str], end: bool = False) -> Optional[int]:
+    """
+    YYYY / YYYY-MM / YYYY-MM-DD -> 距 1970-01-01 的天数
+
+    与 DateIndex.query 一致按前缀理解：作为起点取该时段的第一天，作为终点
+    （end=True）取最后一天，例如 "2026-10" 作为终点为 2026-10-31。
+    格式不符时抛出 ValueError。
+    """
+    if value is None:
+        return None
+    if not PERIOD_PATTERN.fullmatch(value):
+        raise ValueError(f"invalid date {value!r}, expected YYYY, YYYY-MM or YYYY-MM-DD")
+    period = np.datetime64(value)
+    if end:
+        return int((period + 1).astype("datetime64[D]").astype(np.int64)) - 1
+    return int(period.astype("datetime64[D]").astype(np.int64))
+
+
+class LedgerFrame:
+    """
+    账本的列式内存表示
+
+    列：
+        ids      : int64
+        dates    : int32，距 1970-01-01 的天数
+        amounts  : float64
+        types / categories : 字典编码的 int32，对应 type_names / category_names
+
+    求和、分组、日期区间过滤均为向量化操作。需要安装 numpy。
+    """
+
+    def __init__(self, ids, dates, amounts, type_codes, type_names: List[str],
+                 category_codes, category_names: List[str]):
+        _require_numpy()
+        self.ids = ids
+        self.dates = dates
+        self.amounts = amounts
+        self.type_codes = type_codes
+        self.type_names = type_names
+        self.category_codes = category_codes
+        self.category_names = category_names
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[List[str]]) -> "LedgerFrame":
+        """由数据行（不含 header）构建"""
+        _require_numpy()
+        rows = [row for row in rows if len(row) > CATEGORY_COL]
+        ids = np.array([int(row[0]) if row[0].isdigit() else 0 for row in rows], dtype=np.int64)
+        amounts = np.array([row[AMOUNT_COL] or 0 for row in rows], dtype=np.float64)
+        raw_dates = [row[DATE_COL] for row in rows]
+        try:
+            parsed = np.array(raw_dates, dtype="datetime64[D]")
+            # 空字符串解析为 NaT，与无法解析的日期同样处理
+            dates = np.where(np.isnat(parsed), INVALID_DATE, parsed.astype(np.int64)).astype(np.int32)
+        except ValueError:
+            dates = np.array([cls._parse_date(value) for value in raw_dates], dtype=np.int32)
+        type_names, type_codes = np.unique(
+            np.array([row[TYPE_COL] for row in rows], dtype=object).astype(str), return_inverse=True
+        )
+        category_names, category_codes = np.unique(
+            np.array([row[CATEGORY_COL] for row in rows], dtype=object).astype(str), return_inverse=True
+        )
+        return cls(
+            ids, dates, amounts,
+            type_codes.astype(np.int32), type_names.tolist(),
+            category_codes.astype(np.int32), category_names.tolist(),
+        )
+
+    @classmethod
+    def concat(cls, frames: Sequence["LedgerFrame"]) -> "LedgerFrame":
+        """按顺序合并多个 LedgerFrame，type / category 重新按名称排序编码"""
+        _require_numpy()
+        if not frames:
+            return cls.from_rows([])
+        type_codes, type_names = cls._merge_codes([(f.type_codes, f.type_names) for f in frames])
+        category_codes, category_names = cls._merge_codes([(f.category_codes, f.category_names) for f in frames])
+        return cls(
+            np.concatenate([f.ids for f in frames]),
+            np.concatenate([f.dates for f in frames]),
+            np.concatenate([f.amounts for f in frames]),
+            type_codes, type_names, category_codes, category_names,
+        )
+
+    @staticmethod
+    def _merge_codes(parts):
+        names = sorted(set().union(*(part_names for _, part_names in parts)))
+        index = {name: i for i, name in enumerate(names)}
+        codes = [
+            np.array([index[name] for name in part_names], dtype=np.int32)[part_codes]
+            if len(part_names) else np.zeros(0, dtype=np.int32)
+            for part_codes, part_names in parts
+        ]
+        return np.concatenate(codes).astype(np.int32), names
+
+    @staticmethod
+    def _parse_date(value: str) -> int:
+        try:
+            parsed = np.datetime64(value, "D")
+        except ValueError:
+            return INVALID_DATE
+        if np.isnat(parsed):
+            return INVALID_DATE
+        return int(parsed.astype(np.int64))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def mask(self, start: Optional[str] = None, end: Optional[str] = None,
+             type: Optional[str] = None, category: Optional[str] = None):
+        """
+        构造过滤掩码
+
+        Args:
+            start / end: 日期区间（闭区间），可为 YYYY / YYYY-MM / YYYY-MM-DD，
+                起点取时段的第一天、终点取最后一天
+            type: 收支类型（income / expense）
+            category: 分类
+        """
+        result = np.ones(len(self), dtype=bool)
+        if start is not None:
+            result &= self.dates >= _to_days(start)
+        if end is not None:
+            result &= (self.dates <= _to_days(end, end=True)) & (self.dates != INVALID_DATE)
+        if type is not None:
+            result &= self._code_mask(self.type_codes, self.type_names, type)
+        if category is not None:
+            result &= self._code_mask(self.category_codes, self.category_names, category)
+        return result
+
+    @staticmethod
+    def _code_mask(codes, names: List[str], value: str):
+        try:
+            return codes == names.index(value)
+        except ValueError:
+            return np.zeros(len(codes), dtype=bool)
+
+    def sum(self, **filters) -> float:
+        """满足条件的金额总和"""
+        return float(self.amounts[self.mask(**filters)].sum())
+
+    def count(self, **filters) -> int:
+        """满足条件的记录数"""
+        return int(self.mask(**filters).sum())
+
+    def _sides(self, **filters):
+        """满足条件的收入 / 支出记录的掩码"""
+        selected = self.mask(**filters)
+        return {side: selected & self._code_mask(self.type_codes, self.type_names, side) for side in SIDES}
+
+    def totals(self, **filters) -> Dict[str, float]:
+        """满足条件的收入与支出金额，分别求和而不相互抵消"""
+        return {side: float(self.amounts[selected].sum()) for side, selected in self._sides(**filters).items()}
+
+    def group_totals(self, key: str, **filters) -> Dict[str, Dict[str, float]]:
+        """
+        按 category / type / month / date 分组，分别求收入与支出金额
+
+        Returns:
+            {分组值: {"income": 金额, "expense": 金额}}，按分组值排序，不包含没有收支记录的分组
+        """
+        parts = {side: self._group(key, selected) for side, selected in self._sides(**filters).items()}
+        names = sorted(set().union(*parts.values()))
+        return {name: {side: parts[side].get(name, 0.0) for side in SIDES} for name in names}
+
+    def group_by(self, key: str, **filters) -> Dict[str, float]:
+        """
+        按 category / type / month / date 分组求金额总和
+
+        Returns:
+            {分组值: 金额}，不包含没有记录的分组
+        """
+        return self._group(key, self.mask(**filters))
+
+    def _group(self, key: str, selected) -> Dict[str, float]:
+        amounts = self.amounts[selected]
+        if key == "category":
+            return self._sum_codes(self.category_codes[selected], self.category_names, amounts)
+        if key == "type":
+            return self._sum_codes(self.type_codes[selected], self.type_names, amounts)
+        if key in ("month", "date"):
+            dates = self.dates[selected]
+            valid = dates != INVALID_DATE
+            unit = "M" if key == "month" else "D"
+            buckets = dates[valid].astype("datetime64[D]").astype(f"datetime64[{unit}]")
+            labels, codes = np.unique(buckets, return_inverse=True)
+            sums = np.bincount(codes, weights=amounts[valid], minlength=len(labels))
+            return {str(label): float(total) for label, total in zip(labels, sums)}
+        raise ValueError(f"unsupported group key: {key}")
+
+    @staticmethod
+    def _sum_codes(codes, names: List[str], amounts) -> Dict[str, float]:
+        sums = np.bincount(codes, weights=amounts, minlength=len(names))
+        counts = np.bincount(codes, minlength=len(names))
+        return {names[i]: float(sums[i]) for i in range(len(names)) if counts[i]}
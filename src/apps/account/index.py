@@ -0,0 +1,298 @@
+import bisect
+import csv
+import io
+import os
+import struct
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class RowIndex:
+    """
+    data.csv 的行偏移索引（sidecar 文件 data.csv.idx）
+
+    文件格式：
+        header  : magic(8s) + 数据文件 size / mtime_ns / inode / 版本号（4 x int64）
+        entries : 每行 (id, offset) 两个 int64，墓碑行的 id 为负数
+
+    header 中记录的数据文件版本与实际不一致时视为过期，需要重建。
+    """
+    MAGIC = b"FSCRIDX2"
+    HEADER = struct.Struct("<8sqqqq")
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.signature: Optional[Tuple[int, int, int, int]] = None
+        self.ids = array("q")
+        self.offsets = array("q")
+        # id -> 最后一条墓碑所在位置，位于其之前的同 id 行均已删除
+        self._tombstones: Dict[int, int] = {}
+        # 按 id 排序的 (id 数组, 位置数组)，分页时按需构建
+        self._order: Optional[Tuple[array, array]] = None
+
+    @staticmethod
+    def parse_id(raw: str) -> int:
+        try:
+            return int(raw)
+        except ValueError:
+            return 0
+
+    def max_id(self) -> int:
+        """文件中出现过的最大 id（墓碑的负 id 取绝对值）"""
+        if not self.ids:
+            return 0
+        return max(max(self.ids), -min(self.ids), 0)
+
+    def _header_bytes(self, signature: Tuple[int, int, int, int]) -> bytes:
+        mtime_ns, size, ino, version = signature
+        return self.HEADER.pack(self.MAGIC, size, mtime_ns, ino, version)
+
+    def _reset(self, ids: array, offsets: array, signature: Tuple[int, int, int, int]):
+        self.ids = ids
+        self.offsets = offsets
+        self.signature = signature
+        self._tombstones = {}
+        for pos, row_id in enumerate(ids):
+            if row_id < 0:
+                self._tombstones[-row_id] = pos
+        self._order = None
+
+    def load(self, signature: Tuple[int, int, int, int]) -> bool:
+        """确保内存中的索引与数据文件版本一致，sidecar 过期时返回 False"""
+        if self.signature == signature:
+            return True
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return False
+        if len(raw) < self.HEADER.size or raw[:self.HEADER.size] != self._header_bytes(signature):
+            return False
+        body = array("q")
+        body.frombytes(raw[self.HEADER.size:len(raw) - (len(raw) - self.HEADER.size) % 16])
+        self._reset(body[0::2], body[1::2], signature)
+        return True
+
+    def rebuild(self, data_path: Path, signature: Tuple[int, int, int, int]):
+        """扫描数据文件重建索引（跳过 header 行）"""
+        line_offsets: List[int] = []
+        lines: List[str] = []
+        pos = 0
+        with open(data_path, "rb") as f:
+            for line in f:
+                line_offsets.append(pos)
+                lines.append(line.decode("utf-8"))
+                pos += len(line)
+        ids = array("q")
+        offsets = array("q")
+        reader = csv.reader(lines)
+        start_line = 0
+        for row in reader:
+            # line_num 为已消费的物理行数，可据此定位跨行字段所在的起始偏移
+            if start_line > 0 and row:
+                ids.append(self.parse_id(row[0]))
+                offsets.append(line_offsets[start_line])
+            start_line = reader.line_num
+        self._reset(ids, offsets, signature)
+        self._write_all()
+
+    def _write_all(self):
+        body = array("q")
+        for row_id, offset in zip(self.ids, self.offsets):
+            body.append(row_id)
+            body.append(offset)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(self._header_bytes(self.signature))
+            f.write(body.tobytes())
+        os.replace(tmp_path, self.path)
+
+    def extend(self, entries: List[Tuple[int, int]], previous: Tuple[int, int, int, int],
+               signature: Tuple[int, int, int, int]):
+        """
+        追加写入后增量更新索引
+
+        Args:
+            entries: 新写入行的 (id, offset)
+            previous: 写入前的数据文件版本，索引与之不一致时放弃增量更新
+            signature: 写入后的数据文件版本
+        """
+        if self.signature != previous:
+            self.signature = None
+            return
+        body = array("q")
+        for row_id, offset in entries:
+            if row_id < 0:
+                self._tombstones[-row_id] = len(self.ids)
+            elif row_id > 0 and self._order is not None:
+                order_ids, order_pos = self._order
+                if order_ids and row_id < order_ids[-1]:
+                    # 乱序的 id（手工追加）：下次分页时重新排序
+                    self._order = None
+                else:
+                    order_ids.append(row_id)
+                    order_pos.append(len(self.ids))
+            self.ids.append(row_id)
+            self.offsets.append(offset)
+            body.append(row_id)
+            body.append(offset)
+        with open(self.path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            f.write(body.tobytes())
+            f.seek(0)
+            f.write(self._header_bytes(signature))
+        self.signature = signature
+
+    def invalidate(self):
+        self.signature = None
+
+    def is_live(self, pos: int) -> bool:
+        row_id = self.ids[pos]
+        if row_id < 0:
+            return False
+        return self._tombstones.get(row_id, -1) < pos
+
+    def snapshot(self) -> Tuple[int, Callable[[int], bool]]:
+        """
+        当前索引的快照，供锁外逐行读取时判断行是否存活
+
+        Returns:
+            (快照时的行数, 判断位置是否存活的函数)
+        """
+        ids = self.ids
+        count = len(ids)
+        tombstones = dict(self._tombstones)
+
+        def is_live(pos: int) -> bool:
+            row_id = ids[pos]
+            return row_id >= 0 and tombstones.get(row_id, -1) < pos
+        return count, is_live
+
+    def _ordered(self) -> Tuple[array, array]:
+        """按 id 升序排列的 (id, 行位置)，不含墓碑与 id 不是正整数的行；追加时增量维护"""
+        if self._order is None:
+            entries = [(row_id, pos) for pos, row_id in enumerate(self.ids) if row_id > 0]
+            if any(entries[i][0] > entries[i + 1][0] for i in range(len(entries) - 1)):
+                entries.sort()
+            self._order = (array("q", [row_id for row_id, _ in entries]), array("q", [pos for _, pos in entries]))
+        return self._order
+
+    def page(self, cursor: int, limit: int) -> Tuple[List[int], Optional[int]]:
+        """
+        按 id 升序取 id 大于 cursor 的至多 limit 条未删除的行
+
+        cursor 为上一页最后一行的 id（首页为 0），与行在文件中的位置无关，压缩或
+        重写文件后仍然有效。id 重复的多行不会被拆到两页（该页可能超过 limit 行），
+        id 不是正整数的行不参与分页。
+
+        Returns:
+            (行位置列表（按 id 升序）, 下一页的 cursor；没有更多数据时为 None)
+        """
+        order_ids, order_pos = self._ordered()
+        positions: List[int] = []
+        last_id = None
+        for i in range(bisect.bisect_right(order_ids, cursor), len(order_ids)):
+            pos = order_pos[i]
+            if not self.is_live(pos):
+                continue
+            row_id = order_ids[i]
+            if len(positions) >= limit and row_id != last_id:
+                return positions, last_id
+            positions.append(pos)
+            last_id = row_id
+        return positions, None
+
+    def read_rows(self, data_path: Path, positions: List[int], size: int) -> List[List[str]]:
+        """按偏移直接读取指定位置的行，连续的行合并为一次读取"""
+        rows: List[List[str]] = []
+        with open(data_path, "rb") as f:
+            i = 0
+            while i < len(positions):
+                j = i
+                while j + 1 < len(positions) and positions[j + 1] == positions[j] + 1:
+                    j += 1
+                start = self.offsets[positions[i]]
+                last = positions[j]
+                end = self.offsets[last + 1] if last + 1 < len(self.offsets) else size
+                f.seek(start)
+                chunk = f.read(end - start).decode("utf-8")
+                rows.extend(row for row in csv.reader(io.StringIO(chunk, newline="")) if row)
+                i = j + 1
+        return rows
+
+
+class DateIndex:
+    """
+    按月分桶的日期索引
+
+    每个桶内按 (date, seq) 有序，乱序插入（补记的历史交易）只需在所属桶内
+    bisect 插入，不需要整体重排。删除采用惰性方式：查询时由调用方过滤已删除
+    的行，桶内残留的条目在缓存重建（如压缩）时清理。
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, List[Tuple[str, int, List[str]]]] = {}
+        self._months: List[str] = []
+        self._seq = 0
+
+    def clear(self):
+        self._buckets = {}
+        self._months = []
+        self._seq = 0
+
+    def add(self, date: str, row: List[str]):
+        month = date[:7]
+        bucket = self._buckets.get(month)
+        if bucket is None:
+            bucket = self._buckets[month] = []
+            bisect.insort(self._months, month)
+        self._seq += 1
+        entry = (date, self._seq, row)
+        if not bucket or bucket[-1][:2] < entry[:2]:
+            bucket.append(entry)
+        else:
+            bucket.insert(bisect.bisect_right(bucket, (date, self._seq)), entry)
+
+    def query(self, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[List[str]]:
+        """
+        按日期升序产出 start <= date <= end 的行
+
+        end 按前缀匹配，例如 end="2026-10" 包含整个十月。
+        """
+        upper = None if end is None else end + "\uffff"
+        lo = 0 if start is None else bisect.bisect_left(self._months, start[:7])
+        hi = len(self._months) if upper is None else bisect.bisect_right(self._months, upper)
+        for month in self._months[lo:hi]:
+            bucket = self._buckets[month]
+            first = 0 if start is None else bisect.bisect_left(bucket, (start,))
+            last = len(bucket) if upper is None else bisect.bisect_right(bucket, (upper,))
+            for _, _, row in bucket[first:last]:
+                yield row
+
+    def state(self, refs: Dict[int, int]) -> Tuple[int, Dict[str, Tuple[List[str], List[int], List[int]]]]:
+        """
+        可序列化的索引状态（用于预热快照）
+
+        Args:
+            refs: id(行) -> 行的引用序号；不在其中的行（已删除）不保留
+
+        Returns:
+            (seq, 月份 -> (日期列表, 序号列表, 行引用列表))
+        """
+        buckets = {}
+        for month, bucket in self._buckets.items():
+            entries = [(date, seq, refs[id(row)]) for date, seq, row in bucket if id(row) in refs]
+            if entries:
+                dates, seqs, positions = zip(*entries)
+                buckets[month] = (list(dates), list(seqs), list(positions))
+        return self._seq, buckets
+
+    def restore(self, seq: int, buckets: Dict[str, Tuple[List[str], List[int], List[int]]], rows: List[List[str]]):
+        """从 state 的结果恢复，rows 为行引用序号 -> 行"""
+        self._buckets = {
+            month: list(zip(dates, seqs, [rows[pos] for pos in positions]))
+            for month, (dates, seqs, positions) in buckets.items()
+        }
+        self._months = sorted(self._buckets)
+        self._seq = seq
@@ -0,0 +1,396 @@
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from apps.utils.config import STORAGE_DIR
+except ImportError:
+    from ..utils.config import STORAGE_DIR
+
+try:
+    from apps.utils.lock import FileLock
+except ImportError:
+    from ..utils.lock import FileLock
+
+try:
+    from apps.utils.utils import max_int_id
+except ImportError:
+    from ..utils.utils import max_int_id
+
+try:
+    from apps.utils.commit import GroupCommitter
+except ImportError:
+    from ..utils.commit import GroupCommitter
+
+try:
+    from apps.utils.version import VersionCounter
+except ImportError:
+    from ..utils.version import VersionCounter
+
+try:
+    from apps.utils.backend import LedgerStore
+except ImportError:
+    from ..utils.backend import LedgerStore
+
+try:
+    from apps.account.storage import Storage
+    from apps.account.stats import MonthlyRollup, DATE_COL
+    from apps.account.columnar import LedgerFrame
+except ImportError:
+    from .storage import Storage
+    from .stats import MonthlyRollup, DATE_COL
+    from .columnar import LedgerFrame
+
+HEADER = ["id", "date", "event", "amount", "type", "remark", "category"]
+
+MONTH_PATTERN = re.compile(r"\d{4}-\d{2}")
+
+class PartitionedStorage(LedgerStore):
+    """
+    按月分区的账本存储（storage/ledger/YYYY-MM.csv + manifest.json）
+
+    每个分区是一个独立的 CSV Storage，墓碑删除、解析缓存、行偏移索引与压缩均沿用；
+    日期中识别不出月份的行放入 undated.csv。manifest 记录各分区的 id 区间与已分配过的
+    最大 id：按月汇总、按日期区间读取只打开涉及的分区，删除按 id 区间定位分区。
+
+    manifest 的文件锁保护 id 分配与跨分区的一致性：写操作持独占锁，读操作持共享锁，
+    分区自身的锁总是在其内获取。首次打开时若存在旧的 data.csv，自动按月拆分迁移，
+    原文件重命名为 data.csv.migrated。
+    """
+    UNDATED = "undated"
+
+    def __init__(self, dirname="ledger", legacy="data.csv"):
+        self.directory = STORAGE_DIR / dirname
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.directory / "manifest.json"
+        self.legacy_path = STORAGE_DIR / legacy
+        self._file_lock = FileLock(str(self.manifest_path) + '.lock', timeout=5.0)
+        # 数据版本号（manifest.json.ver），任一分区变更都加一，用于 ETag
+        self._version = VersionCounter(str(self.manifest_path) + '.ver')
+        self._mem_lock = threading.RLock()
+        self._manifest: Optional[dict] = None
+        self._signature: Optional[Tuple[int, int, int, int]] = None
+        # 已打开的分区，首次访问时创建
+        self._partitions: Dict[str, Storage] = {}
+        self._frame: Optional[LedgerFrame] = None
+        self._frame_version = -1
+        self._committer = GroupCommitter(self._commit_batch)
+        self.ensure_manifest()
+
+    def ensure_manifest(self):
+        """确保 manifest 存在；不存在时从旧的 data.csv 迁移（如果有）"""
+        if os.path.exists(self.manifest_path):
+            return
+        with self._file_lock.acquire():
+            if os.path.exists(self.manifest_path):
+                return
+            manifest: Dict[str, Any] = {"last_id": 0, "partitions": {}}
+            if os.path.exists(self.legacy_path):
+                legacy = Storage(str(self.legacy_path))
+                rows = legacy.read_all()[1:]
+                self._write_partitions(manifest, rows)
+                manifest["last_id"] = max(legacy.fetch_id(), manifest["last_id"])
+                self._commit(manifest)
+                os.replace(self.legacy_path, str(self.legacy_path) + ".migrated")
+            else:
+                self._commit(manifest)
+
+    @classmethod
+    def partition_key(cls, date: str) -> str:
+        """行所属的分区：YYYY-MM，识别不出月份时为 undated"""
+        month = date[:7]
+        return month if MONTH_PATTERN.fullmatch(month) else cls.UNDATED
+
+    @classmethod
+    def _ordinal(cls, key: str) -> int:
+        """分区序号：按月份递增，undated 排在最后"""
+        if key == cls.UNDATED:
+            return 1 << 20
+        return int(key[:4]) * 12 + int(key[5:7])
+
+    def _partition(self, key: str) -> Storage:
+        with self._mem_lock:
+            storage = self._partitions.get(key)
+            if storage is None:
+                storage = self._partitions[key] = Storage(str(self.directory / f"{key}.csv"))
+            return storage
+
+    def _file_signature(self) -> Tuple[int, int, int, int]:
+        st = os.stat(self.manifest_path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino, self._version.get())
+
+    def _load(self) -> dict:
+        """读取 manifest（需在锁内调用），文件未变化时直接返回缓存"""
+        with self._mem_lock:
+            signature = self._file_signature()
+            if self._manifest is None or self._signature != signature:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+                self._signature = signature
+            return self._manifest
+
+    def _keys(self, manifest: dict, start: Optional[str] = None, end: Optional[str] = None) -> List[str]:
+        """按序号排列的分区；给定日期区间时只保留可能包含其中日期的分区"""
+        upper = None if end is None else end + "\uffff"
+        keys = [
+            key for key in manifest["partitions"]
+            if key == self.UNDATED
+            or ((start is None or key >= start[:7]) and (upper is None or key <= upper))
+        ]
+        return sorted(keys, key=self._ordinal)
+
+    def _commit(self, manifest: Optional[dict] = None):
+        """记录一次变更（需在独占锁内调用）：写回 manifest（如有），版本号加一"""
+        if manifest is not None:
+            tmp_path = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+            # 每次写入都会重写 manifest，不缩进以使用 C 实现的编码器
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(manifest, ensure_ascii=False))
+            os.replace(tmp_path, self.manifest_path)
+        self._version.bump()
+        with self._mem_lock:
+            if manifest is not None:
+                self._manifest = manifest
+            self._signature = self._file_signature()
+
+    def _copy(self) -> dict:
+        """manifest 的副本，修改后通过 _commit 写回"""
+        return json.loads(json.dumps(self._load()))
+
+    def _group(self, rows: List[List[Any]]) -> Dict[str, List[List[Any]]]:
+        groups: Dict[str, List[List[Any]]] = {}
+        for row in rows:
+            date = "" if len(row) <= DATE_COL or row[DATE_COL] is None else str(row[DATE_COL])
+            groups.setdefault(self.partition_key(date), []).append(row)
+        return groups
+
+    @staticmethod
+    def _extend(manifest: dict, key: str, rows: List[List[Any]]):
+        """将 rows 的 id 并入分区的 id 区间"""
+        ids = []
+        for row in rows:
+            try:
+                ids.append(int(row[0]))
+            except (TypeError, ValueError, IndexError):
+                continue
+        entry = manifest["partitions"].setdefault(key, {"min_id": None, "max_id": None})
+        if ids:
+            entry["min_id"] = min(ids) if entry["min_id"] is None else min(entry["min_id"], min(ids))
+            entry["max_id"] = max(ids) if entry["max_id"] is None else max(entry["max_id"], max(ids))
+        manifest["last_id"] = max(manifest["last_id"], max(ids, default=0))
+
+    def _write_partitions(self, manifest: dict, rows: List[List[Any]]):
+        """按月份覆盖写入各分区，清空不再出现的分区（需在独占锁内调用）"""
+        groups = self._group(rows)
+        for key in list(manifest["partitions"]):
+            if key not in groups:
+                self._partition(key).write_all([HEADER])
+                del manifest["partitions"][key]
+        for key, group in groups.items():
+            self._partition(key).write_all([HEADER] + group)
+            manifest["partitions"].pop(key, None)
+            self._extend(manifest, key, group)
+
+    def version(self) -> int:
+        """当前数据版本号，不需要读取分区"""
+        with self._file_lock.acquire(shared=True):
+            return self._version.get()
+
+    def read_header(self) -> List[str]:
+        return list(HEADER)
+
+    def read_all(self) -> List[List[str]]:
+        """读取所有行（包括header），按分区（月份）顺序，分区内按写入顺序"""
+        with self._file_lock.acquire(shared=True):
+            rows = [list(HEADER)]
+            for key in self._keys(self._load()):
+                rows.extend(self._partition(key).read_all()[1:])
+            return rows
+
+    def read_range(self, start: Optional[str] = None, end: Optional[str] = None) -> List[List[str]]:
+        """
+        按日期区间读取（包括header），结果按日期升序；只读取区间涉及的分区
+
+        Args:
+            start: 起始日期（含），如 2026-10-01
+            end: 结束日期（含，按前缀匹配），如 2026-10-31 或 2026-10
+        """
+        with self._file_lock.acquire(shared=True):
+            keys = self._keys(self._load(), start, end)
+            rows: List[List[str]] = []
+            for key in keys:
+                rows.extend(self._partition(key).read_range(start, end)[1:])
+        if self.UNDATED in keys:
+            # 各月份分区已按日期有序，只有 undated 中的行需要归位（稳定排序）
+            rows.sort(key=lambda row: row[DATE_COL])
+        return [list(HEADER)] + rows
+
+    def read_page(self, cursor: int = 0, limit: int = 100) -> Tuple[List[List[str]], Optional[int]]:
+        """
+        按 id 升序分页读取：合并 id 范围与 cursor 之后有交集的分区各自的一页
+
+        Args:
+            cursor: 上一页最后一行的 id（上一页返回的 next_cursor），首页为 0；
+                分区压缩、迁移不影响已发出的 cursor
+            limit: 本页最多返回的行数，id 重复的多行不会被拆到两页
+
+        Returns:
+            ([header] + 本页数据行, 下一页的 cursor；没有更多数据时为 None)
+        """
+        rows: List[List[str]] = []
+        more = False
+        with self._file_lock.acquire(shared=True):
+            partitions = self._load()["partitions"]
+            # manifest 中的 id 范围只增不减，是分区内 id 的上下界
+            keys = sorted(
+                (key for key, entry in partitions.items()
+                 if entry["max_id"] is not None and entry["max_id"] > cursor),
+                key=lambda key: partitions[key]["min_id"],
+            )
+            for key in keys:
+                if len(rows) >= limit and partitions[key]["min_id"] > int(rows[limit - 1][0]):
+                    # 之后的分区只含更大的 id，留给下一页
+                    more = True
+                    break
+                page, next_pos = self._partition(key).read_page(cursor, limit)
+                more = more or next_pos is not None
+                rows = sorted(rows + page[1:], key=lambda row: int(row[0]))
+        if len(rows) > limit:
+            last_id = int(rows[limit - 1][0])
+            kept = [row for row in rows if int(row[0]) <= last_id]
+            more = more or len(kept) < len(rows)
+            rows = kept
+        next_cursor = int(rows[-1][0]) if more and rows else None
+        return [list(HEADER)] + rows, next_cursor
+
+    def iter_rows(self) -> Iterator[List[str]]:
+        """逐行产出未删除的数据行（不含 header），每个分区内为一致的快照"""
+        with self._file_lock.acquire(shared=True):
+            partitions = [self._partition(key) for key in self._keys(self._load())]
+        for partition in partitions:
+            yield from partition.iter_rows()
+
+    def month_stats(self, month: str) -> Dict[str, Any]:
+        """某月（YYYY-MM）的汇总，只读取该月的分区"""
+        with self._file_lock.acquire(shared=True):
+            if month in self._load()["partitions"]:
+                return self._partition(month).month_stats(month)
+        return MonthlyRollup().month(month)
+
+    def frame(self) -> LedgerFrame:
+        """
+        账本的列式表示（需要 numpy）：合并各分区缓存的列式表示
+
+        只有发生变化的分区需要重建；版本号未变化时复用上次合并的结果。
+        """
+        with self._file_lock.acquire(shared=True):
+            version = self._version.get()
+            with self._mem_lock:
+                if self._frame is None or self._frame_version != version:
+                    frames = [self._partition(key).frame() for key in self._keys(self._load())]
+                    self._frame = LedgerFrame.concat(frames)
+                    self._frame_version = version
+                return self._frame
+
+    def _append_locked(self, manifest: dict, rows: List[List[Any]]):
+        """按月份分组追加，并更新 manifest（需在独占锁内调用）"""
+        for key, group in self._group(rows).items():
+            self._partition(key).append_rows(group)
+            self._extend(manifest, key, group)
+        self._commit(manifest)
+
+    def _commit_batch(self, items: List[Tuple[bool, List[Any]]]) -> List[Optional[int]]:
+        """
+        组提交的批量写入：items 为 (是否分配 id, 行) 列表
+
+        Returns:
+            每个条目分配的 id（不分配 id 的条目为 None）
+        """
+        with self._file_lock.acquire():
+            manifest = self._copy()
+            last_id = manifest["last_id"]
+            rows = []
+            results: List[Optional[int]] = []
+            for allocate, row in items:
+                if allocate:
+                    last_id += 1
+                    rows.append([last_id, *row])
+                    results.append(last_id)
+                else:
+                    rows.append(row)
+                    results.append(None)
+            self._append_locked(manifest, rows)
+            return results
+
+    def append_row(self, row: List[Any]):
+        """追加一行（与并发的写入合并提交）"""
+        self._committer.submit((False, row))
+
+    def append_rows(self, rows: List[List[Any]]):
+        """一次加锁追加多行，每个涉及的分区各写入一次"""
+        if not rows:
+            return
+        with self._file_lock.acquire():
+            self._append_locked(self._copy(), rows)
+
+    def insert_row(self, values: List[Any]) -> int:
+        """分配新 id 并追加一行（不含 id 列），返回分配的 id；与并发的写入合并提交"""
+        return self._committer.submit((True, values))
+
+    def insert_rows(self, values_list: List[List[Any]]) -> range:
+        """批量追加多行（不含 id 列），分配连续的 id 区间"""
+        with self._file_lock.acquire():
+            manifest = self._copy()
+            first_id = manifest["last_id"] + 1
+            ids = range(first_id, first_id + len(values_list))
+            if values_list:
+                self._append_locked(manifest, [[new_id, *values] for new_id, values in zip(ids, values_list)])
+            return ids
+
+    def write_all(self, rows: List[List[Any]]):
+        """覆盖写入（header 固定为 HEADER，rows[0] 被忽略）"""
+        with self._file_lock.acquire():
+            manifest = self._copy()
+            manifest["last_id"] = max_int_id(rows[1:])
+            self._write_partitions(manifest, rows[1:])
+            self._commit(manifest)
+
+    def delete_by_id(self, id_value: str) -> bool:
+        """
+        删除匹配 id 的行，返回是否找到该 id
+
+        只检查 id 区间包含该 id 的分区，区间越窄的分区越先检查；分配的 id 唯一，
+        找到后即停止。
+        """
+        try:
+            id_int: Optional[int] = int(id_value)
+        except ValueError:
+            id_int = None
+        with self._file_lock.acquire():
+            # 非整数 id（手工追加的行）无法按区间定位，检查全部分区
+            candidates = [
+                (entry["max_id"] - entry["min_id"] if entry["min_id"] is not None else 0, key)
+                for key, entry in self._load()["partitions"].items()
+                if id_int is None
+                or (entry["min_id"] is not None and entry["min_id"] <= id_int <= entry["max_id"])
+            ]
+            for _, key in sorted(candidates):
+                if self._partition(key).delete_by_id(id_value):
+                    self._commit()
+                    return True
+            return False
+
+    def fetch_id(self) -> int:
+        """获取已分配过的最大 ID 值"""
+        with self._file_lock.acquire(shared=True):
+            return self._load()["last_id"]
+
+    def close(self):
+        """关闭 manifest 与已打开分区的锁文件描述符、停止分区的压缩线程"""
+        with self._mem_lock:
+            partitions = list(self._partitions.values())
+        for partition in partitions:
+            partition.close()
+        self._file_lock.close()
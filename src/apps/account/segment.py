@@ -0,0 +1,742 @@
+import bisect
+import mmap
+import os
+import struct
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# numpy 与记录的结构化 dtype 在首次构建 LedgerFrame 时才导入 / 创建（见 columnar）
+np = None
+_record_dtype = None
+
+try:
+    from apps.utils.config import STORAGE_DIR, SYNC_WRITES
+except ImportError:
+    from ..utils.config import STORAGE_DIR, SYNC_WRITES
+
+try:
+    from apps.utils.lock import FileLock
+except ImportError:
+    from ..utils.lock import FileLock
+
+try:
+    from apps.utils.utils import system_
+except ImportError:
+    from ..utils.utils import system_
+
+try:
+    from apps.utils.commit import GroupCommitter
+except ImportError:
+    from ..utils.commit import GroupCommitter
+
+try:
+    from apps.utils.version import VersionCounter
+except ImportError:
+    from ..utils.version import VersionCounter
+
+try:
+    from apps.utils import metrics
+except ImportError:
+    from ..utils import metrics
+
+try:
+    from apps.utils.backend import LedgerStore
+except ImportError:
+    from ..utils.backend import LedgerStore
+
+try:
+    from apps.account.index import DateIndex
+    from apps.account.stats import MonthlyRollup
+    from apps.account.columnar import LedgerFrame, INVALID_DATE, _require_numpy
+except ImportError:
+    from .index import DateIndex
+    from .stats import MonthlyRollup
+    from .columnar import LedgerFrame, INVALID_DATE, _require_numpy
+
+HEADER = ["id", "date", "event", "amount", "type", "remark", "category"]
+
+EPOCH = date(1970, 1, 1)
+
+# 记录：id, amount, date（距 1970-01-01 的天数）, type, category, event, remark,
+#       date 原文, amount 原文, 保留；字符串字段均为字符串表中的序号。
+# 数值列供扫描与聚合使用（无法解析的日期为 INVALID_DATE、金额为 0），
+# 还原为文本行时使用原文，与 CSV 存储逐字一致
+RECORD = struct.Struct("<qdiIIIIIII")
+MAGIC = b"FSCRSEG1"
+# 段文件头：magic, 记录长度, 保留, epoch（每次重写生成）, 段内记录之前已分配过的最大 id
+FILE_HEADER = struct.Struct("<8sIIQq")
+
+
+def _require_record_dtype():
+    """导入 numpy 并创建与 RECORD 对应的结构化 dtype（首次调用时），未安装时抛出 ImportError"""
+    global np, _record_dtype
+    if _record_dtype is None:
+        _require_numpy()
+        import numpy
+        np = numpy
+        _record_dtype = np.dtype([
+            ("id", "<i8"), ("amount", "<f8"), ("date", "<i4"),
+            ("type", "<u4"), ("category", "<u4"), ("event", "<u4"), ("remark", "<u4"),
+            ("date_text", "<u4"), ("amount_text", "<u4"), ("reserved", "<u4"),
+        ])
+    return _record_dtype
+
+
+# Windows 上被映射的文件不能被 os.replace 替换（压缩、覆盖写入），改为读入内存
+USE_MMAP = system_() != "Windows"
+
+
+def _parse_day(text: str) -> Optional[int]:
+    """YYYY-MM-DD -> 距 1970-01-01 的天数，无法解析时返回 None"""
+    if len(text) != 10:
+        return None
+    try:
+        return (date.fromisoformat(text) - EPOCH).days
+    except ValueError:
+        return None
+
+
+def _new_epoch() -> int:
+    return int.from_bytes(os.urandom(8), "little")
+
+
+class StringTable:
+    """
+    追加写入的字符串表（ledger.<epoch>.str）
+
+    event / remark / type / category 等文本在表中只保存一份，记录中存其序号。
+    文件格式：magic(8s) + epoch(uint64)，之后每个字符串为 uint32 长度 + UTF-8 字节；
+    序号 0 固定为空字符串。文件名带有段文件头中的 epoch：重写时先写出新 epoch 的
+    字符串表，再替换段文件，一次 os.replace 即完成提交，中途崩溃时旧的段文件与
+    字符串表仍然配套。
+    """
+    MAGIC = b"FSCRSTR1"
+    HEADER = struct.Struct("<8sQ")
+    LENGTH = struct.Struct("<I")
+
+    def __init__(self, base: Path):
+        """
+        Args:
+            base: 不带 epoch 的文件名（如 ledger.str），各 epoch 的表与其位于同一目录
+        """
+        self.base = Path(base)
+        self.path = self.base
+        self.epoch: Optional[int] = None
+        # 重新读取时替换为新列表；追加只在末尾进行，已取得引用的读者不受影响
+        self.strings: List[str] = [""]
+        self._refs: Dict[str, int] = {"": 0}
+        self._offset = 0
+
+    @classmethod
+    def encode(cls, text: str) -> bytes:
+        data = text.encode("utf-8")
+        return cls.LENGTH.pack(len(data)) + data
+
+    def path_for(self, epoch: int) -> Path:
+        """epoch 对应的字符串表文件"""
+        return self.base.with_name(f"{self.base.stem}.{epoch:016x}{self.base.suffix}")
+
+    def remove_stale(self, epoch: int):
+        """删除 epoch 之外的字符串表（重写后或崩溃遗留的，需在独占锁内调用）"""
+        current = self.path_for(epoch)
+        pattern = f"{self.base.stem}.{'[0-9a-f]' * 16}{self.base.suffix}"
+        stale = list(self.base.parent.glob(pattern)) + [self.base]
+        for path in stale:
+            if path != current:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @classmethod
+    def write(cls, path: Path, epoch: int, strings: List[str]):
+        """写出完整的字符串表"""
+        with open(path, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, epoch))
+            f.write(b"".join(cls.encode(text) for text in strings))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def refresh(self, epoch: int):
+        """读取其他进程追加的字符串（需在锁内调用）；epoch 变化时重新读取整个文件"""
+        if self.epoch != epoch:
+            path = self.path_for(epoch)
+            if not path.exists() and self.base.exists():
+                # 文件名不带 epoch 的旧版字符串表，下次重写时替换
+                path = self.base
+            with open(path, "rb") as f:
+                magic, file_epoch = self.HEADER.unpack(f.read(self.HEADER.size))
+            if magic != self.MAGIC or file_epoch != epoch:
+                raise ValueError(f"{path} does not match its ledger segment")
+            self.path = path
+            self.epoch = epoch
+            self.strings = []
+            self._refs = {}
+            self._offset = self.HEADER.size
+        size = os.path.getsize(self.path)
+        if size <= self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        pos = 0
+        while pos + self.LENGTH.size <= len(data):
+            (length,) = self.LENGTH.unpack_from(data, pos)
+            end = pos + self.LENGTH.size + length
+            if end > len(data):
+                # 未写完的尾部（写入中途崩溃），下次追加时覆盖
+                break
+            self._add(data[pos + self.LENGTH.size:end].decode("utf-8"))
+            pos = end
+        self._offset += pos
+
+    def _add(self, text: str) -> int:
+        ref = len(self.strings)
+        self.strings.append(text)
+        self._refs.setdefault(text, ref)
+        return ref
+
+    def intern(self, text: str, pending: List[bytes]) -> int:
+        """返回 text 的序号；新字符串加入表中，其编码追加到 pending 等待写入"""
+        ref = self._refs.get(text)
+        if ref is None:
+            ref = self._add(text)
+            pending.append(self.encode(text))
+        return ref
+
+    def append(self, pending: List[bytes]):
+        """写入 intern 产生的新字符串（需在独占锁内调用）"""
+        if not pending:
+            return
+        data = b"".join(pending)
+        with open(self.path, "r+b") as f:
+            f.seek(self._offset)
+            f.write(data)
+            f.truncate()
+            if SYNC_WRITES:
+                f.flush()
+                os.fsync(f.fileno())
+        self._offset += len(data)
+
+
+class SegmentStorage(LedgerStore):
+    """
+    账本的二进制段存储（ledger.seg + 字符串表 ledger.<epoch>.str）
+
+    每条记录为定长的 struct（见 RECORD），数值字段直接以 int / float 存放，
+    文本字段存字符串表中的序号；读取通过 mmap 进行，扫描与聚合直接作用于
+    映射的缓冲区，不需要 csv 分词和逐字段的数值转换。
+    文件只追加：删除追加 id 为负数的墓碑记录，死记录比例超过 COMPACT_RATIO 时
+    由后台线程重写。src/migrate.py --export 可导出为与 data.csv 相同格式的 CSV。
+    """
+    # 死记录（被删除的记录 + 墓碑）占比超过该值时触发压缩
+    COMPACT_RATIO = 0.3
+    # 死记录数量下限，避免小文件频繁重写
+    COMPACT_MIN_DEAD = 64
+
+    def __init__(self, filename="ledger.seg"):
+        self.path = STORAGE_DIR / filename
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._strings = StringTable(self.path.with_suffix(".str"))
+        self._file_lock = FileLock(str(self.path) + '.lock', timeout=5.0)
+        self._mem_lock = threading.RLock()
+        # 与文件同步的内存状态，以 (size, inode, 版本号) 作为版本标识
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._epoch: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._count = 0                         # 已扫描的记录数（含墓碑）
+        self._records: Dict[int, List[int]] = {}  # id -> 未删除记录的位置
+        self._live = 0
+        self._last_id = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._rollup = MonthlyRollup()
+        self._dates = DateIndex()
+        self._generation = 0
+        self._sorted_ids: List[int] = []  # 分页用的有序 id，随 _generation 失效
+        self._sorted_generation = -1
+        self._frame: Optional[LedgerFrame] = None
+        self._frame_generation = -1
+        # 数据版本号（ledger.seg.ver），每次变更加一，用于 ETag
+        self._version = VersionCounter(str(self.path) + '.ver')
+        self._committer = GroupCommitter(self._commit_batch)
+        self._compact_event = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        self._closed = False
+        self.ensure_segment()
+
+    def ensure_segment(self):
+        """确保段文件与字符串表存在，如果不存在则创建空的账本"""
+        if os.path.exists(self.path):
+            return
+        with self._file_lock.acquire():
+            if not os.path.exists(self.path):
+                self._write_files(_new_epoch(), 0, [], [""])
+
+    def _write_files(self, epoch: int, base_id: int, records: List[bytes], strings: List[str]):
+        """
+        写出新 epoch 的字符串表与段文件（需在独占锁内调用）
+
+        新的字符串表在段文件替换之前不会被引用；段文件通过临时文件 + os.replace
+        替换，这一步即为提交点，之后才删除旧的字符串表。
+        """
+        seg_tmp = self.path.with_name(self.path.name + ".tmp")
+        StringTable.write(self._strings.path_for(epoch), epoch, strings)
+        with open(seg_tmp, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, RECORD.size, 0, epoch, base_id))
+            f.write(b"".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        # 读者在共享锁内先读段文件头，再按其中的 epoch 打开字符串表
+        os.replace(seg_tmp, self.path)
+        self._strings.remove_stale(epoch)
+
+    @staticmethod
+    def _row(record: Tuple, strings: List[str]) -> List[str]:
+        """记录还原为与 csv.reader 读回时相同的字符串行"""
+        return [
+            str(record[0]), strings[record[7]], strings[record[5]], strings[record[8]],
+            strings[record[3]], strings[record[6]], strings[record[4]],
+        ]
+
+    @staticmethod
+    def _rows(mapped, strings: List[str], positions: Iterable[int]) -> List[List[str]]:
+        """按位置批量还原记录"""
+        unpack_from = RECORD.unpack_from
+        base, size = FILE_HEADER.size, RECORD.size
+        return [
+            [str(r[0]), strings[r[7]], strings[r[5]], strings[r[8]], strings[r[3]], strings[r[6]], strings[r[4]]]
+            for r in (unpack_from(mapped, base + pos * size) for pos in positions)
+        ]
+
+    def _row_at(self, pos: int) -> List[str]:
+        return self._row(
+            RECORD.unpack_from(self._map, FILE_HEADER.size + pos * RECORD.size), self._strings.strings
+        )
+
+    @staticmethod
+    def _encode(row: List[Any], table: StringTable, pending: List[bytes]) -> bytes:
+        """将一行（id 已为整数）编码为记录，新字符串加入 table 并追加到 pending"""
+        intern = table.intern
+        row = (["" if value is None else str(value) for value in row] + [""] * len(HEADER))[:len(HEADER)]
+        record_id, date_text, event, amount_text, type_, remark, category = row
+        days = _parse_day(date_text)
+        try:
+            amount = float(amount_text) if amount_text else 0.0
+        except ValueError:
+            amount = 0.0
+        return RECORD.pack(
+            int(record_id), amount, INVALID_DATE if days is None else days,
+            intern(type_, pending), intern(category, pending),
+            intern(event, pending), intern(remark, pending),
+            intern(date_text, pending), intern(amount_text, pending),
+            0,
+        )
+
+    @staticmethod
+    def _tombstone(id_value: int) -> bytes:
+        return RECORD.pack(-id_value, 0.0, 0, 0, 0, 0, 0, 0, 0, 0)
+
+    def _apply(self, pos: int, record: Tuple, strings: List[str], dates: List[Tuple[str, int]]):
+        """将一条记录（或墓碑）应用到内存状态，新行的 (日期, 位置) 追加到 dates"""
+        record_id = record[0]
+        self._generation += 1
+        if record_id < 0:
+            group = self._records.pop(-record_id, None)
+            if group:
+                self._live -= len(group)
+                for dead in group:
+                    self._rollup.remove(self._row_at(dead))
+            self._last_id = max(self._last_id, -record_id)
+            return
+        row = self._row(record, strings)
+        self._records.setdefault(record_id, []).append(pos)
+        self._live += 1
+        self._rollup.add(row)
+        dates.append((row[1], pos))
+        self._last_id = max(self._last_id, record_id)
+
+    def _load(self):
+        """将内存状态与文件同步（需在锁内调用）：只扫描新追加的记录，重写后从头扫描"""
+        with self._mem_lock:
+            st = os.stat(self.path)
+            signature = (st.st_size, st.st_ino, self._version.get())
+            if self._signature == signature:
+                self.cache_hits += 1
+                metrics.cache_lookup("ledger", True)
+                return
+            self.cache_misses += 1
+            metrics.cache_lookup("ledger", False)
+            with open(self.path, "rb") as f:
+                magic, record_size, _, epoch, base_id = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+                if magic != MAGIC or record_size != RECORD.size:
+                    raise ValueError(f"{self.path} is not a ledger segment")
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if USE_MMAP else f.read()
+            if epoch != self._epoch:
+                self._epoch = epoch
+                self._count = 0
+                self._records = {}
+                self._live = 0
+                self._last_id = base_id
+                self._generation += 1
+                self._rollup.clear()
+                self._dates.clear()
+            self._strings.refresh(epoch)
+            # 旧的映射不显式关闭：遍历中的迭代器与列式表示可能仍在引用
+            self._map = mapped
+            start = self._count
+            count = (len(mapped) - FILE_HEADER.size) // RECORD.size
+            strings = self._strings.strings
+            view = memoryview(mapped)[FILE_HEADER.size + start * RECORD.size:FILE_HEADER.size + count * RECORD.size]
+            dates: List[Tuple[str, int]] = []
+            for pos, record in enumerate(RECORD.iter_unpack(view), start):
+                self._apply(pos, record, strings, dates)
+            view.release()
+            # 按日期顺序加入索引，桶内均为末尾追加；同一日期按位置（写入顺序）排列
+            dates.sort()
+            for date_text, pos in dates:
+                self._dates.add(date_text, pos)
+            self._count = count
+            self._signature = signature
+            metrics.rows_parsed("ledger", count - start)
+
+    def _is_live(self, pos: int, row_id: str) -> bool:
+        return pos in self._records.get(int(row_id), ())
+
+    def _live_positions(self) -> List[int]:
+        """按写入顺序返回未删除记录的位置（需在锁内调用）"""
+        return sorted(pos for group in self._records.values() for pos in group)
+
+    def version(self) -> int:
+        """当前数据版本号，不需要读取段文件"""
+        with self._file_lock.acquire(shared=True):
+            return self._version.get()
+
+    def cache_stats(self) -> Dict[str, int]:
+        """缓存命中统计"""
+        return {"hits": self.cache_hits, "misses": self.cache_misses}
+
+    def read_header(self) -> List[str]:
+        return list(HEADER)
+
+    def read_all(self) -> List[List[str]]:
+        """读取所有行（包括header），顺序与 CSV 存储一致"""
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            positions = (pos for group in self._records.values() for pos in group)
+            return [list(HEADER)] + self._rows(self._map, self._strings.strings, positions)
+
+    def read_range(self, start: Optional[str] = None, end: Optional[str] = None) -> List[List[str]]:
+        """
+        按日期区间读取（包括header），结果按日期升序
+
+        Args:
+            start: 起始日期（含），如 2026-10-01
+            end: 结束日期（含，按前缀匹配），如 2026-10-31 或 2026-10
+        """
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            rows = []
+            # 日期索引惰性删除，需确认记录仍然存活
+            for pos in self._dates.query(start, end):
+                row = self._row_at(pos)
+                if self._is_live(pos, row[0]):
+                    rows.append(row)
+            return [list(HEADER)] + rows
+
+    def read_page(self, cursor: int = 0, limit: int = 100) -> Tuple[List[List[str]], Optional[int]]:
+        """
+        按 id 升序分页读取
+
+        Args:
+            cursor: 上一页最后一行的 id（上一页返回的 next_cursor），首页为 0；
+                压缩重写段文件不影响已发出的 cursor
+            limit: 本页最多返回的行数，id 重复的多行不会被拆到两页
+
+        Returns:
+            ([header] + 本页数据行, 下一页的 cursor；没有更多数据时为 None)
+        """
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            if self._sorted_generation != self._generation:
+                self._sorted_ids = sorted(row_id for row_id in self._records if row_id > 0)
+                self._sorted_generation = self._generation
+            ids = self._sorted_ids
+            positions: List[int] = []
+            next_cursor = None
+            for i in range(bisect.bisect_right(ids, cursor), len(ids)):
+                if len(positions) >= limit:
+                    next_cursor = ids[i - 1]
+                    break
+                positions.extend(self._records[ids[i]])
+            rows = self._rows(self._map, self._strings.strings, positions)
+            metrics.rows_parsed("ledger", len(rows))
+        return [list(HEADER)] + rows, next_cursor
+
+    def iter_rows(self) -> Iterator[List[str]]:
+        """
+        逐行产出未删除的数据行（不含 header）
+
+        只在取快照时持锁：映射的区域只追加不修改，重写会替换文件而旧映射仍然有效，
+        因此之后的写入不影响本次遍历。
+        """
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            mapped, strings = self._map, self._strings.strings
+            positions = self._live_positions()
+        count = 0
+        try:
+            # 分批还原，兼顾逐行产出与批量解码的效率
+            for start in range(0, len(positions), 1000):
+                rows = self._rows(mapped, strings, positions[start:start + 1000])
+                count += len(rows)
+                yield from rows
+        finally:
+            metrics.rows_parsed("ledger", count)
+
+    def month_stats(self, month: str) -> Dict[str, Any]:
+        """某月（YYYY-MM）的收入、支出、每日支出与分类支出汇总"""
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            return self._rollup.month(month)
+
+    def frame(self) -> LedgerFrame:
+        """
+        账本的列式表示（需要 numpy）
+
+        id / 日期 / 金额列直接取自映射缓冲区上的结构化数组，没有删除记录时不复制；
+        type / category 按字符串表序号重新编码。缓存未变化时复用上次的结果。
+        """
+        _require_record_dtype()
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            with self._mem_lock:
+                if self._frame is None or self._frame_generation != self._generation:
+                    self._frame = self._build_frame()
+                    self._frame_generation = self._generation
+                return self._frame
+
+    def _build_frame(self) -> LedgerFrame:
+        records = np.frombuffer(self._map, dtype=_record_dtype, count=self._count, offset=FILE_HEADER.size)
+        if self._live != self._count:
+            records = records[np.array(self._live_positions(), dtype=np.int64)]
+        strings = self._strings.strings
+        type_codes, type_names = self._recode(records["type"], strings)
+        category_codes, category_names = self._recode(records["category"], strings)
+        return LedgerFrame(
+            records["id"], records["date"], records["amount"],
+            type_codes, type_names, category_codes, category_names,
+        )
+
+    @staticmethod
+    def _recode(refs, strings: List[str]):
+        """字符串表序号 -> 按名称排序的字典编码（与 LedgerFrame.from_rows 一致）"""
+        unique, inverse = np.unique(refs, return_inverse=True)
+        names = [strings[ref] for ref in unique]
+        order = sorted(range(len(names)), key=names.__getitem__)
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+        return rank[inverse].astype(np.int32), [names[i] for i in order]
+
+    def _append_locked(self, rows: List[List[Any]]):
+        """
+        追加若干行（需在独占锁内调用）
+
+        id 不是正整数的行由存储重新分配 id。先写字符串表再写记录，
+        中途崩溃只会留下未被引用的字符串或不完整的尾部记录，下次追加时覆盖。
+        """
+        self._load()
+        pending: List[bytes] = []
+        chunks = []
+        for row in rows:
+            row = list(row)
+            try:
+                record_id = int(row[0])
+            except (TypeError, ValueError, IndexError):
+                record_id = 0
+            if record_id <= 0:
+                record_id = self._last_id + 1
+                row = [record_id] + row[1:]
+            self._last_id = max(self._last_id, record_id)
+            chunks.append(self._encode(row, self._strings, pending))
+        try:
+            self._strings.append(pending)
+            self._write_records(chunks)
+        except BaseException:
+            # 内存中的字符串表可能已与文件不一致，下次读取时从头加载
+            self._signature = None
+            self._epoch = None
+            self._strings.epoch = None
+            raise
+
+    def _write_records(self, chunks: List[bytes]):
+        with open(self.path, "r+b") as f:
+            f.seek(FILE_HEADER.size + self._count * RECORD.size)
+            f.write(b"".join(chunks))
+            f.truncate()
+            if SYNC_WRITES:
+                f.flush()
+                os.fsync(f.fileno())
+        self._version.bump()
+        self._load()
+
+    def _rewrite_locked(self, rows: List[List[str]], base_id: int):
+        """用给定的行（id 均为正整数）重写字符串表与段文件（需在独占锁内调用）"""
+        table = StringTable(self._strings.base)
+        records = [self._encode(row, table, []) for row in rows]
+        self._write_files(_new_epoch(), base_id, records, table.strings)
+        self._version.bump()
+        self._load()
+
+    def _commit_batch(self, items: List[Tuple[bool, List[Any]]]) -> List[Optional[int]]:
+        """
+        组提交的批量写入：items 为 (是否分配 id, 行) 列表
+
+        Returns:
+            每个条目分配的 id（不分配 id 的条目为 None）
+        """
+        with self._file_lock.acquire():
+            last_id = self._current_id()
+            rows = []
+            results: List[Optional[int]] = []
+            for allocate, row in items:
+                if allocate:
+                    last_id += 1
+                    rows.append([last_id, *row])
+                    results.append(last_id)
+                else:
+                    rows.append(row)
+                    results.append(None)
+            self._append_locked(rows)
+            return results
+
+    def _current_id(self) -> int:
+        """当前已分配过的最大 id（需在锁内调用）"""
+        with self._mem_lock:
+            self._load()
+            return self._last_id
+
+    def append_row(self, row: List[Any]):
+        """追加一行（与并发的写入合并提交）"""
+        self._committer.submit((False, row))
+
+    def append_rows(self, rows: List[List[Any]]):
+        """一次加锁、一次写入追加多行"""
+        if not rows:
+            return
+        with self._file_lock.acquire():
+            self._append_locked(rows)
+
+    def insert_row(self, values: List[Any]) -> int:
+        """分配新 id 并追加一行（不含 id 列），返回分配的 id；与并发的写入合并提交"""
+        return self._committer.submit((True, values))
+
+    def insert_rows(self, values_list: List[List[Any]]) -> range:
+        """批量追加多行（不含 id 列），在一次加锁内分配连续的 id 区间"""
+        with self._file_lock.acquire():
+            first_id = self._current_id() + 1
+            ids = range(first_id, first_id + len(values_list))
+            if values_list:
+                self._append_locked([[new_id, *values] for new_id, values in zip(ids, values_list)])
+            return ids
+
+    def write_all(self, rows: List[List[Any]]):
+        """覆盖写入（header 固定为 HEADER，rows[0] 被忽略）；id 重复或非正整数的行重新分配 id"""
+        with self._file_lock.acquire():
+            seen = set()
+            keep: List[List[Any]] = []
+            reassign: List[List[Any]] = []
+            for row in rows[1:]:
+                if not row:
+                    continue
+                try:
+                    record_id = int(row[0])
+                except (TypeError, ValueError):
+                    record_id = 0
+                if record_id <= 0 or record_id in seen:
+                    reassign.append(list(row))
+                else:
+                    seen.add(record_id)
+                    keep.append([record_id, *row[1:]])
+            last_id = max(seen, default=0)
+            for offset, row in enumerate(reassign, start=1):
+                keep.append([last_id + offset, *row[1:]])
+            self._rewrite_locked(keep, 0)
+
+    def delete_by_id(self, id_value: str) -> bool:
+        """删除匹配 id 的行：只追加一条墓碑，不重写文件；返回是否找到该 id"""
+        try:
+            record_id = int(id_value)
+        except ValueError:
+            return False
+        with self._file_lock.acquire():
+            self._load()
+            if record_id not in self._records:
+                return False
+            self._write_records([self._tombstone(record_id)])
+            need_compact = self._needs_compaction()
+        if need_compact:
+            self._schedule_compaction()
+        return True
+
+    def _dead_ratio(self) -> float:
+        if self._count == 0:
+            return 0.0
+        return (self._count - self._live) / self._count
+
+    def _needs_compaction(self) -> bool:
+        dead = self._count - self._live
+        return dead >= self.COMPACT_MIN_DEAD and self._dead_ratio() > self.COMPACT_RATIO
+
+    def compact(self, force: bool = False) -> bool:
+        """
+        压缩：去掉被删除的记录、墓碑与不再引用的字符串
+
+        段文件头记录压缩前已分配过的最大 id，被删除的 id 不会复用。
+
+        Returns:
+            是否执行了重写
+        """
+        with self._file_lock.acquire():
+            self._load()
+            if self._count == self._live:
+                return False
+            if not force and not self._needs_compaction():
+                return False
+            self._rewrite_locked([self._row_at(pos) for pos in self._live_positions()], self._last_id)
+            return True
+
+    def _schedule_compaction(self):
+        """唤醒后台压缩线程"""
+        if self._closed:
+            return
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(
+                target=self._compact_loop, name=f"compact-{self.path.name}", daemon=True
+            )
+            self._compactor.start()
+        self._compact_event.set()
+
+    def _compact_loop(self):
+        while True:
+            self._compact_event.wait()
+            self._compact_event.clear()
+            if self._closed:
+                return
+            try:
+                self.compact()
+            except Exception as e:
+                print("ERROR compacting", self.path, ":", e)
+
+    def close(self):
+        """停止后台压缩线程并关闭锁文件描述符；之后再次使用会重新打开描述符（不再压缩）"""
+        self._closed = True
+        self._compact_event.set()
+        self._file_lock.close()
+
+    def fetch_id(self) -> int:
+        """获取已分配过的最大 ID 值"""
+        with self._file_lock.acquire(shared=True):
+            return self._current_id()
@@ -0,0 +1,227 @@
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from apps.utils.config import SQLITE_PATH
+except ImportError:
+    from ..utils.config import SQLITE_PATH
+
+try:
+    from apps.utils.backend import LedgerStore, BudgetStore
+except ImportError:
+    from ..utils.backend import LedgerStore, BudgetStore
+
+try:
+    from apps.utils.sqlite import Database, as_text, split_ids
+except ImportError:
+    from ..utils.sqlite import Database, as_text, split_ids
+
+try:
+    from apps.account.stats import MonthlyRollup
+    from apps.account.columnar import LedgerFrame
+except ImportError:
+    from .stats import MonthlyRollup
+    from .columnar import LedgerFrame
+
+HEADER = ["id", "date", "event", "amount", "type", "remark", "category"]
+
+SELECT_ROWS = "SELECT id, date, event, amount, type, remark, category FROM ledger"
+INSERT_ROW = "INSERT INTO ledger (id, date, event, amount, type, remark, category) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+
+def _date_bounds(start: Optional[str], end: Optional[str]) -> Tuple[str, Tuple[str, ...]]:
+    """日期区间对应的 WHERE 子句与参数；end 按前缀匹配"""
+    clauses = []
+    params = []
+    if start:
+        clauses.append("date >= ?")
+        params.append(start)
+    if end:
+        clauses.append("date <= ?")
+        params.append(end + "\uffff")
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, tuple(params)
+
+
+class SQLiteStorage(LedgerStore):
+    """
+    账本的 SQLite 存储（ledger 表）
+
+    id 为 AUTOINCREMENT 主键，删除的 id 不会复用；date、category 建有索引，
+    日期区间与按月汇总只扫描命中的行。
+    """
+
+    def __init__(self, db: Optional[Database] = None):
+        self.db = db if db is not None else Database(SQLITE_PATH)
+        # 列式表示按版本号缓存
+        self._mem_lock = threading.Lock()
+        self._frame: Optional[LedgerFrame] = None
+        self._frame_version = -1
+
+    def _insert_locked(self, conn, rows: List[List[Any]]):
+        """写入含 id 列的行（需在写事务内调用）"""
+        keep, reassign = split_ids(rows, len(HEADER))
+        conn.executemany(INSERT_ROW, keep)
+        conn.executemany(INSERT_ROW, reassign)
+
+    def version(self) -> int:
+        return Database.version(self.db.conn, "ledger")
+
+    def read_header(self) -> List[str]:
+        return list(HEADER)
+
+    def read_all(self) -> List[List[str]]:
+        rows = self.db.conn.execute(SELECT_ROWS + " ORDER BY id").fetchall()
+        return [list(HEADER)] + [as_text(row) for row in rows]
+
+    def read_range(self, start: Optional[str] = None, end: Optional[str] = None) -> List[List[str]]:
+        """
+        按日期区间读取（包括header），结果按日期升序
+
+        Args:
+            start: 起始日期（含），如 2026-10-01
+            end: 结束日期（含，按前缀匹配），如 2026-10-31 或 2026-10
+        """
+        where, params = _date_bounds(start, end)
+        rows = self.db.conn.execute(SELECT_ROWS + where + " ORDER BY date, id", params).fetchall()
+        return [list(HEADER)] + [as_text(row) for row in rows]
+
+    def read_page(self, cursor: int = 0, limit: int = 100) -> Tuple[List[List[str]], Optional[int]]:
+        """
+        按 id 分页读取：cursor 为上一页最后一行的 id
+
+        Returns:
+            ([header] + 本页数据行, 下一页的 cursor；没有更多数据时为 None)
+        """
+        rows = self.db.conn.execute(
+            SELECT_ROWS + " WHERE id > ? ORDER BY id LIMIT ?", (cursor, limit + 1)
+        ).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [list(HEADER)] + [as_text(row) for row in rows[:limit]], next_cursor
+
+    def iter_rows(self) -> Iterator[List[str]]:
+        for row in self.db.iter_query(SELECT_ROWS + " ORDER BY id"):
+            yield as_text(row)
+
+    def month_stats(self, month: str) -> Dict[str, Any]:
+        """某月（YYYY-MM）的收入、支出、每日支出与分类支出汇总"""
+        where, params = _date_bounds(month, month)
+        rollup = MonthlyRollup()
+        for row in self.db.conn.execute(SELECT_ROWS + where, params):
+            rollup.add(as_text(row))
+        return rollup.month(month)
+
+    def frame(self) -> LedgerFrame:
+        """账本的列式表示（需要 numpy），版本号未变化时复用上次构建的结果"""
+        with self._mem_lock:
+            with self.db.snapshot() as conn:
+                version = Database.version(conn, "ledger")
+                if self._frame is None or self._frame_version != version:
+                    rows = conn.execute(SELECT_ROWS + " ORDER BY id").fetchall()
+                    self._frame = LedgerFrame.from_rows([as_text(row) for row in rows])
+                    self._frame_version = version
+            return self._frame
+
+    def append_row(self, row: List[Any]):
+        self.append_rows([row])
+
+    def append_rows(self, rows: List[List[Any]]):
+        if not rows:
+            return
+        with self.db.transaction() as conn:
+            self._insert_locked(conn, rows)
+            Database.bump(conn, "ledger")
+
+    def insert_row(self, values: List[Any]) -> int:
+        return self.insert_rows([values])[0]
+
+    def insert_rows(self, values_list: List[List[Any]]) -> range:
+        """批量追加多行（不含 id 列），在一个事务内分配连续的 id 区间"""
+        with self.db.transaction() as conn:
+            first_id = Database.last_id(conn, "ledger") + 1
+            ids = range(first_id, first_id + len(values_list))
+            if values_list:
+                self._insert_locked(conn, [[new_id, *values] for new_id, values in zip(ids, values_list)])
+                Database.bump(conn, "ledger")
+            return ids
+
+    def write_all(self, rows: List[List[Any]]):
+        """覆盖写入（header 固定为 HEADER，rows[0] 被忽略）"""
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM ledger")
+            Database.reset_sequence(conn, "ledger")
+            self._insert_locked(conn, rows[1:])
+            Database.bump(conn, "ledger")
+
+    def delete_by_id(self, id_value: str) -> bool:
+        """删除匹配 id 的行，返回是否找到该 id"""
+        try:
+            id_int = int(id_value)
+        except ValueError:
+            return False
+        with self.db.transaction() as conn:
+            if not conn.execute("DELETE FROM ledger WHERE id = ?", (id_int,)).rowcount:
+                return False
+            Database.bump(conn, "ledger")
+            return True
+
+    def fetch_id(self) -> int:
+        """获取已分配过的最大 ID 值"""
+        return Database.last_id(self.db.conn, "ledger")
+
+    def close(self):
+        self.db.close()
+
+
+class SQLiteBudget(BudgetStore):
+    """预算的 SQLite 存储（budget 表，(year, month) 为主键）"""
+
+    def __init__(self, db: Optional[Database] = None):
+        self.db = db if db is not None else Database(SQLITE_PATH)
+
+    def version(self) -> int:
+        return Database.version(self.db.conn, "budget")
+
+    def write_budget(self, year: int, month: int, amount: float):
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT INTO budget (year, month, monthlyLimit) VALUES (?, ?, ?) "
+                "ON CONFLICT (year, month) DO UPDATE SET monthlyLimit = excluded.monthlyLimit",
+                (year, month, amount),
+            )
+            Database.bump(conn, "budget")
+
+    def read_budget(self, year: int, month: int) -> Optional[float]:
+        row = self.db.conn.execute(
+            "SELECT monthlyLimit FROM budget WHERE year = ? AND month = ?", (year, month)
+        ).fetchone()
+        return row[0] if row else None
+
+    def read_last_budget(self) -> Optional[Dict[str, Any]]:
+        row = self.db.conn.execute(
+            "SELECT year, month, monthlyLimit FROM budget ORDER BY year DESC, month DESC LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        year, month, monthly_limit = row
+        return {
+            "year": year,
+            "month": month,
+            "monthlyLimit": monthly_limit if monthly_limit is not None else 0
+        }
+
+    def read_all(self) -> Dict[Tuple[int, int], Optional[float]]:
+        rows = self.db.conn.execute("SELECT year, month, monthlyLimit FROM budget ORDER BY year, month")
+        return {(year, month): limit for year, month, limit in rows}
+
+    def write_all(self, limits: Dict[Tuple[int, int], Optional[float]]):
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM budget")
+            conn.executemany(
+                "INSERT INTO budget (year, month, monthlyLimit) VALUES (?, ?, ?)",
+                [(year, month, limit) for (year, month), limit in limits.items()],
+            )
+            Database.bump(conn, "budget")
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,105 @@
+import calendar
+from typing import Dict, List, Any
+
+# 账本行各字段所在列：id, date, event, amount, type, remark, category
+DATE_COL = 1
+AMOUNT_COL = 3
+TYPE_COL = 4
+CATEGORY_COL = 6
+
+
+class MonthStats:
+    """单个月份的汇总：收入、支出、每日支出与分类支出"""
+
+    def __init__(self):
+        self.count = 0
+        self.income = 0.0
+        self.expense = 0.0
+        self.daily: Dict[int, float] = {}
+        self.categories: Dict[str, float] = {}
+
+    def update(self, day: int, amount: float, type_: str, category: str, sign: int):
+        self.count += sign
+        if type_ == "income":
+            self.income += sign * amount
+        elif type_ == "expense":
+            self.expense += sign * amount
+            self.daily[day] = self.daily.get(day, 0.0) + sign * amount
+            self.categories[category] = self.categories.get(category, 0.0) + sign * amount
+
+
+class MonthlyRollup:
+    """
+    按月份 / 分类增量维护的账本汇总
+
+    由 Storage 在追加、删除时调用 add / remove，无需重新扫描 data.csv。
+    """
+
+    def __init__(self):
+        self._months: Dict[str, MonthStats] = {}
+
+    def clear(self):
+        self._months = {}
+
+    def _update(self, row: List[str], sign: int):
+        if len(row) <= CATEGORY_COL:
+            return
+        date = row[DATE_COL]
+        try:
+            amount = float(row[AMOUNT_COL]) if row[AMOUNT_COL] else 0.0
+            day = int(date[8:10])
+        except ValueError:
+            return
+        month = date[:7]
+        stats = self._months.get(month)
+        if stats is None:
+            stats = self._months[month] = MonthStats()
+        stats.update(day, amount, row[TYPE_COL], row[CATEGORY_COL], sign)
+        if stats.count <= 0:
+            del self._months[month]
+
+    def add(self, row: List[str]):
+        self._update(row, 1)
+
+    def state(self) -> Dict[str, list]:
+        """可序列化的汇总状态（用于预热快照）"""
+        return {
+            month: [stats.count, stats.income, stats.expense, dict(stats.daily), dict(stats.categories)]
+            for month, stats in self._months.items()
+        }
+
+    def restore(self, state: Dict[str, list]):
+        """从 state 的结果恢复"""
+        self._months = {}
+        for month, (count, income, expense, daily, categories) in state.items():
+            stats = self._months[month] = MonthStats()
+            stats.count, stats.income, stats.expense = count, income, expense
+            stats.daily, stats.categories = daily, categories
+
+    def remove(self, row: List[str]):
+        self._update(row, -1)
+
+    def month(self, month: str) -> Dict[str, Any]:
+        """
+        返回某月（YYYY-MM）的汇总
+
+        dailyExpense 覆盖该月每一天，categoryExpense 只包含有支出的分类。
+        """
+        year, mon = int(month[:4]), int(month[5:7])
+        days = calendar.monthrange(year, mon)[1]
+        stats = self._months.get(month) or MonthStats()
+        return {
+            "month": month,
+            "count": stats.count,
+            "totalIncome": round(stats.income, 2),
+            "totalExpense": round(stats.expense, 2),
+            "dailyExpense": [
+                {"day": day, "amount": round(stats.daily.get(day, 0.0), 2)}
+                for day in range(1, days + 1)
+            ],
+            "categoryExpense": [
+                {"name": name, "value": round(value, 2)}
+                for name, value in stats.categories.items()
+                if round(value, 2) != 0
+            ],
+        }
@@ -1,28 +1,112 @@
 import csv
+import io
 import os
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from pathlib import Path
 
 try:
-    from apps.utils.config import STORAGE_DIR
+    from apps.utils.config import STORAGE_DIR, SYNC_WRITES, WARM_SNAPSHOT
 except ImportError:
-    from ..utils.config import STORAGE_DIR
+    from ..utils.config import STORAGE_DIR, SYNC_WRITES, WARM_SNAPSHOT
 
 try:
     from apps.utils.lock import FileLock
 except:
     from ..utils.lock import FileLock
 
-class Storage:
+try:
+    from apps.utils.utils import read_tail_rows, max_int_id, gc_paused
+except ImportError:
+    from ..utils.utils import read_tail_rows, max_int_id, gc_paused
+
+try:
+    from apps.utils.commit import GroupCommitter
+except ImportError:
+    from ..utils.commit import GroupCommitter
+
+try:
+    from apps.utils.version import VersionCounter
+except ImportError:
+    from ..utils.version import VersionCounter
+
+try:
+    from apps.utils.snapshot import Snapshot
+except ImportError:
+    from ..utils.snapshot import Snapshot
+
+try:
+    from apps.utils import metrics
+except ImportError:
+    from ..utils import metrics
+
+try:
+    from apps.utils.backend import LedgerStore
+except ImportError:
+    from ..utils.backend import LedgerStore
+
+try:
+    from apps.account.index import RowIndex, DateIndex
+    from apps.account.stats import MonthlyRollup
+    from apps.account.columnar import LedgerFrame
+except ImportError:
+    from .index import RowIndex, DateIndex
+    from .stats import MonthlyRollup
+    from .columnar import LedgerFrame
+
+class Storage(LedgerStore):
     """
     负责CSV的 读 / 写 / 删除 / 覆盖
+
+    删除以追加墓碑行（id 列为 "-<id>"）的方式记录，读取时过滤；
+    死行比例超过 COMPACT_RATIO 时由后台线程压缩重写文件。
     """
+    # 死行（被删除的行 + 墓碑行）占比超过该值时触发压缩
+    COMPACT_RATIO = 0.3
+    # 死行数量下限，避免小文件频繁重写
+    COMPACT_MIN_DEAD = 64
+
     def __init__(self, filename="data.csv"):
         self.path = STORAGE_DIR / filename
         self.path.parent.mkdir(parents=True, exist_ok=True)
         # 初始化文件锁实例
         lockfile_path = str(self.path) + '.lock'
         self._file_lock = FileLock(lockfile_path, timeout=5.0)
+        # 共享锁下多个读线程可能同时刷新缓存 / 索引，用进程内锁串行化
+        self._mem_lock = threading.RLock()
+        # 解析结果缓存，以文件的 (mtime, size, inode) 作为版本标识
+        self._header: List[str] = []
+        self._records: Optional[Dict[str, List[List[str]]]] = None
+        self._signature: Optional[Tuple[int, int, int, int]] = None
+        self._physical = 0  # 文件中的数据行数（含墓碑）
+        self._live = 0      # 未被删除的数据行数
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # 按月汇总与日期索引，随缓存增量更新
+        self._rollup = MonthlyRollup()
+        self._dates = DateIndex()
+        # 缓存每次变化递增，列式表示据此判断是否需要重建
+        self._generation = 0
+        self._frame: Optional[LedgerFrame] = None
+        self._frame_generation = -1
+        # id 序列：分配与追加在同一临界区内完成
+        self._last_id: Optional[int] = None
+        self._id_signature: Optional[Tuple[int, int, int, int]] = None
+        # 数据版本号（data.csv.ver），每次变更加一，用于 ETag
+        self._version = VersionCounter(str(self.path) + '.ver')
+        # 已分配过的最大 id（data.csv.seq），在独占锁内先于数据写入；
+        # 批量删除后文件末尾只剩墓碑，压缩后被删除的 id 也不在文件中，不能从数据恢复
+        self._sequence = VersionCounter(str(self.path) + '.seq')
+        # 组提交：并发的 append_row / insert_row 合并为一次写入
+        self._committer = GroupCommitter(self._commit_batch)
+        # 行偏移索引（data.csv.idx），用于分页时直接定位
+        self._index = RowIndex(Path(str(self.path) + '.idx'))
+        # 预热快照（data.csv.snap），config.WARM_SNAPSHOT 开启时使用
+        self._snapshot = Snapshot(str(self.path) + '.snap')
+        # 后台压缩线程，首次需要时启动
+        self._compact_event = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        self._closed = False
         self.ensure_csv()
         
 
@@ -34,69 +118,487 @@ class Storage:
                 writer = csv.writer(f)
                 writer.writerow(["id", "date", "event", "amount", "type", "remark", "category"])
 
+    def _file_signature(self) -> Tuple[int, int, int, int]:
+        """
+        当前文件版本 (mtime, size, inode, 版本号)：任一进程修改文件都会改变该值
+
+        mtime 精度有限、重写后 inode 可能被复用，因此同时比较版本号
+        （每次写入在独占锁内加一），多个 worker 进程据此判断缓存是否过期。
+        """
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino, self._version.get())
+
+    @staticmethod
+    def _as_text(row: List[Any]) -> List[str]:
+        """将待写入的行转换为 csv.reader 读回时的形式"""
+        return ["" if value is None else str(value) for value in row]
+
+    @staticmethod
+    def is_tombstone(row: List[str]) -> bool:
+        """墓碑行：id 列以 "-" 开头，表示删除此前出现的同 id 行"""
+        return bool(row) and row[0].startswith("-")
+
+    def _tombstone(self, id_value: str) -> List[str]:
+        return ["-" + id_value] + [""] * (len(self._header) - 1)
+
+    def _apply(self, row: List[str]):
+        """将一行数据（或墓碑）应用到缓存"""
+        if not row:
+            return
+        self._physical += 1
+        self._generation += 1
+        if self.is_tombstone(row):
+            group = self._records.pop(row[0][1:], None)
+            if group:
+                self._live -= len(group)
+                for dead in group:
+                    self._rollup.remove(dead)
+        else:
+            self._records.setdefault(row[0], []).append(row)
+            self._live += 1
+            self._rollup.add(row)
+            if len(row) > 1:
+                self._dates.add(row[1], row)
+
+    def _rebuild(self, header: List[str], rows: Iterable[List[str]]):
+        """根据完整的文件内容重建缓存"""
+        self._header = header
+        self._records = {}
+        self._physical = 0
+        self._live = 0
+        self._generation += 1
+        self._rollup.clear()
+        self._dates.clear()
+        for row in rows:
+            self._apply(row)
+
+    def _load(self) -> Dict[str, List[List[str]]]:
+        """读取已解析的记录（需在锁内调用），文件未变化时直接命中缓存"""
+        with self._mem_lock:
+            signature = self._file_signature()
+            if self._records is not None and self._signature == signature:
+                self.cache_hits += 1
+                metrics.cache_lookup("ledger", True)
+                return self._records
+            self.cache_misses += 1
+            metrics.cache_lookup("ledger", False)
+            if WARM_SNAPSHOT and self._restore_snapshot(signature):
+                return self._records
+            with open(self.path, "r", encoding="utf-8") as f, gc_paused():
+                reader = csv.reader(f)
+                self._rebuild(next(reader, []), reader)
+            self._signature = signature
+            metrics.rows_parsed("ledger", self._physical)
+            return self._records
+
+    def _restore_snapshot(self, signature: Tuple[int, int, int, int]) -> bool:
+        """从与文件版本一致的预热快照恢复缓存（需持有 self._mem_lock），没有可用快照时返回 False"""
+        state = self._snapshot.load(signature)
+        if state is None:
+            return False
+        rows = state["rows"]
+        records: Dict[str, List[List[str]]] = {}
+        with gc_paused():
+            for row in rows:
+                records.setdefault(row[0], []).append(row)
+            self._dates.restore(*state["dates"], rows)
+        self._header = state["header"]
+        self._records = records
+        self._physical = state["physical"]
+        self._live = len(rows)
+        self._generation += 1
+        self._rollup.restore(state["rollup"])
+        self._signature = signature
+        return True
+
+    def save_snapshot(self) -> bool:
+        """
+        将与文件一致的缓存保存为预热快照，返回是否写入
+
+        缓存未加载、已过期或快照已是当前版本时跳过。重复的字段值（日期、类型、
+        分类等）在快照中只保存一份，载入后各行共享同一个字符串对象。
+        """
+        with self._file_lock.acquire(shared=True), self._mem_lock:
+            signature = self._file_signature()
+            if self._records is None or self._signature != signature:
+                return False
+            if self._snapshot.signature() == signature:
+                return False
+            values: Dict[str, str] = {}
+            rows = []
+            refs: Dict[int, int] = {}
+            for group in self._records.values():
+                for row in group:
+                    refs[id(row)] = len(rows)
+                    rows.append(row[:1] + [values.setdefault(value, value) for value in row[1:]])
+            seq, buckets = self._dates.state(refs)
+            state = {
+                "header": list(self._header),
+                "rows": rows,
+                "physical": self._physical,
+                "rollup": self._rollup.state(),
+                "dates": (seq, {
+                    month: ([values.setdefault(date, date) for date in dates], seqs, positions)
+                    for month, (dates, seqs, positions) in buckets.items()
+                }),
+            }
+            self._snapshot.save(signature, state)
+            return True
+
+    def _load_index(self) -> Tuple[int, int, int, int]:
+        """确保行偏移索引与文件一致（需在锁内调用），返回当前文件版本"""
+        with self._mem_lock:
+            signature = self._file_signature()
+            if not self._index.load(signature):
+                self._index.rebuild(self.path, signature)
+                metrics.rows_parsed("ledger_index", len(self._index.ids))
+            return signature
+
+    def _live_rows(self) -> List[List[str]]:
+        """按写入顺序返回未删除的数据行（需在锁内调用）"""
+        return [row for group in self._load().values() for row in group]
+
+    def month_stats(self, month: str) -> Dict[str, Any]:
+        """某月（YYYY-MM）的收入、支出、每日支出与分类支出汇总"""
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            return self._rollup.month(month)
+
+    def frame(self) -> LedgerFrame:
+        """
+        账本的列式表示（需要 numpy），用于向量化的求和、分组与日期过滤
+
+        缓存未变化时复用上次构建的结果。
+        """
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            with self._mem_lock:
+                if self._frame is None or self._frame_generation != self._generation:
+                    self._frame = LedgerFrame.from_rows(self._live_rows())
+                    self._frame_generation = self._generation
+                return self._frame
+
+    def version(self) -> int:
+        """当前数据版本号，不需要解析 CSV"""
+        with self._file_lock.acquire(shared=True):
+            return self._version.get()
+
+    def cache_stats(self) -> Dict[str, int]:
+        """缓存命中统计"""
+        return {"hits": self.cache_hits, "misses": self.cache_misses}
+
     def read_all(self) -> List[List[str]]:
         """读取所有行（包括header）"""
+        with self._file_lock.acquire(shared=True):
+            rows = self._live_rows()
+            # 返回副本，避免调用方修改缓存内容
+            return [list(self._header)] + [list(row) for row in rows]
+
+    def read_range(self, start: Optional[str] = None, end: Optional[str] = None) -> List[List[str]]:
+        """
+        按日期区间读取（包括header），结果按日期升序
+
+        Args:
+            start: 起始日期（含），如 2026-10-01
+            end: 结束日期（含，按前缀匹配），如 2026-10-31 或 2026-10
+        """
+        with self._file_lock.acquire(shared=True):
+            records = self._load()
+            rows = [
+                list(row) for row in self._dates.query(start, end)
+                # 日期索引惰性删除，需确认行仍然存活
+                if any(live is row for live in records.get(row[0], ()))
+            ]
+            return [list(self._header)] + rows
+
+    def iter_rows(self) -> Iterator[List[str]]:
+        """
+        逐行产出未删除的数据行（不含 header）
+
+        只在打开文件时持锁；之后的追加不影响本次遍历，压缩通过 os.replace
+        替换文件，已打开的句柄仍指向旧文件，因此遍历得到的是一致的快照。
+        """
+        with self._file_lock.acquire(shared=True):
+            self._load_index()
+            count, is_live = self._index.snapshot()
+            f = open(self.path, "r", newline="", encoding="utf-8")
+        with f:
+            reader = csv.reader(f)
+            next(reader, None)
+            pos = 0
+            try:
+                for row in reader:
+                    if not row:
+                        continue
+                    if pos >= count:
+                        break
+                    if is_live(pos):
+                        yield row
+                    pos += 1
+            finally:
+                metrics.rows_parsed("ledger", pos)
+
+    def read_header(self) -> List[str]:
+        """读取 header 行"""
+        with open(self.path, "r", newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), [])
+
+    def read_page(self, cursor: int = 0, limit: int = 100) -> Tuple[List[List[str]], Optional[int]]:
+        """
+        按 id 升序分页读取，借助行偏移索引只解析本页涉及的行
+
+        Args:
+            cursor: 上一页最后一行的 id（上一页返回的 next_cursor），首页为 0；
+                压缩、重写文件不影响已发出的 cursor
+            limit: 本页最多返回的行数
+
+        Returns:
+            ([header] + 本页数据行, 下一页的 cursor；没有更多数据时为 None)
+        """
+        with self._file_lock.acquire(shared=True):
+            signature = self._load_index()
+            positions, next_cursor = self._index.page(cursor, limit)
+            rows = self._index.read_rows(self.path, positions, signature[1])
+            metrics.rows_parsed("ledger", len(rows))
+            header = self.read_header()
+        return [header] + rows, next_cursor
+
+    def _current_id(self) -> int:
+        """当前最大 id（需在锁内调用），文件被其他进程修改后从末尾重新恢复"""
+        with self._mem_lock:
+            return self._recover_id()
+
+    def _recover_id(self) -> int:
+        signature = self._file_signature()
+        if self._last_id is not None and self._id_signature == signature:
+            return self._last_id
+        if self._sequence.exists():
+            # 末尾的行兜底：不维护 data.csv.seq 的写入者（旧版本进程）追加的行
+            last_id = max(self._sequence.get(), max_int_id(read_tail_rows(self.path)))
+        else:
+            # 没有 data.csv.seq 的旧文件：取行偏移索引中出现过的最大 id，下次追加时写入
+            self._load_index()
+            last_id = self._index.max_id()
+        if self._last_id is not None and self._id_signature is not None \
+                and self._id_signature[2] == signature[2]:
+            # 同一文件上的追加与压缩不会让 id 回退
+            last_id = max(last_id, self._last_id)
+        self._last_id = last_id
+        self._id_signature = signature
+        return last_id
+
+    def _append_locked(self, rows: List[List[Any]]):
+        """追加若干行并同步缓存与 id 序列（需在锁内调用）"""
+        signature = self._file_signature()
+        cached = self._records is not None and self._signature == signature
+        text_rows = [self._as_text(row) for row in rows]
+        # 先记录 id 序列：写入中途崩溃时只会跳过 id，不会重复分配
+        self._sequence.advance(max(max_int_id(text_rows), self._current_id()))
+        sequenced = self._last_id is not None and self._id_signature == signature
+        # 逐行编码以得到每行的字节偏移，再一次性写入
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        chunks = []
+        entries = []
+        offset = signature[1]
+        for row in text_rows:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            data = buffer.getvalue().encode("utf-8")
+            if row:
+                entries.append((RowIndex.parse_id(row[0]), offset))
+            offset += len(data)
+            chunks.append(data)
+        with open(self.path, "ab") as f:
+            f.write(b"".join(chunks))
+            if SYNC_WRITES:
+                f.flush()
+                os.fsync(f.fileno())
+        self._version.bump()
+        previous, signature = signature, self._file_signature()
+        self._index.extend(entries, previous, signature)
+        if cached:
+            # 缓存与写入前的文件一致，增量追加即可
+            for row in text_rows:
+                self._apply(row)
+            self._signature = signature
+        else:
+            self._records = None
+        if sequenced:
+            self._last_id = max(self._last_id, max_int_id(text_rows))
+            self._id_signature = signature
+
+    def _rewrite_locked(self, header: List[str], rows: List[List[str]]):
+        """通过临时文件 + os.replace 原子地重写整个文件（需在锁内调用）"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._version.bump()
+        self._index.invalidate()
+        self._rebuild(header, rows)
+        self._signature = self._file_signature()
+
+    def _commit_batch(self, items: List[Tuple[bool, List[Any]]]) -> List[Optional[int]]:
+        """
+        组提交的批量写入：items 为 (是否分配 id, 行) 列表
+
+        Returns:
+            每个条目分配的 id（不分配 id 的条目为 None）
+        """
         with self._file_lock.acquire():
-            with open(self.path, "r", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                return list(reader)
+            last_id = self._current_id()
+            rows = []
+            results: List[Optional[int]] = []
+            for allocate, row in items:
+                if allocate:
+                    last_id += 1
+                    rows.append([last_id, *row])
+                    results.append(last_id)
+                else:
+                    rows.append(row)
+                    results.append(None)
+            self._append_locked(rows)
+            return results
 
     def append_row(self, row: List[Any]):
-        """追加一行"""
+        """追加一行（与并发的写入合并提交）"""
+        self._committer.submit((False, row))
+
+    def append_rows(self, rows: List[List[Any]]):
+        """一次加锁、一次写入追加多行"""
+        if not rows:
+            return
         with self._file_lock.acquire():
-            with open(self.path, "a", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(row)
+            self._append_locked(rows)
+
+    def insert_row(self, values: List[Any]) -> int:
+        """分配新 id 并追加一行（不含 id 列），返回分配的 id；与并发的写入合并提交"""
+        return self._committer.submit((True, values))
+
+    def insert_rows(self, values_list: List[List[Any]]) -> range:
+        """
+        批量追加多行（不含 id 列），分配连续的 id 区间
+
+        所有行在一次加锁内以一次写入完成。
+
+        Returns:
+            分配的 id 区间
+        """
+        with self._file_lock.acquire():
+            first_id = self._current_id() + 1
+            ids = range(first_id, first_id + len(values_list))
+            if values_list:
+                self._append_locked([[new_id, *values] for new_id, values in zip(ids, values_list)])
+            return ids
 
     def write_all(self, rows: List[List[Any]]):
         """覆盖写入"""
         with self._file_lock.acquire():
-            with open(self.path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerows(rows)
+            text_rows = [self._as_text(row) for row in rows]
+            self._last_id = max_int_id(text_rows[1:])
+            self._sequence.set(self._last_id)
+            self._rewrite_locked(text_rows[0], text_rows[1:])
+            self._id_signature = self._signature
 
-    def delete_by_id(self, id_value: str):
-        """删除匹配 id 的行"""
+    def delete_by_id(self, id_value: str) -> bool:
+        """删除匹配 id 的行：只追加一条墓碑，不重写文件；返回是否找到该 id"""
         with self._file_lock.acquire():
-            # 在锁内直接读取，避免嵌套锁
-            with open(self.path, "r", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-            
-            header, data = rows[0], rows[1:]
-            new_rows = [header] + [row for row in data if row[0] != id_value]
-            
-            # 在同一锁内写回
-            with open(self.path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerows(new_rows)
+            if id_value not in self._load():
+                return False
+            self._append_locked([self._tombstone(id_value)])
+            need_compact = self._needs_compaction()
+        if need_compact:
+            self._schedule_compaction()
+        return True
+
+    def dead_ratio(self) -> float:
+        """死行占文件数据行的比例"""
+        with self._file_lock.acquire(shared=True):
+            self._load()
+            return self._dead_ratio()
+
+    def _dead_ratio(self) -> float:
+        if self._physical == 0:
+            return 0.0
+        return (self._physical - self._live) / self._physical
+
+    def _needs_compaction(self) -> bool:
+        dead = self._physical - self._live
+        return dead >= self.COMPACT_MIN_DEAD and self._dead_ratio() > self.COMPACT_RATIO
+
+    def compact(self, force: bool = False) -> bool:
+        """
+        压缩文件：去掉被删除的行和墓碑行
+
+        Args:
+            force: 为 True 时忽略阈值，只要存在死行就重写
+
+        Returns:
+            是否执行了重写
+        """
+        with self._file_lock.acquire():
+            self._load()
+            if self._physical == self._live:
+                return False
+            if not force and not self._needs_compaction():
+                return False
+            sequenced = self._last_id is not None and self._id_signature == self._signature
+            self._rewrite_locked(self._header, self._live_rows())
+            if sequenced:
+                self._id_signature = self._signature
+            return True
+
+    def _schedule_compaction(self):
+        """唤醒后台压缩线程"""
+        if self._closed:
+            return
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(
+                target=self._compact_loop, name=f"compact-{self.path.name}", daemon=True
+            )
+            self._compactor.start()
+        self._compact_event.set()
+
+    def _compact_loop(self):
+        while True:
+            self._compact_event.wait()
+            self._compact_event.clear()
+            if self._closed:
+                return
+            try:
+                self.compact()
+            except Exception as e:
+                print("ERROR compacting", self.path, ":", e)
+
+    def close(self):
+        """
+        停止后台压缩线程并关闭锁文件描述符；之后再次使用会重新打开描述符（不再压缩）
+
+        config.WARM_SNAPSHOT 开启时先保存预热快照。
+        """
+        if WARM_SNAPSHOT and not self._closed:
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                print("ERROR saving snapshot", self.path, ":", e)
+        self._closed = True
+        self._compact_event.set()
+        self._file_lock.close()
+
     def fetch_id(self):
         """获取当前最大的 ID 值"""
-        with self._file_lock.acquire():
-            # 在锁内直接读取，确保并发安全
-            with open(self.path, "r", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-            if len(rows) <= 1:
-                return 0
-
-            max_id = 0
-            for row in rows[1:]:
-                if not row:
-                    continue
-                raw = row[0]
-                try:
-                    val = int(raw)
-                    if val > max_id:
-                        max_id = val
-                except Exception:
-                    # 忽略无法解析为整数的 id（如空字符串或 UUID）
-                    continue
-
-            return max_id
+        with self._file_lock.acquire(shared=True):
+            # 在锁内读取，确保并发安全
+            return self._current_id()
     
 
 
     
 
-    
\ No newline at end of file
+    
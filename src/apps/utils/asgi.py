@@ -0,0 +1,195 @@
+import asyncio
+import contextvars
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from apps.utils.lock import WaitBudget, set_wait_budget
+except ImportError:
+    from .lock import WaitBudget, set_wait_budget
+
+
+class AsyncWSGI:
+    """
+    在 asyncio 事件循环上运行 WSGI 应用（ASGI 3 接口）
+
+    连接的接收与发送都在事件循环上完成，只有执行 WSGI 应用（存储读写、
+    文件锁等待）时才占用线程池中的线程，空闲或慢速的连接不占用线程。
+
+    流式响应（is_stream 判定）使用独立的线程池，每生成一块数据就归还线程，
+    发送时的背压在事件循环上等待；因此长时间的流式请求不会挤占普通请求。
+
+    视图是同步的，文件锁的等待无法交还事件循环，等待期间仍占用一个线程。
+    lock_wait / lock_waiters 为线程池中的请求设置 WaitBudget：单次锁等待最长
+    lock_wait 秒，同时等待锁的线程不超过 lock_waiters 个，超出时请求立即失败，
+    其余线程继续处理不竞争锁的请求。
+    """
+
+    def __init__(self, wsgi_app: Callable, workers: int = 32, stream_workers: int = 8,
+                 is_stream: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                 lock_wait: Optional[float] = None, lock_waiters: Optional[int] = None):
+        """
+        Args:
+            wsgi_app: WSGI 应用
+            workers: 普通请求的线程数
+            stream_workers: 流式请求的线程数
+            is_stream: 根据 ASGI scope 判断是否为流式请求
+            lock_wait: 单次锁等待的最长秒数，None 表示只受 FileLock 自身的超时限制
+            lock_waiters: 同时等待锁的线程数上限，默认为 workers 的四分之一
+        """
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="asgi")
+        self.stream_executor = ThreadPoolExecutor(stream_workers, thread_name_prefix="asgi-stream")
+        self.is_stream = is_stream or (lambda scope: False)
+        self.lock_budget: Optional[WaitBudget] = None
+        if lock_wait is not None or lock_waiters is not None:
+            self.lock_budget = WaitBudget(
+                lock_wait if lock_wait is not None else float("inf"),
+                lock_waiters if lock_waiters is not None else max(1, workers // 4),
+            )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                self.stream_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _read_body(receive) -> Optional[bytes]:
+        """读取完整的请求体，客户端提前断开时返回 None"""
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    @staticmethod
+    def _environ(scope: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+        """由 ASGI scope 构建 WSGI environ（PEP 3333）"""
+        server = scope.get("server") or ("localhost", 80)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]) if server[1] is not None else "80",
+            "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        if scope.get("client"):
+            environ["REMOTE_ADDR"] = scope["client"][0]
+            environ["REMOTE_PORT"] = str(scope["client"][1])
+        for raw_name, raw_value in scope.get("headers", []):
+            name = raw_name.decode("latin-1").upper().replace("-", "_")
+            value = raw_value.decode("latin-1")
+            if name == "CONTENT_TYPE":
+                key = "CONTENT_TYPE"
+            elif name == "CONTENT_LENGTH":
+                key = "CONTENT_LENGTH"
+            else:
+                key = "HTTP_" + name
+            # 同名请求头按 RFC 7230 以逗号合并
+            environ[key] = environ[key] + "," + value if key in environ else value
+        return environ
+
+    def _start(self, environ: Dict[str, Any]):
+        """
+        调用 WSGI 应用（在线程池中执行）
+
+        Returns:
+            (状态码, 响应头, 响应体迭代器, 应用返回的可迭代对象)
+        """
+        response: List[Any] = []
+        # 在请求的 contextvars 上下文中设置，流式响应的后续各块同样受限
+        set_wait_budget(self.lock_budget)
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            if exc_info is not None and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [int(status.split(" ", 1)[0]), headers]
+
+        result = self.wsgi_app(environ, start_response)
+        return response[0], response[1], iter(result), result
+
+    @staticmethod
+    def _close(result):
+        if hasattr(result, "close"):
+            result.close()
+
+    def _run_buffered(self, environ: Dict[str, Any]):
+        """普通请求：调用应用并读完整个响应体，只占用一次线程"""
+        status, headers, iterator, result = self._start(environ)
+        try:
+            body = b"".join(iterator)
+        finally:
+            self._close(result)
+        return status, headers, body
+
+    async def _http(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        environ = self._environ(scope, body)
+        loop = asyncio.get_running_loop()
+        if not self.is_stream(scope):
+            status, headers, body = await loop.run_in_executor(
+                self.executor, contextvars.copy_context().run, self._run_buffered, environ
+            )
+            await send({"type": "http.response.start", "status": status, "headers": self._headers(headers)})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        # 同一响应的各块可能在不同线程中生成，统一在一个 contextvars 上下文中执行，
+        # 保证 stream_with_context 等依赖上下文变量的生成器在各块之间可见
+        context = contextvars.copy_context()
+        status, headers, iterator, result = await loop.run_in_executor(
+            self.stream_executor, context.run, self._start, environ
+        )
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send({"type": "http.response.start", "status": status, "headers": self._headers(headers)})
+            while not disconnected.is_set():
+                chunk = await loop.run_in_executor(self.stream_executor, context.run, next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not disconnected.is_set():
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.cancel()
+            await loop.run_in_executor(self.stream_executor, context.run, self._close, result)
+
+    @staticmethod
+    def _headers(headers: List[Tuple[str, str]]) -> List[Tuple[bytes, bytes]]:
+        return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
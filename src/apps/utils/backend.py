@@ -0,0 +1,242 @@
+"""
+存储接口与后端选择
+
+LedgerStore / TodoStore / BudgetStore 描述 app.py 依赖的存储操作，
+CSV、SQLite、二进制段与按月分区（后两者仅账本）后端分别实现；open_stores 按 config.STORAGE_BACKEND 创建实例。
+多账本时每个账本的文件位于 storage/ledgers/<账本 id>/ 下，默认账本仍使用 storage/ 下的文件。
+"""
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from apps.utils.config import STORAGE_BACKEND, STORAGE_DIR, SQLITE_PATH
+except ImportError:
+    from ..utils.config import STORAGE_BACKEND, STORAGE_DIR, SQLITE_PATH
+
+# 账本 id：字母或数字开头，由字母、数字、"_"、"-" 组成，同时用作目录名
+LEDGER_ID_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,63}")
+
+
+class LedgerStore(ABC):
+    """账本存储：行为 [id, date, event, amount, type, remark, category]，均为字符串"""
+
+    @abstractmethod
+    def version(self) -> int:
+        """当前数据版本号，每次变更加一"""
+
+    @abstractmethod
+    def read_header(self) -> List[str]:
+        """读取 header 行"""
+
+    @abstractmethod
+    def read_all(self) -> List[List[str]]:
+        """读取所有行（包括header）"""
+
+    @abstractmethod
+    def read_range(self, start: Optional[str] = None, end: Optional[str] = None) -> List[List[str]]:
+        """按日期区间读取（包括header），结果按日期升序；end 按前缀匹配"""
+
+    @abstractmethod
+    def read_page(self, cursor: int = 0, limit: int = 100) -> Tuple[List[List[str]], Optional[int]]:
+        """按 id 升序分页读取（cursor 为上一页最后一行的 id），返回 ([header] + 本页数据行, 下一页的 cursor 或 None)"""
+
+    @abstractmethod
+    def iter_rows(self) -> Iterator[List[str]]:
+        """逐行产出数据行（不含 header），遍历的是调用时的一致快照"""
+
+    @abstractmethod
+    def month_stats(self, month: str) -> Dict[str, Any]:
+        """某月（YYYY-MM）的汇总，格式见 MonthlyRollup.month"""
+
+    @abstractmethod
+    def frame(self):
+        """账本的列式表示 LedgerFrame（需要 numpy）"""
+
+    @abstractmethod
+    def append_row(self, row: List[Any]):
+        """追加一行（含 id 列）"""
+
+    @abstractmethod
+    def append_rows(self, rows: List[List[Any]]):
+        """追加多行（含 id 列）"""
+
+    @abstractmethod
+    def insert_row(self, values: List[Any]) -> int:
+        """分配新 id 并追加一行（不含 id 列），返回分配的 id"""
+
+    @abstractmethod
+    def insert_rows(self, values_list: List[List[Any]]) -> range:
+        """批量追加多行（不含 id 列），返回分配的连续 id 区间"""
+
+    @abstractmethod
+    def write_all(self, rows: List[List[Any]]):
+        """覆盖写入（rows[0] 为 header）"""
+
+    @abstractmethod
+    def delete_by_id(self, id_value: str) -> bool:
+        """删除匹配 id 的行，返回是否找到该 id"""
+
+    @abstractmethod
+    def fetch_id(self) -> int:
+        """获取当前最大的 ID 值"""
+
+    def close(self):
+        """释放文件描述符与后台线程；之后再次使用会重新打开"""
+
+
+class TodoStore(ABC):
+    """TODO 存储：行为 [id, uuid, title, description, completed, priority, dueDate, category, createdAt]"""
+
+    @abstractmethod
+    def version(self) -> int:
+        """当前数据版本号，每次变更加一"""
+
+    @abstractmethod
+    def read_all(self) -> List[List[str]]:
+        """读取所有行（包括header）"""
+
+    @abstractmethod
+    def read_versioned(self) -> Tuple[int, List[List[str]]]:
+        """一致地读取版本号与所有行（包括header）"""
+
+    @abstractmethod
+    def iter_rows(self) -> Iterator[List[str]]:
+        """逐行产出数据行（不含 header）"""
+
+    @abstractmethod
+    def get_by_uuid(self, uuid: str) -> Optional[List[str]]:
+        """按 uuid 读取一行"""
+
+    @abstractmethod
+    def append_row(self, row: List[Any]):
+        """追加一行（含 id 列）"""
+
+    @abstractmethod
+    def insert_row(self, values: List[Any]) -> int:
+        """分配新 id 并追加一行（不含 id 列），返回分配的 id"""
+
+    @abstractmethod
+    def update_by_uuid(self, uuid: str, fields: Dict[str, Any]) -> bool:
+        """更新 uuid 对应行的若干字段，返回是否找到该 uuid"""
+
+    @abstractmethod
+    def delete_by_uuid(self, uuid: str) -> bool:
+        """删除 uuid 对应的行，返回是否找到该 uuid"""
+
+    @abstractmethod
+    def apply_changes(self, base_version: int, changes: List[List[Any]],
+                      removed: List[str]) -> Tuple[bool, int]:
+        """基于 base_version 增量同步，返回 (是否应用成功, 当前版本号)"""
+
+    @abstractmethod
+    def write_all(self, rows: List[List[Any]]):
+        """覆盖写入（rows[0] 为 header）"""
+
+    @abstractmethod
+    def delete_by_id(self, id_value: str):
+        """删除匹配 id 的行"""
+
+    @abstractmethod
+    def fetch_id(self) -> int:
+        """获取当前最大的 ID 值"""
+
+    def close(self):
+        """释放文件描述符；之后再次使用会重新打开"""
+
+
+class BudgetStore(ABC):
+    """预算存储：(year, month) -> monthlyLimit"""
+
+    @abstractmethod
+    def version(self) -> int:
+        """当前数据版本号，每次写入加一"""
+
+    @abstractmethod
+    def write_budget(self, year: int, month: int, amount: float):
+        """写入某月的预算金额"""
+
+    @abstractmethod
+    def read_budget(self, year: int, month: int) -> Optional[float]:
+        """按年份与月份读取预算"""
+
+    @abstractmethod
+    def read_last_budget(self) -> Optional[Dict[str, Any]]:
+        """读取最近一个月份的预算"""
+
+    @abstractmethod
+    def read_all(self) -> Dict[Tuple[int, int], Optional[float]]:
+        """读取所有月份的预算"""
+
+    @abstractmethod
+    def write_all(self, limits: Dict[Tuple[int, int], Optional[float]]):
+        """覆盖写入所有月份的预算"""
+
+    def close(self):
+        """释放文件描述符；之后再次使用会重新打开"""
+
+
+def ledger_prefix(ledger: Optional[str]) -> str:
+    """账本文件相对 STORAGE_DIR 的目录前缀，默认账本为空串；id 非法时抛出 ValueError"""
+    if not ledger:
+        return ""
+    if not LEDGER_ID_PATTERN.fullmatch(ledger):
+        raise ValueError("ledger id must be 1-64 letters, digits, '_' or '-'")
+    return f"ledgers/{ledger}/"
+
+
+def open_stores(backend: Optional[str] = None, ledger: Optional[str] = None) -> Tuple[LedgerStore, BudgetStore, TodoStore]:
+    """
+    按配置创建 (账本, 预算, TODO) 存储实例
+
+    Args:
+        backend: "csv"、"sqlite"、"segment"（账本使用二进制段存储）或 "partitioned"
+            （账本按月分区）；后两者的预算与 TODO 仍为 CSV / JSON。默认使用 config.STORAGE_BACKEND
+        ledger: 账本 id，缺省为默认账本
+    """
+    backend = backend or STORAGE_BACKEND
+    prefix = ledger_prefix(ledger)
+    if backend == "csv":
+        # 具体实现依赖本模块中的接口，在此处导入以避免循环导入
+        try:
+            from apps.account.storage import Storage
+            from apps.account.budget import Budget
+            from apps.Todo.storage import Storage as TodoStorage
+        except ImportError:
+            from ..account.storage import Storage
+            from ..account.budget import Budget
+            from ..Todo.storage import Storage as TodoStorage
+        return Storage(prefix + "data.csv"), Budget(prefix + "budget.json"), TodoStorage(prefix + "todo_data.csv")
+    if backend == "sqlite":
+        try:
+            from apps.utils.sqlite import Database
+            from apps.account.sqlite import SQLiteStorage, SQLiteBudget
+            from apps.Todo.sqlite import SQLiteStorage as SQLiteTodoStorage
+        except ImportError:
+            from ..utils.sqlite import Database
+            from ..account.sqlite import SQLiteStorage, SQLiteBudget
+            from ..Todo.sqlite import SQLiteStorage as SQLiteTodoStorage
+        db = Database(STORAGE_DIR / prefix / SQLITE_PATH.name if prefix else SQLITE_PATH)
+        return SQLiteStorage(db), SQLiteBudget(db), SQLiteTodoStorage(db)
+    if backend == "partitioned":
+        try:
+            from apps.account.partition import PartitionedStorage
+            from apps.account.budget import Budget
+            from apps.Todo.storage import Storage as TodoStorage
+        except ImportError:
+            from ..account.partition import PartitionedStorage
+            from ..account.budget import Budget
+            from ..Todo.storage import Storage as TodoStorage
+        return (PartitionedStorage(prefix + "ledger", legacy=prefix + "data.csv"),
+                Budget(prefix + "budget.json"), TodoStorage(prefix + "todo_data.csv"))
+    if backend == "segment":
+        try:
+            from apps.account.segment import SegmentStorage
+            from apps.account.budget import Budget
+            from apps.Todo.storage import Storage as TodoStorage
+        except ImportError:
+            from ..account.segment import SegmentStorage
+            from ..account.budget import Budget
+            from ..Todo.storage import Storage as TodoStorage
+        return SegmentStorage(prefix + "ledger.seg"), Budget(prefix + "budget.json"), TodoStorage(prefix + "todo_data.csv")
+    raise ValueError(f"Unknown storage backend: {backend}")
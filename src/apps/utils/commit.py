@@ -0,0 +1,76 @@
+import threading
+from typing import Any, Callable, List, Optional
+
+
+class _Request:
+    __slots__ = ("item", "result", "error", "done", "lead")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+        self.lead = False
+
+
+class GroupCommitter:
+    """
+    组提交写入器
+
+    并发的调用方把待写入的条目放入队列，由其中一个线程（leader）把队列中
+    的全部条目交给 flush 一次写入，然后唤醒各调用方。leader 完成一批后若
+    队列中仍有条目，则把 leader 身份交给下一个等待者，避免单个请求被长期占用。
+    """
+
+    def __init__(self, flush: Callable[[List[Any]], List[Any]]):
+        """
+        Args:
+            flush: 批量写入函数，接收条目列表，返回与之一一对应的结果列表
+        """
+        self._flush = flush
+        self._mutex = threading.Lock()
+        self._pending: List[_Request] = []
+        self._leader_active = False
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item: Any) -> Any:
+        """提交一个条目，阻塞到其所在批次写入完成，返回 flush 给出的结果"""
+        request = _Request(item)
+        with self._mutex:
+            self._pending.append(request)
+            if not self._leader_active:
+                self._leader_active = True
+                request.lead = True
+        if not request.lead:
+            request.done.wait()
+        if request.lead:
+            self._lead()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _lead(self):
+        with self._mutex:
+            batch = self._pending
+            self._pending = []
+        try:
+            results = self._flush([request.item for request in batch])
+            for request, result in zip(batch, results):
+                request.result = result
+        except BaseException as e:
+            for request in batch:
+                request.error = e
+        self.batches += 1
+        self.items += len(batch)
+        with self._mutex:
+            if self._pending:
+                # 交接 leader 身份：被唤醒的等待者会负责下一批
+                successor = self._pending[0]
+                successor.lead = True
+                successor.done.set()
+            else:
+                self._leader_active = False
+        for request in batch:
+            request.lead = False
+            request.done.set()
@@ -1,14 +1,50 @@
 """
-项目路径配置
+项目路径与运行配置
 集中管理所有路径，避免在各模块中硬编码相对路径
 """
+import os
 from pathlib import Path
 
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
 
-# 存储目录
-STORAGE_DIR = PROJECT_ROOT / "storage"
+# 存储目录（由各存储在首次打开时创建，导入配置不访问文件系统），可由 FISCRA_STORAGE_DIR 指定
+STORAGE_DIR = Path(os.environ.get("FISCRA_STORAGE_DIR", PROJECT_ROOT / "storage"))
 
-# 确保存储目录存在
-STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+# 追加写入后是否 fsync（组提交时每批一次）
+SYNC_WRITES = os.environ.get("FISCRA_SYNC_WRITES", "0") == "1"
+
+# 存储后端："csv"（默认，storage/ 下的 CSV / JSON 文件）、"sqlite"、
+# "segment"（账本为 storage/ledger.seg 二进制段文件，其余同 csv），
+# 或 "partitioned"（账本按月分区为 storage/ledger/YYYY-MM.csv，首次启动时自动迁移 data.csv，其余同 csv）
+STORAGE_BACKEND = os.environ.get("FISCRA_STORAGE_BACKEND", "csv")
+
+# SQLite 后端的数据库文件
+SQLITE_PATH = STORAGE_DIR / "fiscra.db"
+
+# 多账本：每个进程最多保持打开的账本数（含默认账本），超出时关闭最久未使用的空闲账本；
+# 空闲超过 FISCRA_LEDGER_IDLE_SECONDS 秒的账本也会被关闭（0 表示不按时间关闭）
+LEDGER_POOL_SIZE = int(os.environ.get("FISCRA_LEDGER_POOL_SIZE", "16"))
+LEDGER_IDLE_SECONDS = float(os.environ.get("FISCRA_LEDGER_IDLE_SECONDS", "600"))
+
+# 预热快照：CSV 账本关闭（进程退出、被账本池淘汰）时把解析缓存、按月汇总与日期索引
+# 保存为 data.csv.snap，下次启动时文件版本一致则直接载入，省去重新解析
+WARM_SNAPSHOT = os.environ.get("FISCRA_WARM_SNAPSHOT", "0") == "1"
+
+# ASGI 模式（src/asgi.py）下执行请求的线程数；流式响应使用独立的线程池，不占用普通请求的线程
+ASGI_WORKERS = int(os.environ.get("FISCRA_ASGI_WORKERS", "32"))
+ASGI_STREAM_WORKERS = int(os.environ.get("FISCRA_ASGI_STREAM_WORKERS", "8"))
+# ASGI 模式下的锁等待限额：单次等待文件锁的最长秒数，以及同时等待锁的线程数（默认为 ASGI_WORKERS 的四分之一）；
+# 同步视图的锁等待会占住线程，限额保证其余线程仍可处理不竞争锁的请求
+ASGI_LOCK_WAIT = float(os.environ.get("FISCRA_ASGI_LOCK_WAIT", "1.0"))
+ASGI_LOCK_WAITERS = int(os.environ.get("FISCRA_ASGI_LOCK_WAITERS", str(max(1, ASGI_WORKERS // 4))))
+
+# 是否收集指标（/api/metrics）；关闭时埋点只做一次布尔判断
+METRICS_ENABLED = os.environ.get("FISCRA_METRICS", "0") == "1"
+
+# 性能分析：路由以 FISCRA_PROFILE_ROUTES（逗号分隔的前缀，"*" 表示全部）开头的请求记录 cProfile；
+# FISCRA_PROFILE_HEADER=1 或 test 模式下，带请求头 X-Fiscra-Profile: 1 的请求也会记录
+PROFILE_ROUTES = [route for route in os.environ.get("FISCRA_PROFILE_ROUTES", "").split(",") if route]
+PROFILE_HEADER_ENABLED = os.environ.get("FISCRA_PROFILE_HEADER", "0") == "1"
+# 最多保留的分析结果数，超出时删除最旧的
+PROFILE_KEEP = int(os.environ.get("FISCRA_PROFILE_KEEP", "50"))
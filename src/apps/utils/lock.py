@@ -1,26 +1,87 @@
 import os
 import time
 import threading
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 from pathlib import Path
+from typing import Optional
 try:
     from apps.utils.utils import system_
 except:
     from .utils import system_
-if system_() == 'Windows':
+
+try:
+    from apps.utils import config, metrics
+except ImportError:
+    from . import config, metrics
+
+msvcrt = None
+fcntl = None
+_system = system_()
+if _system == 'Windows':
     import msvcrt
-elif system_() in ('Linux', 'Darwin'):
+elif _system in ('Linux', 'Darwin'):
     import fcntl
 
 
+class WaitBudget:
+    """
+    锁等待的限额：单次等待的最长时间，以及同时处于等待状态的线程数
+
+    在线程池中执行请求时（见 apps.utils.asgi），锁等待会占住一个线程；限额使
+    等待锁的线程最多只占线程池的一部分，其余线程继续处理不竞争锁的请求。
+    没有空闲的等待名额、或等待超过 timeout 时抛出 TimeoutError，
+    能立即取得的锁不受影响。
+    """
+
+    def __init__(self, timeout: float, waiters: int):
+        """
+        Args:
+            timeout: 单次获取锁最多等待的秒数（不超过 FileLock 自身的超时）
+            waiters: 同时等待锁的线程数上限
+        """
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(1, waiters))
+
+    @contextmanager
+    def waiting(self, lockfile_path: str):
+        """占用一个等待名额，没有空闲名额时立即抛出 TimeoutError"""
+        if not self._slots.acquire(blocking=False):
+            raise TimeoutError(f'Too many threads waiting for locks, gave up on {lockfile_path}')
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+
+# 当前上下文的锁等待限额，None 表示只受 FileLock.timeout 限制
+_wait_budget: ContextVar[Optional[WaitBudget]] = ContextVar("lock_wait_budget", default=None)
+
+
+def set_wait_budget(budget: Optional[WaitBudget]):
+    """为当前上下文（线程或 contextvars 上下文）设置锁等待限额"""
+    _wait_budget.set(budget)
+
+
 class FileLock:
     """
-    跨线程和跨进程的文件锁实现
-    
-    支持 Windows (msvcrt) 和 POSIX (fcntl) 平台。
-    在不支持平台锁的环境中，使用基于文件存在的简单锁机制。
+    跨线程和跨进程的读写文件锁实现
+
+    - 进程内：基于 Condition 的读写锁，读者之间互不阻塞，写者优先，
+      等待是阻塞式的（带超时），不需要轮询。
+    - 进程间：在常驻的锁文件描述符上使用 flock，第一个读者加 LOCK_SH，
+      最后一个读者释放；写者加 LOCK_EX。Windows 的 msvcrt 不支持共享锁，
+      读写均使用独占锁。
+    锁文件只创建一次、不再删除，避免不同进程锁住不同 inode。
+    fork 出的 worker 进程会重新打开描述符：继承的描述符与父进程共享同一个
+    打开文件，flock 无法在两者之间互斥。
+    当前上下文设置了 WaitBudget（set_wait_budget）时，需要等待的获取另受其限制。
     """
-    
+
+    # 跨进程竞争时的重试间隔（秒），按指数退避增长到上限
+    _BACKOFF_START = 0.001
+    _BACKOFF_MAX = 0.02
+
     def __init__(self, lockfile_path: str, timeout: float = 5.0):
         """
         初始化文件锁
@@ -31,131 +92,194 @@ class FileLock:
         """
         self.lockfile_path = lockfile_path
         self.timeout = timeout
-        self._thread_lock = threading.Lock()
-        self._file_handle = None
+        # 指标中的锁名称
+        self.name = self._metric_name(lockfile_path)
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        # 有线程正在与其他进程竞争文件锁：退避期间释放 Condition，其余线程等待其结果
+        self._file_pending = False
+        self._fd = None
+        self._fd_pid = None
     
     @contextmanager
-    def acquire(self):
+    def acquire(self, shared: bool = False):
         """
         获取文件锁的上下文管理器
         
+        Args:
+            shared: True 获取共享（读）锁，False 获取独占（写）锁
+
         Yields:
             None
             
         Raises:
             TimeoutError: 如果在超时时间内无法获取锁
         """
-        # 先获取线程锁（进程内互斥）
-        acquired_thread_lock = self._thread_lock.acquire(timeout=self.timeout)
-        if not acquired_thread_lock:
-            raise TimeoutError(f'Timeout acquiring thread lock for {self.lockfile_path}')
-        
+        budget = _wait_budget.get()
+        timeout = self.timeout if budget is None else min(self.timeout, budget.timeout)
+        deadline = time.monotonic() + timeout
+        timed = metrics.ENABLED
+        if timed:
+            started = time.perf_counter()
+        if shared:
+            self._acquire_shared(deadline)
+        else:
+            self._acquire_exclusive(deadline)
+        if timed:
+            mode = "shared" if shared else "exclusive"
+            acquired = time.perf_counter()
+            metrics.LOCK_WAIT_SECONDS.observe(acquired - started, self.name, mode)
         try:
-            # 再获取文件锁（跨进程互斥）
-            self._acquire_file_lock()
             yield
         finally:
-            # 释放文件锁
-            self._release_file_lock()
-            # 释放线程锁
-            self._thread_lock.release()
-    
-    def _acquire_file_lock(self):
-        """获取文件级别的锁"""
-        start_time = time.time()
-        
-        while True:
+            if shared:
+                self._release_shared()
+            else:
+                self._release_exclusive()
+            if timed:
+                metrics.LOCK_HOLD_SECONDS.observe(time.perf_counter() - acquired, self.name, mode)
+
+    @staticmethod
+    def _metric_name(lockfile_path: str) -> str:
+        """相对 STORAGE_DIR 的路径（如 ledgers/home/data.csv.lock），各账本的锁分别统计；不在其中时取文件名"""
+        path = Path(os.path.abspath(lockfile_path))
+        try:
+            return path.relative_to(os.path.abspath(config.STORAGE_DIR)).as_posix()
+        except ValueError:
+            return path.name
+
+    def acquire_shared(self):
+        """获取共享（读）锁的上下文管理器"""
+        return self.acquire(shared=True)
+
+    def close(self):
+        """关闭常驻的锁文件描述符（需在未持有锁时调用）"""
+        with self._cond:
+            if self._fd is not None and not self._writer and self._readers == 0 and not self._file_pending:
+                os.close(self._fd)
+                self._fd = None
+
+    def _waiting(self):
+        """需要阻塞等待时进入：占用当前上下文 WaitBudget 的等待名额（如有）"""
+        budget = _wait_budget.get()
+        return nullcontext() if budget is None else budget.waiting(self.lockfile_path)
+
+    def _wait(self, predicate, deadline: float, what: str):
+        """在 Condition 上阻塞等待 predicate 成立（需持有 self._cond）"""
+        if predicate():
+            return
+        with self._waiting():
+            while not predicate():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f'Timeout acquiring {what} lock for {self.lockfile_path}')
+                self._cond.wait(remaining)
+
+    def _acquire_shared(self, deadline: float):
+        with self._cond:
+            # 写者优先：有写者持有或等待时，新读者需等待
+            self._wait(
+                lambda: not self._writer and self._writers_waiting == 0 and not self._file_pending,
+                deadline, 'shared',
+            )
+            if self._readers == 0:
+                self._lock_file(shared=True, deadline=deadline)
+            self._readers += 1
+
+    def _release_shared(self):
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._unlock_file()
+                self._cond.notify_all()
+
+    def _acquire_exclusive(self, deadline: float):
+        with self._cond:
+            self._writers_waiting += 1
             try:
-                # 打开或创建锁文件
-                self._file_handle = open(self.lockfile_path, 'w+')
-                
-                # 尝试根据平台获取文件锁
-                if msvcrt and os.name == 'nt':
-                    # Windows 平台使用 msvcrt
+                self._wait(
+                    lambda: not self._writer and self._readers == 0 and not self._file_pending,
+                    deadline, 'exclusive',
+                )
+                self._lock_file(shared=False, deadline=deadline)
+                self._writer = True
+            finally:
+                self._writers_waiting -= 1
+                if not self._writer:
+                    self._cond.notify_all()
+
+    def _release_exclusive(self):
+        with self._cond:
+            self._unlock_file()
+            self._writer = False
+            self._cond.notify_all()
+
+    def _lock_file(self, shared: bool, deadline: float):
+        """
+        获取文件级别的锁（需持有 self._cond）
+
+        与其他进程竞争时按指数退避重试，退避在 Condition 上等待（释放 self._cond），
+        其他线程的获取与释放不会被阻塞，各自的超时与 WaitBudget 仍然有效。
+        """
+        pid = os.getpid()
+        if self._fd is not None and self._fd_pid != pid:
+            # 从父进程继承的描述符，关闭后重新打开
+            os.close(self._fd)
+            self._fd = None
+        if self._fd is None:
+            Path(self.lockfile_path).parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.lockfile_path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._fd_pid = pid
+
+        if msvcrt and os.name == 'nt':
+            def attempt():
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+        elif fcntl:
+            mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            def attempt():
+                fcntl.flock(self._fd, mode | fcntl.LOCK_NB)
+        else:
+            # 不支持平台锁时仅保证进程内互斥
+            return
+
+        try:
+            attempt()
+            return
+        except OSError:
+            pass
+        # 进程内竞争已由 Condition 处理，这里只会与其他进程竞争，
+        # 使用指数退避重试直到截止时间；_file_pending 期间其他线程不会进入本方法
+        delay = self._BACKOFF_START
+        with self._waiting():
+            self._file_pending = True
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f'Timeout acquiring file lock for {self.lockfile_path}')
+                    self._cond.wait(min(delay, remaining))
+                    delay = min(delay * 2, self._BACKOFF_MAX)
                     try:
-                        msvcrt.locking(self._file_handle.fileno(), msvcrt.LK_NBLCK, 1)
-                        return  # 成功获取锁
+                        attempt()
+                        return
                     except OSError:
-                        # 锁被占用，继续重试
-                        pass
-                        
-                elif fcntl:
-                    # POSIX 平台使用 fcntl
-                    try:
-                        fcntl.flock(self._file_handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-                        return  # 成功获取锁
-                    except (OSError, IOError):
-                        # 锁被占用，继续重试
-                        pass
-                        
-                else:
-                    # 不支持平台锁，使用文件存在作为原始锁机制
-                    try:
-                        # 尝试独占方式创建锁文件
-                        fd = os.open(self.lockfile_path, os.O_CREAT | os.O_EXCL | os.O_RDWR)
-                        os.close(fd)
-                        self._file_handle = open(self.lockfile_path, 'w+')
-                        return  # 成功获取锁
-                    except FileExistsError:
-                        # 锁被占用，继续重试
-                        pass
-                
-                # 关闭文件句柄准备重试
-                if self._file_handle:
-                    self._file_handle.close()
-                    self._file_handle = None
-                
-                # 检查是否超时
-                if (time.time() - start_time) > self.timeout:
-                    raise TimeoutError(f'Timeout acquiring file lock for {self.lockfile_path}')
-                
-                # 短暂休眠后重试
-                time.sleep(0.05)
-                
-            except Exception as e:
-                # 发生异常时清理文件句柄
-                if self._file_handle:
-                    try:
-                        self._file_handle.close()
-                    except Exception:
                         pass
-                    self._file_handle = None
-                
-                # 如果不是预期的锁竞争异常，则向上抛出
-                if not isinstance(e, TimeoutError):
-                    raise TimeoutError(f'Error acquiring file lock: {e}')
-                raise
-    
-    def _release_file_lock(self):
-        """释放文件级别的锁"""
-        if not self._file_handle:
+            finally:
+                self._file_pending = False
+                self._cond.notify_all()
+
+    def _unlock_file(self):
+        """释放文件级别的锁（需持有 self._cond）"""
+        if self._fd is None:
             return
-        
         try:
-            # 根据平台释放文件锁
             if msvcrt and os.name == 'nt':
-                try:
-                    self._file_handle.seek(0)
-                    msvcrt.locking(self._file_handle.fileno(), msvcrt.LK_UNLCK, 1)
-                except Exception:
-                    pass
-                    
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
             elif fcntl:
-                try:
-                    fcntl.flock(self._file_handle.fileno(), fcntl.LOCK_UN)
-                except Exception:
-                    pass
-            
-            # 关闭文件句柄
-            self._file_handle.close()
-            
-        finally:
-            self._file_handle = None
-            
-            # 尝试删除锁文件
-            try:
-                if os.path.exists(self.lockfile_path):
-                    os.remove(self.lockfile_path)
-            except Exception:
-                # 删除失败不影响功能，忽略错误
-                pass
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        except OSError:
+            pass
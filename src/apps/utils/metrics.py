@@ -0,0 +1,224 @@
+"""
+进程内指标与 Prometheus 文本格式输出
+
+由 config.METRICS_ENABLED（环境变量 FISCRA_METRICS=1）开启；关闭时各埋点只做
+一次布尔判断。指标按进程统计，多进程部署时每个 worker 各自输出。
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    from apps.utils.config import METRICS_ENABLED
+except ImportError:
+    from ..utils.config import METRICS_ENABLED
+
+ENABLED = METRICS_ENABLED
+
+# 当前请求解析的行数，由 app.py 在请求开始时设置
+_request_rows: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("request_rows", default=None)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """单调递增的计数器"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """固定分桶的直方图，输出时转换为 Prometheus 的累计分桶"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [各分桶计数（最后一个为 +Inf）, 总和]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCK_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+ROW_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+
+REQUEST_SECONDS = Histogram(
+    "fiscra_request_duration_seconds", "Request latency by route (streamed responses include streaming time)",
+    ("method", "route", "status"), LATENCY_BUCKETS,
+)
+REQUEST_ROWS = Histogram(
+    "fiscra_request_rows_parsed", "Rows parsed from storage files per request",
+    ("method", "route"), ROW_BUCKETS,
+)
+JSON_SECONDS = Histogram(
+    "fiscra_json_serialize_seconds", "Time spent serializing JSON responses",
+    (), LATENCY_BUCKETS,
+)
+LOCK_WAIT_SECONDS = Histogram(
+    "fiscra_lock_wait_seconds", "Time spent waiting to acquire a FileLock",
+    ("lock", "mode"), LOCK_BUCKETS,
+)
+LOCK_HOLD_SECONDS = Histogram(
+    "fiscra_lock_hold_seconds", "Time a FileLock was held",
+    ("lock", "mode"), LOCK_BUCKETS,
+)
+ROWS_PARSED = Counter(
+    "fiscra_rows_parsed_total", "Rows parsed from storage files",
+    ("store",),
+)
+CACHE_LOOKUPS = Counter(
+    "fiscra_cache_lookups_total", "Parsed-file cache lookups by result",
+    ("store", "result"),
+)
+LEDGER_POOL_EVENTS = Counter(
+    "fiscra_ledger_pool_events_total", "Ledger stores opened and evicted by the store pool",
+    ("event",),
+)
+
+REGISTRY = [
+    REQUEST_SECONDS, REQUEST_ROWS, JSON_SECONDS,
+    LOCK_WAIT_SECONDS, LOCK_HOLD_SECONDS, ROWS_PARSED, CACHE_LOOKUPS, LEDGER_POOL_EVENTS,
+]
+
+
+def rows_parsed(store: str, count: int):
+    """记录从存储文件解析的行数（计入当前请求）"""
+    if not ENABLED or count <= 0:
+        return
+    ROWS_PARSED.inc(count, store)
+    rows = _request_rows.get()
+    if rows is not None:
+        rows[0] += count
+
+
+def cache_lookup(store: str, hit: bool):
+    """记录一次解析缓存的命中 / 未命中"""
+    if ENABLED:
+        CACHE_LOOKUPS.inc(1, store, "hit" if hit else "miss")
+
+
+def ledger_pool_event(event: str):
+    """记录账本存储池的打开 / 淘汰"""
+    if ENABLED:
+        LEDGER_POOL_EVENTS.inc(1, event)
+
+
+def begin_request():
+    """请求开始：开始统计本请求解析的行数"""
+    _request_rows.set([0])
+
+
+def end_request() -> int:
+    """请求结束：返回本请求解析的行数"""
+    rows = _request_rows.get()
+    _request_rows.set(None)
+    return rows[0] if rows is not None else 0
+
+
+def instrument(app):
+    """
+    为 Flask 应用注册请求计时、每请求解析行数与 JSON 序列化计时
+
+    计时在 teardown_request 中结束，流式响应包含输出数据的时间。
+    """
+    from flask import g, request
+
+    class TimedJSONProvider(type(app.json)):
+        def dumps(self, obj, **kwargs):
+            started = time.perf_counter()
+            try:
+                return super().dumps(obj, **kwargs)
+            finally:
+                JSON_SECONDS.observe(time.perf_counter() - started)
+
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        begin_request()
+
+    @app.after_request
+    def record_request_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def observe_request(exc):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        status = str(g.pop("metrics_status", 500))
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route, status)
+        REQUEST_ROWS.observe(end_request(), request.method, route)
+
+
+def render() -> str:
+    """Prometheus 文本格式（0.0.4）"""
+    if not ENABLED:
+        return "# metrics disabled, set FISCRA_METRICS=1 to enable\n"
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
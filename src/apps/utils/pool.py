@@ -0,0 +1,129 @@
+"""
+按账本 id 缓存存储实例的 LRU 池
+
+每个账本的 (账本, 预算, TODO) 存储在首次使用时打开，之后连同其缓存、索引与
+锁文件描述符常驻内存；打开的账本超过容量、或空闲超过 idle_seconds 时，
+关闭最久未使用且没有请求正在使用的账本。淘汰只在 acquire / release 时进行。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+try:
+    from apps.utils import metrics
+    from apps.utils.backend import ledger_prefix, open_stores
+except ImportError:
+    from . import metrics
+    from .backend import ledger_prefix, open_stores
+
+
+class _Entry:
+    def __init__(self):
+        self.stores: Optional[Tuple[Any, Any, Any]] = None
+        self.active = 0  # 正在使用该账本的请求数
+        self.last_used = time.monotonic()
+        # 打开存储可能较慢（如首次迁移），只阻塞同一账本的请求
+        self.open_lock = threading.Lock()
+
+
+class StorePool:
+    """
+    账本 id -> (账本, 预算, TODO) 存储实例
+
+    acquire 与 release 成对调用；被淘汰的实例调用 close 释放锁文件描述符与
+    后台线程。正在使用的账本不会被淘汰，全部账本都在使用时池可以暂时超出容量。
+    """
+
+    def __init__(self, capacity: int, idle_seconds: float = 0,
+                 opener: Optional[Callable[[Optional[str]], Tuple[Any, Any, Any]]] = None):
+        """
+        Args:
+            capacity: 最多保持打开的账本数
+            idle_seconds: 空闲超过该秒数的账本被关闭，0 表示不按时间关闭
+            opener: 按账本 id 创建存储实例，默认 open_stores(ledger=...)
+        """
+        self.capacity = max(1, capacity)
+        self.idle_seconds = idle_seconds
+        self._opener = opener or (lambda ledger: open_stores(ledger=ledger))
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.evicted = 0
+
+    def acquire(self, ledger: str = "") -> Tuple[Any, Any, Any]:
+        """取得账本的存储实例（需要时打开），id 非法时抛出 ValueError"""
+        ledger_prefix(ledger)
+        with self._lock:
+            entry = self._entries.get(ledger)
+            if entry is None:
+                entry = self._entries[ledger] = _Entry()
+            entry.active += 1
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(ledger)
+            stale = self._evict_locked()
+        self._close(stale)
+        if entry.stores is None:
+            try:
+                with entry.open_lock:
+                    if entry.stores is None:
+                        entry.stores = self._opener(ledger or None)
+                        self.opened += 1
+                        metrics.ledger_pool_event("open")
+            except BaseException:
+                self.release(ledger, entry)
+                raise
+        return entry.stores
+
+    def release(self, ledger: str = "", entry: Optional[_Entry] = None):
+        """归还 acquire 取得的存储实例"""
+        with self._lock:
+            entry = entry or self._entries.get(ledger)
+            if entry is None:
+                return
+            entry.active -= 1
+            entry.last_used = time.monotonic()
+            if self._entries.get(ledger) is entry:
+                if entry.stores is None and entry.active == 0:
+                    # 打开失败的账本不保留
+                    del self._entries[ledger]
+                else:
+                    self._entries.move_to_end(ledger)
+            stale = self._evict_locked()
+        self._close(stale)
+
+    def _evict_locked(self) -> List[Tuple[str, _Entry]]:
+        """从最久未使用的一端取出需要淘汰的空闲账本（需持有 self._lock）"""
+        now = time.monotonic()
+        stale = []
+        excess = len(self._entries) - self.capacity
+        for ledger, entry in list(self._entries.items()):
+            expired = self.idle_seconds > 0 and now - entry.last_used > self.idle_seconds
+            if excess <= 0 and not expired:
+                break
+            if entry.active:
+                continue
+            del self._entries[ledger]
+            stale.append((ledger, entry))
+            excess -= 1
+        return stale
+
+    def _close(self, stale: List[Tuple[str, _Entry]]):
+        for ledger, entry in stale:
+            if entry.stores is None:
+                continue
+            self.evicted += 1
+            metrics.ledger_pool_event("evict")
+            for store in entry.stores:
+                try:
+                    store.close()
+                except Exception as e:
+                    print("ERROR closing ledger", repr(ledger), ":", e)
+
+    def close_all(self):
+        """关闭全部空闲账本"""
+        with self._lock:
+            stale = [(ledger, entry) for ledger, entry in self._entries.items() if not entry.active]
+            for ledger, _ in stale:
+                del self._entries[ledger]
+        self._close(stale)
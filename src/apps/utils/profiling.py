@@ -0,0 +1,164 @@
+"""
+按请求的 cProfile 性能分析
+
+选中的请求（见 config.PROFILE_ROUTES / PROFILE_HEADER_ENABLED）在处理期间开启
+cProfile，结束后保存到 STORAGE_DIR/profiles：<name>.prof 为 pstats 文件，
+<name>.json 为请求信息。响应头 X-Fiscra-Profile-Id 给出 name。
+
+Python 3.12 起 cProfile 基于 sys.monitoring，同一时间只能有一个分析器处于
+开启状态，因此同一时间只分析一个请求：已有请求在分析时，新选中的请求照常
+处理但不记录。
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from apps.utils.config import STORAGE_DIR, PROFILE_ROUTES, PROFILE_HEADER_ENABLED, PROFILE_KEEP
+except ImportError:
+    from ..utils.config import STORAGE_DIR, PROFILE_ROUTES, PROFILE_HEADER_ENABLED, PROFILE_KEEP
+
+HEADER = "X-Fiscra-Profile"
+NAME_PATTERN = re.compile(r"[\w.-]+")
+SORT_KEYS = ("cumulative", "tottime", "calls", "ncalls", "time", "name", "filename")
+
+_sequence = 0
+_sequence_lock = threading.Lock()
+# 正在分析的请求持有该锁
+_active_lock = threading.Lock()
+
+
+def profile_dir() -> Path:
+    return STORAGE_DIR / "profiles"
+
+
+def selected(route: str, header_value: Optional[str], allow_header: bool) -> bool:
+    """请求是否需要记录性能分析"""
+    if route.startswith("/api/profiles"):
+        return False
+    if allow_header and header_value and header_value.lower() not in ("0", "false"):
+        return True
+    return any(prefix == "*" or route.startswith(prefix) for prefix in PROFILE_ROUTES)
+
+
+def new_name(method: str, route: str) -> str:
+    """按时间排序的唯一名称，如 20261017T224501-4242-000003-GET-api-data"""
+    global _sequence
+    with _sequence_lock:
+        _sequence += 1
+        sequence = _sequence
+    slug = re.sub(r"[^\w]+", "-", route).strip("-") or "root"
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    return f"{stamp}-{os.getpid()}-{sequence:06d}-{method}-{slug}"
+
+
+def save(profiler: cProfile.Profile, name: str, meta: Dict[str, Any]):
+    """保存 pstats 文件与请求信息，并删除超出 PROFILE_KEEP 的旧结果"""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(str(directory / (name + ".prof")))
+    with open(directory / (name + ".json"), "w", encoding="utf-8") as f:
+        json.dump({"name": name, **meta}, f, ensure_ascii=False)
+    stale = sorted(directory.glob("*.json"))[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else []
+    for path in stale:
+        for suffix in (".json", ".prof"):
+            try:
+                os.remove(path.with_suffix(suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """已保存的分析结果（新的在前）"""
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    result = []
+    for path in sorted(directory.glob("*.json"), reverse=True):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return result
+
+
+def profile_path(name: str) -> Optional[Path]:
+    """name 对应的 pstats 文件，名称非法或不存在时返回 None"""
+    if not NAME_PATTERN.fullmatch(name):
+        return None
+    path = profile_dir() / (name + ".prof")
+    return path if path.exists() else None
+
+
+def report(name: str, sort: str = "cumulative", limit: int = 50) -> Optional[str]:
+    """pstats 文本报告，name 不存在时返回 None"""
+    path = profile_path(name)
+    if path is None:
+        return None
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+    out = io.StringIO()
+    stats = pstats.Stats(str(path), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def instrument(app, allow_header: Callable[[], bool]):
+    """
+    为 Flask 应用注册按请求的性能分析
+
+    Args:
+        allow_header: 是否允许通过请求头触发（配置开启或 test 模式）
+    """
+    from flask import g, request
+
+    @app.before_request
+    def start_profile():
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        header_value = request.headers.get(HEADER)
+        if not selected(route, header_value, bool(header_value) and (PROFILE_HEADER_ENABLED or allow_header())):
+            return
+        if not _active_lock.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 其他分析工具（调试器、覆盖率等）已占用
+            _active_lock.release()
+            return
+        g.profile = (profiler, new_name(request.method, route), route, time.perf_counter())
+
+    @app.after_request
+    def add_profile_header(response):
+        profile = g.get("profile")
+        if profile is not None:
+            response.headers[HEADER + "-Id"] = profile[1]
+            g.profile_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return
+        profiler, name, route, started = profile
+        profiler.disable()
+        _active_lock.release()
+        save(profiler, name, {
+            "method": request.method,
+            "route": route,
+            "path": request.full_path.rstrip("?"),
+            "status": g.pop("profile_status", 500),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "created": datetime.now().isoformat(timespec="seconds"),
+        })
@@ -0,0 +1,75 @@
+import marshal
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+try:
+    from apps.utils.utils import gc_paused
+except ImportError:
+    from .utils import gc_paused
+
+
+class Snapshot:
+    """
+    与数据文件版本绑定的预热快照（sidecar 文件，如 data.csv.snap）
+
+    文件格式：
+        header : magic(8s) + Python 版本(hexversion) + 数据文件 mtime_ns / size / inode / 版本号
+        payload: marshal 序列化的状态（只含 list / dict / str / int / float 等基本类型）
+
+    marshal 格式随 Python 版本变化，版本不同或 header 中的数据文件版本与当前
+    不一致时视为过期。写入通过临时文件 + os.replace 原子替换。
+    """
+    MAGIC = b"FSCRSNP1"
+    HEADER = struct.Struct("<8sQqqqq")
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def _header_bytes(self, signature: Tuple[int, int, int, int]) -> bytes:
+        return self.HEADER.pack(self.MAGIC, sys.hexversion, *signature)
+
+    def signature(self) -> Optional[Tuple[int, int, int, int]]:
+        """快照对应的数据文件版本，不存在或不可用时返回 None"""
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read(self.HEADER.size)
+        except FileNotFoundError:
+            return None
+        if len(raw) != self.HEADER.size:
+            return None
+        magic, version, *signature = self.HEADER.unpack(raw)
+        if magic != self.MAGIC or version != sys.hexversion:
+            return None
+        return tuple(signature)
+
+    def load(self, signature: Tuple[int, int, int, int]) -> Optional[Any]:
+        """读取与 signature 对应的状态，快照不存在、过期或损坏时返回 None"""
+        expected = self._header_bytes(signature)
+        try:
+            with open(self.path, "rb") as f:
+                if f.read(self.HEADER.size) != expected:
+                    return None
+                payload = f.read()
+            # 状态中是大量互不引用的小容器，构建期间不需要 GC
+            with gc_paused():
+                return marshal.loads(payload)
+        except FileNotFoundError:
+            return None
+        except (EOFError, ValueError, TypeError):
+            # header 完整但内容损坏（如写入时断电）：删除，之后重新保存
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            return None
+
+    def save(self, signature: Tuple[int, int, int, int], state: Any):
+        """保存 signature 版本的状态"""
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(self._header_bytes(signature))
+            f.write(marshal.dumps(state))
+        os.replace(tmp_path, self.path)
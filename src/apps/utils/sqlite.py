@@ -0,0 +1,220 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple
+
+try:
+    from apps.utils.config import SYNC_WRITES
+except ImportError:
+    from ..utils.config import SYNC_WRITES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL DEFAULT '',
+    event TEXT NOT NULL DEFAULT '',
+    amount TEXT NOT NULL DEFAULT '',
+    type TEXT NOT NULL DEFAULT '',
+    remark TEXT NOT NULL DEFAULT '',
+    category TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ledger_date ON ledger (date, id);
+CREATE INDEX IF NOT EXISTS ledger_category ON ledger (category);
+
+CREATE TABLE IF NOT EXISTS todo (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uuid TEXT UNIQUE,
+    title TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    completed TEXT NOT NULL DEFAULT '',
+    priority TEXT NOT NULL DEFAULT '',
+    dueDate TEXT NOT NULL DEFAULT '',
+    category TEXT NOT NULL DEFAULT '',
+    createdAt TEXT NOT NULL DEFAULT ''
+);
+
+CREATE TABLE IF NOT EXISTS budget (
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    monthlyLimit REAL,
+    PRIMARY KEY (year, month)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+# fork 前父进程打开的连接：在子进程中关闭会影响父进程的数据库锁，保留到进程退出
+_inherited: List[sqlite3.Connection] = []
+
+
+class Database:
+    """
+    SQLite 数据库（账本、TODO、预算共用一个文件）
+
+    sqlite3 连接不能在线程间共享，每个线程持有一个连接；连接内的语句缓存
+    即预编译语句，SQL 均为带参数的常量字符串。WAL 模式下读不阻塞写，
+    写事务用 BEGIN IMMEDIATE 串行化，跨进程同样适用。连接不能跨 fork 使用，
+    fork 出的 worker 进程会建立自己的连接。
+    """
+    # 每个连接缓存的预编译语句数
+    CACHED_STATEMENTS = 128
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        # 各线程的 (进程 id, 连接)，close 时关闭本进程建立的连接
+        self._connections: List[Tuple[int, sqlite3.Connection]] = []
+
+    def connect(self) -> sqlite3.Connection:
+        """新建一个连接（自动提交模式，事务由调用方显式开启）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(
+            str(self.path),
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.CACHED_STATEMENTS,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 只在检查点时 fsync，断电可能丢失最近的事务但不会损坏
+        conn.execute("PRAGMA synchronous=" + ("FULL" if SYNC_WRITES else "NORMAL"))
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.executescript(SCHEMA)
+                self._schema_ready = True
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """当前线程的连接"""
+        conn = getattr(self._local, "conn", None)
+        pid = os.getpid()
+        if conn is None or self._local.pid != pid:
+            if conn is not None:
+                # 父进程的连接不能在子进程中使用或关闭，只保留引用
+                _inherited.append(conn)
+            conn = self._local.conn = self.connect()
+            self._local.pid = pid
+            with self._schema_lock:
+                self._connections.append((pid, conn))
+        return conn
+
+    def close(self):
+        """
+        关闭本进程各线程的连接（需在没有线程使用时调用）
+
+        之后再次使用会建立新连接；fork 继承的连接只丢弃引用，原因同 conn。
+        """
+        with self._schema_lock:
+            connections = self._connections
+            self._connections = []
+            self._local = threading.local()
+        pid = os.getpid()
+        for owner, conn in connections:
+            if owner == pid:
+                conn.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务：退出时提交，异常时回滚"""
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def snapshot(self) -> Iterator[sqlite3.Connection]:
+        """读事务：其中的多条查询看到同一个快照"""
+        conn = self.conn
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def iter_query(self, sql: str, params: Tuple[Any, ...] = (), batch: int = 1000) -> Iterator[Tuple]:
+        """
+        在独立连接的读事务中逐批产出查询结果
+
+        遍历期间不占用当前线程的连接，也不阻塞写入；遍历得到的是开始时的快照。
+        """
+        conn = self.connect()
+        try:
+            conn.execute("BEGIN")
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    @staticmethod
+    def version(conn: sqlite3.Connection, name: str) -> int:
+        """某张表的数据版本号"""
+        row = conn.execute("SELECT version FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def bump(conn: sqlite3.Connection, name: str) -> int:
+        """版本号加一（需在写事务内调用），返回新版本号"""
+        conn.execute(
+            "INSERT INTO meta (name, version) VALUES (?, 1) "
+            "ON CONFLICT (name) DO UPDATE SET version = version + 1",
+            (name,),
+        )
+        return Database.version(conn, name)
+
+    @staticmethod
+    def last_id(conn: sqlite3.Connection, table: str) -> int:
+        """表的 AUTOINCREMENT 序列：已分配过的最大 id（删除的 id 不会复用）"""
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def reset_sequence(conn: sqlite3.Connection, table: str):
+        """清空表后重置 AUTOINCREMENT 序列（需在写事务内调用）"""
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+
+
+def as_text(row) -> List[str]:
+    """查询结果转换为与 csv.reader 读回时相同的字符串行"""
+    return ["" if value is None else str(value) for value in row]
+
+
+def split_ids(rows: List[List[Any]], width: int) -> Tuple[List[List[Any]], List[List[Any]]]:
+    """
+    将待导入的行（含 id 列）补齐 / 截断为 width 列，并按 id 分为两组
+
+    Returns:
+        (id 为未出现过的正整数的行, 其余行（id 置为 None，由数据库分配）)
+    """
+    seen = set()
+    keep: List[List[Any]] = []
+    reassign: List[List[Any]] = []
+    for row in rows:
+        if not row:
+            continue
+        row = (list(row) + [""] * width)[:width]
+        try:
+            id_value: Optional[int] = int(row[0])
+        except (TypeError, ValueError):
+            id_value = None
+        if id_value is None or id_value <= 0 or id_value in seen:
+            reassign.append([None] + row[1:])
+        else:
+            seen.add(id_value)
+            keep.append([id_value] + row[1:])
+    return keep, reassign
@@ -0,0 +1,45 @@
+import os
+from pathlib import Path
+
+
+class VersionCounter:
+    """
+    持久化的单调递增版本号（sidecar 文件）
+
+    每次数据变更时由存储在独占锁内调用 bump；读取只需读一个很小的文件，
+    不需要解析数据文件。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def get(self) -> int:
+        """当前版本号，文件不存在时为 0"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def bump(self) -> int:
+        """版本号加一并写回（需在独占锁内调用），返回新版本号"""
+        value = self.get() + 1
+        self.set(value)
+        return value
+
+    def advance(self, value: int) -> int:
+        """将版本号提高到至少 value（需在独占锁内调用），返回当前版本号"""
+        current = self.get()
+        if value > current or not self.exists():
+            self.set(max(value, current))
+        return max(value, current)
+
+    def set(self, value: int):
+        """写回版本号（需在独占锁内调用）"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(value))
+        os.replace(tmp_path, self.path)
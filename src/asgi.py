@@ -0,0 +1,27 @@
+"""
+ASGI 入口：单进程异步部署
+
+    uvicorn --app-dir src --host localhost --port 5000 asgi:app
+
+连接由事件循环持有，路由仍是 app.py 中的 Flask 视图，在线程池中执行；
+stream=1 的流式请求使用独立的线程池，不会挤占普通请求。
+文件锁的等待仍在线程中阻塞：单次等待最长 FISCRA_ASGI_LOCK_WAIT 秒，同时等待锁的线程
+不超过 FISCRA_ASGI_LOCK_WAITERS 个，超出时请求立即返回错误而不是继续占用线程。
+"""
+from urllib.parse import parse_qs
+
+from app import app as flask_app
+from apps.utils.asgi import AsyncWSGI
+from apps.utils.config import ASGI_WORKERS, ASGI_STREAM_WORKERS, ASGI_LOCK_WAIT, ASGI_LOCK_WAITERS
+
+
+def is_stream(scope) -> bool:
+    """与 app.wants_stream 相同：请求参数 stream=1 / true"""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("stream", [""])[0].lower() in ("1", "true")
+
+
+app = AsyncWSGI(
+    flask_app, workers=ASGI_WORKERS, stream_workers=ASGI_STREAM_WORKERS, is_stream=is_stream,
+    lock_wait=ASGI_LOCK_WAIT, lock_waiters=ASGI_LOCK_WAITERS,
+)
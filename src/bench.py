@@ -0,0 +1,373 @@
+"""
+存储与 API 热路径的基准测试
+
+用法（在项目根目录）：
+    python src/bench.py [--sizes 1000,10000,100000,1000000] [--backend csv|sqlite|segment|partitioned]
+                        [--min-time 0.5] [--output result.json]
+                        [--compare baseline.json] [--threshold 0.2]
+    python src/bench.py --startup [--sizes 100000] [--repeat 5]
+
+对每个规模，用固定随机种子生成合成的账本与 TODO 数据（写入临时目录，
+不影响 storage/），分别测量存储方法与 Flask 路由（test client）的
+ops/sec、p50、p99。--output 保存 JSON 结果；--compare 与之前保存的结果
+对比，ops/sec 下降超过 threshold 的项目视为回归，退出码为 1。
+--startup 改为测量冷启动：新进程导入 app 与首个请求的耗时，对比有无预热快照。
+"""
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid as uuid_lib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import app as app_module
+from apps.account.storage import Storage
+from apps.account.budget import Budget
+from apps.Todo.storage import Storage as TodoStorage
+from apps.utils.sqlite import Database
+from apps.account.sqlite import SQLiteStorage, SQLiteBudget
+from apps.account.segment import SegmentStorage
+from apps.account.partition import PartitionedStorage
+from apps.Todo.sqlite import SQLiteStorage as SQLiteTodoStorage
+
+DEFAULT_SIZES = "1000,10000,100000"
+SEED = 20260101
+EVENTS = ["午餐", "地铁", "工资", "房租", "咖啡", "超市", "电影", "话费", "奖金", "水电"]
+CATEGORIES = ["food", "transport", "salary", "housing", "entertainment", "shopping", "utilities"]
+PRIORITIES = ["low", "medium", "high"]
+TODO_HEADER = ["id", "uuid", "title", "description", "completed", "priority", "dueDate", "category", "createdAt"]
+# 生成数据时每次批量写入的行数
+POPULATE_CHUNK = 50000
+# 冷启动测量的子进程：导入 app 后发出首个请求（按月汇总需要解析整个账本），输出各阶段耗时
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.get("/api/stats?month=2025-06")
+assert response.status_code == 200, response.status_code
+finished = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "first_request_ms": (finished - imported) * 1000}))
+"""
+
+
+def ledger_values(rng: random.Random, count: int) -> List[List[Any]]:
+    """合成账本行（不含 id 列），日期分布在 2024-01-01 起的三年内"""
+    start = datetime.date(2024, 1, 1)
+    rows = []
+    for _ in range(count):
+        income = rng.random() < 0.1
+        rows.append([
+            (start + datetime.timedelta(days=rng.randrange(3 * 365))).isoformat(),
+            rng.choice(EVENTS),
+            round(rng.uniform(1000, 20000) if income else rng.uniform(1, 500), 2),
+            "income" if income else "expense",
+            "",
+            rng.choice(CATEGORIES),
+        ])
+    return rows
+
+
+def todo_values(rng: random.Random, count: int) -> List[List[Any]]:
+    """合成 TODO 行（不含 id 列，以 uuid 开头）"""
+    return [
+        [
+            str(uuid_lib.UUID(int=rng.getrandbits(128))),
+            f"task {i}",
+            "",
+            str(rng.random() < 0.5),
+            rng.choice(PRIORITIES),
+            "",
+            rng.choice(CATEGORIES),
+            "2026-01-01T00:00:00",
+        ]
+        for i in range(count)
+    ]
+
+
+def open_stores(backend: str, directory: Path):
+    """在临时目录中创建 (账本, 预算, TODO) 存储"""
+    if backend == "sqlite":
+        db = Database(directory / "fiscra.db")
+        return SQLiteStorage(db), SQLiteBudget(db), SQLiteTodoStorage(db)
+    # 绝对路径不受 STORAGE_DIR 影响
+    if backend == "segment":
+        ledger = SegmentStorage(str(directory / "ledger.seg"))
+    elif backend == "partitioned":
+        ledger = PartitionedStorage(str(directory / "ledger"), legacy=str(directory / "data.csv"))
+    else:
+        ledger = Storage(str(directory / "data.csv"))
+    return (
+        ledger,
+        Budget(str(directory / "budget.json")),
+        TodoStorage(str(directory / "todo_data.csv")),
+    )
+
+
+def populate(stores, size: int, rng: random.Random) -> List[str]:
+    """写入 size 行账本、size 条 TODO 与三年的预算，返回 TODO 的 uuid 列表"""
+    ledger, budget, todo = stores
+    for start in range(0, size, POPULATE_CHUNK):
+        ledger.insert_rows(ledger_values(rng, min(POPULATE_CHUNK, size - start)))
+    todos = todo_values(rng, size)
+    todo.write_all([TODO_HEADER] + [[i, *values] for i, values in enumerate(todos, start=1)])
+    budget.write_all({(year, month): 3000.0 for year in (2024, 2025, 2026) for month in range(1, 13)})
+    return [values[0] for values in todos]
+
+
+def percentile(sorted_values: List[int], pct: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(fn: Callable[[], Any], min_time: float, min_ops: int, max_ops: int) -> Dict[str, Any]:
+    """
+    预热一次后重复调用 fn，直到运行超过 min_time 秒且至少 min_ops 次（最多 max_ops 次）
+
+    Returns:
+        {"ops", "ops_per_sec", "p50_ms", "p99_ms"}
+    """
+    fn()
+    samples: List[int] = []
+    started = time.perf_counter()
+    while len(samples) < max_ops and (len(samples) < min_ops or time.perf_counter() - started < min_time):
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - t0)
+    samples.sort()
+    total = sum(samples) / 1e9
+    return {
+        "ops": len(samples),
+        "ops_per_sec": round(len(samples) / total, 2) if total > 0 else None,
+        "p50_ms": round(percentile(samples, 50) / 1e6, 4),
+        "p99_ms": round(percentile(samples, 99) / 1e6, 4),
+    }
+
+
+def check(response, *expected: int):
+    """路由返回了非预期的状态码时中止，避免把错误响应计入结果"""
+    if response.status_code not in expected:
+        raise RuntimeError(f"{response.request.method} {response.request.path}: "
+                           f"{response.status_code} {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def cases(stores, size: int, uuids: List[str], rng: random.Random):
+    """
+    逐个产出 (名称, 调用)
+
+    读取类用例在写入类之前运行，看到的数据规模与 size 一致；
+    删除类用例每次调用删除不同的行，调用次数不超过 size // 4（见 run）。
+    """
+    ledger, budget, todo = stores
+    client = app_module.app.test_client()
+    new_rows = itertools.cycle(ledger_values(rng, 1000))
+    new_todos = (todo_values(rng, 1)[0] for _ in itertools.count())
+    delete_ids = itertools.count(1)
+    route_delete_ids = itertools.count(size // 2)
+    patch_uuids = itertools.cycle(uuids)
+    delete_uuids = iter(reversed(uuids))
+    month = "2025-06"
+
+    def todo_body(values):
+        keys = ["id", "title", "description", "completed", "priority", "dueDate", "category", "createdAt"]
+        body = dict(zip(keys, values))
+        body["completed"] = body["completed"] == "True"
+        return body
+
+    def patch_route():
+        check(client.patch(f"/api/todo?id={next(patch_uuids)}", json={"completed": rng.random() < 0.5}), 200)
+
+    def sync_route():
+        version = todo.version()
+        body = {"baseVersion": version, "changes": [todo_body(next(new_todos))], "removed": []}
+        check(client.put("/api/todo", json=body), 200)
+
+    # 读取
+    yield "storage.read_all", ledger.read_all
+    yield "storage.read_range(month)", lambda: ledger.read_range(month + "-01", month)
+    yield "storage.read_page(100)", lambda: ledger.read_page(0, 100)
+    yield "storage.iter_rows", lambda: sum(1 for _ in ledger.iter_rows())
+    yield "storage.month_stats", lambda: ledger.month_stats(month)
+    yield "storage.frame", ledger.frame
+    yield "storage.fetch_id", ledger.fetch_id
+    yield "budget.read_budget", lambda: budget.read_budget(2025, 6)
+    yield "budget.read_last_budget", budget.read_last_budget
+    yield "todo.read_all", todo.read_all
+    yield "todo.get_by_uuid", lambda: todo.get_by_uuid(rng.choice(uuids))
+    yield "GET /api/data", lambda: check(client.get("/api/data"), 200)
+    yield "GET /api/data?limit=100", lambda: check(client.get("/api/data?limit=100"), 200)
+    yield "GET /api/data?stream=1", lambda: check(client.get("/api/data?stream=1"), 200).get_data()
+    yield "GET /api/data?from&to", lambda: check(client.get(f"/api/data?from={month}-01&to={month}"), 200)
+    yield "GET /api/data (If-None-Match)", lambda: check(
+        client.get("/api/data", headers={"If-None-Match": f'"data-{ledger.version()}"'}), 304)
+    yield "GET /api/stats", lambda: check(client.get(f"/api/stats?month={month}"), 200)
+    yield "GET /api/analytics", lambda: check(client.get("/api/analytics?group_by=category"), 200)
+    yield "GET /api/budget", lambda: check(client.get("/api/budget"), 200)
+    yield "GET /api/todo", lambda: check(client.get("/api/todo"), 200)
+    # 写入
+    yield "storage.insert_row", lambda: ledger.insert_row(next(new_rows))
+    yield "storage.append_row", lambda: ledger.append_row([ledger.fetch_id() + 1, *next(new_rows)])
+    yield "storage.delete_by_id", lambda: ledger.delete_by_id(str(next(delete_ids)))
+    yield "budget.write_budget", lambda: budget.write_budget(2026, rng.randrange(1, 13), rng.uniform(1000, 5000))
+    yield "todo.update_by_uuid", lambda: todo.update_by_uuid(next(patch_uuids), {"completed": str(rng.random() < 0.5)})
+    yield "todo.insert_row", lambda: todo.insert_row(next(new_todos))
+    yield "todo.delete_by_uuid", lambda: todo.delete_by_uuid(next(delete_uuids))
+    yield "POST /api/receive", lambda: check(client.post("/api/receive", json=dict(zip(
+        ["date", "event", "amount", "type", "remark", "category"], next(new_rows)))), 200)
+    yield "DELETE /api/data", lambda: check(client.delete(f"/api/data?id={next(route_delete_ids)}"), 200)
+    yield "PUT /api/budget", lambda: check(client.put("/api/budget", json={
+        "year": 2026, "month": rng.randrange(1, 13), "monthlyLimit": rng.uniform(1000, 5000)}), 200)
+    yield "POST /api/todo", lambda: check(client.post("/api/todo", json=todo_body(next(new_todos))), 200)
+    yield "PATCH /api/todo", patch_route
+    yield "PUT /api/todo (diff sync)", sync_route
+
+
+def run(backend: str, sizes: List[int], min_time: float, min_ops: int, max_ops: int,
+        only: Optional[str]) -> List[Dict[str, Any]]:
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="fiscra-bench-") as tmp:
+            rng = random.Random(SEED + size)
+            stores = open_stores(backend, Path(tmp))
+            started = time.perf_counter()
+            uuids = populate(stores, size, rng)
+            print(f"# size={size} backend={backend} populated in {time.perf_counter() - started:.2f}s",
+                  file=sys.stderr)
+            # 路由读取模块级的存储实例，替换为临时目录中的实例
+            saved = app_module.storage, app_module.budget, app_module.todo_storage
+            app_module.storage, app_module.budget, app_module.todo_storage = stores
+            # 删除类用例不能删除超过现有的行
+            limit = max(min_ops, min(max_ops, size // 4))
+            try:
+                for name, fn in cases(stores, size, uuids, rng):
+                    if only and only not in name:
+                        continue
+                    result = {"name": name, "size": size, **measure(fn, min_time, min_ops, limit)}
+                    results.append(result)
+                    print(f"{name:<34} {size:>8} {result['ops_per_sec'] or 0:>12.1f} ops/s"
+                          f"  p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms")
+            finally:
+                app_module.storage, app_module.budget, app_module.todo_storage = saved
+                for store in stores:
+                    store.close()
+    return results
+
+
+def startup(backend: str, sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    """
+    冷启动：在新进程中导入 app 并发出首个请求，不使用 / 使用预热快照各运行 repeat 次取中位数
+
+    wall_ms 为整个子进程（含解释器启动与退出）的耗时。使用快照前先运行一次，
+    由其退出时保存快照。
+    """
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="fiscra-bench-") as tmp:
+            stores = open_stores(backend, Path(tmp))
+            populate(stores, size, random.Random(SEED + size))
+            for store in stores:
+                store.close()
+            for snapshot in ("0", "1"):
+                env = dict(os.environ, FISCRA_STORAGE_DIR=tmp, FISCRA_STORAGE_BACKEND=backend,
+                           FISCRA_WARM_SNAPSHOT=snapshot)
+                runs = []
+                for attempt in range(repeat + int(snapshot == "1")):
+                    started = time.perf_counter()
+                    output = subprocess.run(
+                        [sys.executable, "-c", STARTUP_SCRIPT], cwd=Path(__file__).resolve().parent,
+                        env=env, capture_output=True, text=True, check=True,
+                    ).stdout
+                    timings = json.loads(output.strip().splitlines()[-1])
+                    timings["wall_ms"] = (time.perf_counter() - started) * 1000
+                    runs.append(timings)
+                if snapshot == "1":
+                    runs = runs[1:]
+                name = "startup (warm snapshot)" if snapshot == "1" else "startup"
+                result = {"name": name, "size": size}
+                for key in ("import_ms", "first_request_ms", "wall_ms"):
+                    result[key] = round(statistics.median(run[key] for run in runs), 2)
+                results.append(result)
+                print(f"{name:<34} {size:>8}  import {result['import_ms']:>8.1f} ms"
+                      f"  first request {result['first_request_ms']:>8.1f} ms  wall {result['wall_ms']:>8.1f} ms")
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    """打印与基线结果的对比，返回回归项目数"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(item["name"], item["size"]): item for item in baseline["results"]}
+    regressions = 0
+    print(f"\n# compared with {baseline_path} (commit {baseline.get('commit')})")
+    for item in results:
+        old = previous.get((item["name"], item["size"]))
+        if not old or not old.get("ops_per_sec") or not item.get("ops_per_sec"):
+            continue
+        ratio = item["ops_per_sec"] / old["ops_per_sec"]
+        flag = ""
+        if ratio < 1 - threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{item['name']:<34} {item['size']:>8} {ratio:>7.2f}x{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark storage methods and API routes")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated row counts")
+    parser.add_argument("--backend", choices=["csv", "sqlite", "segment", "partitioned"], default="csv")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per benchmark")
+    parser.add_argument("--min-ops", type=int, default=3)
+    parser.add_argument("--max-ops", type=int, default=2000)
+    parser.add_argument("--only", help="run benchmarks whose name contains this string")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed ops/sec drop when comparing")
+    parser.add_argument("--startup", action="store_true", help="measure process start and first request instead")
+    parser.add_argument("--repeat", type=int, default=5, help="processes per startup measurement")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    if args.startup:
+        results = startup(args.backend, sizes, args.repeat)
+    else:
+        results = run(args.backend, sizes, args.min_time, args.min_ops, args.max_ops, args.only)
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+一次性迁移：将 storage/ 下的 data.csv、todo_data.csv、budget.json 导入其他存储后端
+
+用法（在项目根目录）：
+    python src/migrate.py [--to sqlite|segment] [--force]
+    python src/migrate.py --export ledger.csv
+
+--to sqlite（默认）导入 config.SQLITE_PATH；--to segment 只导入账本（storage/ledger.seg），
+预算与 TODO 仍使用 CSV / JSON。目标中已有数据时默认拒绝导入，--force 覆盖。
+导入完成后设置 FISCRA_STORAGE_BACKEND=<目标> 启用对应后端。
+--export 将当前后端（FISCRA_STORAGE_BACKEND）的账本导出为 data.csv 格式的 CSV。
+"""
+import argparse
+import csv
+import os
+import sys
+
+from apps.utils.backend import open_stores
+from apps.utils.config import SQLITE_PATH, STORAGE_BACKEND
+
+
+def migrate(force: bool = False, target: str = "sqlite") -> int:
+    ledger, budget, todo = open_stores("csv")
+    target_ledger, target_budget, target_todo = open_stores(target)
+    # segment 后端的预算与 TODO 就是 CSV / JSON 存储本身
+    targets = [target_ledger] if target == "segment" else [target_ledger, target_budget, target_todo]
+
+    if not force and any(store.version() for store in targets):
+        print(f"{target} storage already contains data, use --force to overwrite", file=sys.stderr)
+        return 1
+
+    ledger_rows = ledger.read_all()
+    target_ledger.write_all(ledger_rows)
+    print(f"ledger: {len(ledger_rows) - 1} rows")
+    if target == "segment":
+        print(f"-> {target_ledger.path}")
+        return 0
+
+    todo_rows = todo.read_all()
+    target_todo.write_all(todo_rows)
+    limits = budget.read_all()
+    target_budget.write_all(limits)
+
+    print(f"todo:   {len(todo_rows) - 1} rows")
+    print(f"budget: {len(limits)} months")
+    print(f"-> {SQLITE_PATH}")
+    return 0
+
+
+def export(path: str) -> int:
+    """将当前后端的账本导出为 CSV"""
+    ledger, _, _ = open_stores()
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(ledger.read_header())
+        for row in ledger.iter_rows():
+            writer.writerow(row)
+            count += 1
+    os.replace(tmp_path, path)
+    print(f"ledger ({STORAGE_BACKEND}): {count} rows -> {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import CSV / JSON storage into another backend")
+    parser.add_argument("--to", choices=["sqlite", "segment"], default="sqlite", help="target backend")
+    parser.add_argument("--force", action="store_true", help="overwrite existing data in the target")
+    parser.add_argument("--export", metavar="PATH", help="export the current backend's ledger to CSV instead")
+    args = parser.parse_args()
+    if args.export:
+        sys.exit(export(args.export))
+    sys.exit(migrate(args.force, args.to))
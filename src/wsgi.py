@@ -0,0 +1,11 @@
+"""
+WSGI 入口：多进程部署
+
+    gunicorn --chdir src -w 4 -b localhost:5000 wsgi:app
+
+各 worker 进程的缓存、id 序列与行偏移索引都以数据文件的 (mtime, size, inode, 版本号)
+校验，写入在跨进程的文件锁内完成，因此 worker 之间不会读到过期数据或分配重复 id。
+"""
+from app import app
+
+application = app